@@ -0,0 +1,59 @@
+"""
+Created on 18/10/2026
+@author: Aitor Gomez Goiri <aitor.gomez-goiri@open.ac.uk>
+Arrival profiles: when each container of a run is started.
+"""
+
+import random
+from models import ArrivalProfile
+
+
+BURST = 'burst'  # All the containers at once (default)
+FIXED_RATE = 'fixed'  # One container every 1/rate seconds
+WAVES = 'waves'  # wave_size containers every wave_interval seconds
+POISSON = 'poisson'  # Exponential intervals with mean 1/rate seconds
+
+
+def parse_arrival_profile(description):
+    """
+    Returns the (unsaved) arrival profile described.
+
+    Valid descriptions: 'burst', 'fixed:rate', 'waves:size,interval' and 'poisson:rate[,seed]'.
+    Rates are containers per second and intervals are seconds.
+    """
+    name, _, params = description.partition(':')
+    values = [float(v) for v in params.split(',')] if params else []
+    try:
+        if name == BURST:
+            return ArrivalProfile(kind=BURST)
+        elif name == FIXED_RATE and values[0] > 0:
+            return ArrivalProfile(kind=FIXED_RATE, rate=values[0])
+        elif name == WAVES and values[0] >= 1:
+            return ArrivalProfile(kind=WAVES, wave_size=int(values[0]), wave_interval=values[1])
+        elif name == POISSON and values[0] > 0:
+            # The seed is stored, so all the runs of the test share the same arrivals
+            seed = int(values[1]) if len(values) > 1 else random.randint(0, 2 ** 31)
+            return ArrivalProfile(kind=POISSON, rate=values[0], seed=seed)
+    except IndexError:
+        pass
+    raise ValueError('Invalid arrival profile "%s".' % description)
+
+def get_arrival_offsets(profile, number_of_containers):
+    """
+    Returns the seconds after the beginning of the run when each container is started
+    or None if they are all started at once.
+    """
+    if profile is None or profile.kind == BURST:
+        return None
+    if profile.kind == FIXED_RATE:
+        return [n / profile.rate for n in range(number_of_containers)]
+    if profile.kind == WAVES:
+        return [(n // profile.wave_size) * profile.wave_interval for n in range(number_of_containers)]
+    if profile.kind == POISSON:
+        generator = random.Random(profile.seed)
+        offsets, offset = [], 0.0
+        for _ in range(number_of_containers):
+            offsets.append(offset)
+            offset += generator.expovariate(profile.rate)
+        return offsets
+    raise ValueError('Unknown arrival profile "%s".' % profile.kind)
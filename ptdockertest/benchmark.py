@@ -7,13 +7,24 @@ Benchmark: run container, measure and close.
 import os
 import time
 import logging
+from datetime import datetime
+from collections import OrderedDict, deque
+from contextlib import contextmanager
 from requests.exceptions import Timeout
 from docker.errors import APIError
-from humanfriendly import Spinner
-from threading import Thread
+from humanfriendly import Spinner, format_size
+from threading import Thread, local
+from multiprocessing.pool import ThreadPool
 from threading3 import Barrier
-from measures import ResponseTimeMeter, DockerMeter
-from models import Container, CpuRequired, DiskRequired, MemoryRequired, ResponseTime, CreationTime, ExecutionError
+from docker_utils import create_container, wait_until_idle
+from measures import ResponseTimeMeter, ResponseTimeLoadMeter, DockerMeter, DockerStatsSampler, DiskUsageSampler, \
+                     RampSampler, HostSampler, SharedMemoryMeter, LatencyHistogram, DockerEventsListener, create_disk_accounting, \
+                     create_stats_collector, create_readiness_monitor
+from models import Container, CpuRequired, DiskRequired, MemoryRequired, ResponseTime, CreationTime, ExecutionError, CreationPhase, \
+                    StatsSummary, StatsSample, MeasuresRecorder, ResponseTimeDistribution, TeardownTime, ConcurrencyDecision, \
+                    ApiCall, RampSample, ContainerPlacement, Run, StartupTimeline, StartupDistribution, \
+                    ContainerLifecycle, HostSample, SharedMemory, KsmUsage
+from recovery import get_labels, find_adoptable, CREATED, STARTED, MEASURED, REMOVED
 
 
 class TestRun(object):
@@ -22,116 +33,559 @@ class TestRun(object):
     This includes things that are only checked once (e.g., response time for the last created container) and
     differences between before and after a run.
     """
-    def __init__(self, docker_factory, number_of_containers, image_id, volumes_from, ipc_port, checker_jar_path):
+    def __init__(self, docker_factory, number_of_containers, image_id, volumes_from, ipc_port, checker_jar_path,
+                 creation_workers=5, stream_stats=False, stats_series_points=60, defer_writes=False,
+                 container_pool=None, response_sample=1, response_duration=None, response_concurrency=10,
+                 teardown_workers=5, idle_latency=0.5, idle_timeout=300,
+                 disk_accounting='auto', compare_du=False, disk_sampling_interval=None, arrival_offsets=None,
+                 ramp_sampling_interval=1, stats_collector='docker', cgroup_root='/sys/fs/cgroup',
+                 cgroup_driver='cgroupfs', engine='threads', engine_workers=20, min_running_time=5,
+                 barriers=None, measure_response=True, checker_host='localhost',
+                 host_sampling_interval=None, proc_root='/proc', shared_memory=False, docker_events=False,
+                 readiness=None, readiness_marker=None, readiness_timeout=60):
         self.number_of_containers = number_of_containers
-        self._barriers = {
-            # Barrier which ensures that the creation of all containers starts
-            #(approximately) at the same moment.
-            # (it is probably unuseful as container creation takes no so much time)
-            'init': Barrier(number_of_containers + 1),  # Waiting thread
-            # No container will start before passing it
-            'before_save': Barrier(number_of_containers + 1),  # Waiting thread
-            # No container will be stopped before passing it
-            'end': Barrier(number_of_containers + 1),  # Response time measuring thread
-            'ready': Barrier (2),  # Response time measuring thread
-        };
+        if engine not in ENGINES:
+            raise ValueError('Unknown engine "%s". Valid values: %s.' % (engine, ', '.join(ENGINES)))
+        self.engine = engine
+        self.engine_workers = engine_workers
+        # If False, other run (sharing the barriers) measures the response time
+        self.measure_response = measure_response
+        # Seconds after the beginning of the run when each container is started (None to start them at once)
+        self.arrival_offsets = arrival_offsets
+        self.ramp_sampling_interval = ramp_sampling_interval
+        self.min_running_time = min_running_time
+        self.phase_times = OrderedDict()  # Wall time of each phase of the last run
+        self.disk_sampling_interval = disk_sampling_interval
+        self.host_sampling_interval = host_sampling_interval
+        self.proc_root = proc_root
+        self._host_sampler = None
+        self.teardown_workers = teardown_workers
+        self.idle_latency = idle_latency
+        self.idle_timeout = idle_timeout
+        # Containers whose response time is measured (the last created ones)
+        self.probed_containers = number_of_containers if response_sample is None else min(response_sample, number_of_containers)
+        if not measure_response:
+            self.probed_containers = 0
+        self.response_duration = response_duration
+        self._pool = container_pool
+        self.defer_writes = defer_writes
+        self.creation_workers = creation_workers
+        self.stream_stats = stream_stats
+        self.stats_series_points = stats_series_points
+        self.creation_elapsed = None
+        self.disk_size_increase = None
+        # How the moment when each container is ready is detected (see measures.create_readiness_monitor)
+        self.readiness = readiness
+        self.readiness_marker = readiness_marker
+        self.readiness_timeout = readiness_timeout
+        self._readiness = None
+        self.startup_histograms = None  # Latencies of each startup stage in the last run
+        self.docker_events = docker_events
+        self._events = None
+        self._barriers = barriers or create_barriers(number_of_containers, response_threads=int(measure_response))
         self.docker_factory = docker_factory
         self.allocate = self.docker_factory.create()
         self.image_id = image_id
         self._volumes_from = volumes_from
-        self._ipc_port = ipc_port
-        self._rmeter = ResponseTimeMeter(checker_jar_path, self._ipc_port)
-        self._dmeter = DockerMeter(self.allocate)
-
-    def _save_container(self, dao, container, run_id):
-        session = dao.get_session()
-        c = Container(docker_id=container.get('Id'), run_id=run_id)
-        session.add(c)
-        session.commit()
+        self._ipc_port = int(ipc_port)
+        if response_duration:
+            ipc_ports = [self._ipc_port + position for position in range(self.probed_containers)]
+            self._rmeter = ResponseTimeLoadMeter(checker_jar_path, ipc_ports, response_duration, response_concurrency,
+                                                 checker_host)
+        else:
+            self._rmeter = ResponseTimeMeter(checker_jar_path, self._ipc_port, checker_host)
+        self._shared_memory = SharedMemoryMeter(cgroup_root, cgroup_driver, proc_root) if shared_memory else None
+        self.ksm = None  # Usage of KSM in the last run (if it is enabled)
+        self._dmeter = DockerMeter(self.allocate, create_disk_accounting(disk_accounting, self.allocate), compare_du,
+                                   stats_collector=create_stats_collector(stats_collector, cgroup_root, cgroup_driver))
+        self._ramp_probe_port = None
+        if arrival_offsets and measure_response:
+            # The first container is probed while the rest arrive (it might be already probed)
+            self._ramp_probe_port = self._get_ipc_port(0)
+            if self._ramp_probe_port is None:
+                self._ramp_probe_port = self._ipc_port + self.probed_containers
+        self._checker_jar_path = checker_jar_path
+        self._checker_host = checker_host
+        self._host_id = None
+        self._db_run = None
+        self._adoptable = deque()  # Containers created (but not started) by a previous attempt of the run
+        self._recorder = None
+        self._thread_containers = None
+        self._started = None
+        # Each creation thread uses its own client
+        self._creation_clients = local()
+
+    def _allocate_creation_client(self):
+        if not hasattr(self._creation_clients, 'allocate'):
+            self._creation_clients.allocate = self.docker_factory.create()
+        return self._creation_clients.allocate
+
+    def _save_container(self, recorder, container, run_id):
+        c = Container(docker_id=container.get('Id'), run_id=run_id, phase=CREATED)
+        recorder.add(c)
+        if self._host_id:
+            recorder.add(ContainerPlacement(container=c, host_id=self._host_id))
         return c
 
-    def _start_container_and_measure(self, container_id, docker_id, docker_factory, ready_barrier):
-        container = RunningContainer(container_id, docker_id, docker_factory.create(), self._dmeter.get_container_meter(docker_id))
+    def _start_container_and_measure(self, db_container, docker_id, docker_factory, ready_barrier,
+                                     ipc_port=None, created_at=None, create_time=None):
+        sampler = DockerStatsSampler(docker_id, docker_factory.create_streaming()) if self.stream_stats else None
+        container = RunningContainer(db_container, docker_id, docker_factory.create(), self._dmeter.get_container_meter(docker_id),
+                                     sampler, self.stats_series_points, self._readiness,
+                                     (self._checker_host, ipc_port) if ipc_port else None, created_at, create_time,
+                                     self._shared_memory)
+        if self._events:
+            self._events.register(container)
+        if self.engine == PHASED_ENGINE:
+            # The phases are applied to all the containers by execute()
+            return None, container
         args = (self._barriers['before_save'], self._barriers['end'], ready_barrier)
         thread = start_daemon(target=container.run, args=args, begin_barrier=self._barriers['init'])
         return thread, container
 
-    def _run_container(self, last_container, dao, run_id):
+    def _get_ipc_port(self, n):
+        """Returns the host port bound to the IPC port of the n-th container or None if it is not probed."""
+        # The last container uses the exposed port and the previous ones the following ports
+        position = self.number_of_containers - 1 - n
+        if position < self.probed_containers:
+            return self._ipc_port + position
+        return self._ramp_probe_port if n == 0 else None
+
+    def _take_created_container(self):
+        """Returns a container created beforehand (by a previous attempt of the run or the pool) or None."""
+        try:
+            return self._adoptable.popleft()
+        except IndexError:
+            return self._pool.take() if self._pool is not None else None
+
+    def _run_container(self, last_container, ipc_port, recorder, run_id):
         # For Docker: run = create + start
-        volumes_from = [] if not self._volumes_from else [v for v in self._volumes_from.split(',')]
-        ports = { 39000: self._ipc_port, 5900: None } if last_container else {}
-        with self.allocate() as docker:
-            host_config = docker.create_host_config(port_bindings = ports, volumes_from=volumes_from)
-            container = docker.create_container(image = self.image_id,
-                                                ports = list(ports.keys()),
-                                                host_config = host_config)
-        db_cont = self._save_container(dao, container, run_id)
-        logging.info('Container "%s" created.' % db_cont.docker_id)
+        # The containers created beforehand do not have bound ports
+        container = self._take_created_container() if not ipc_port else None
+        created_at = create_time = None
+        if not container:
+            ports = { 39000: ipc_port } if ipc_port else {}
+            if last_container:
+                ports[5900] = None
+            create_start = time.time()
+            with self._allocate_creation_client()() as docker:
+                container = create_container(docker, self.image_id, self._volumes_from, ports,
+                                             get_labels(run_id, ports.keys()))
+            created_at = time.time()
+            create_time = created_at - create_start
+        db_cont = self._save_container(recorder, container, run_id)
+        docker_id = container.get('Id')
+        logging.info('Container "%s" created.' % docker_id)
         if container.get('Warnings'):
             logging.debug('Warnings on the creation: ' + container.get('Warnings'))
-        return self._start_container_and_measure( db_cont.id, db_cont.docker_id, self.docker_factory,
-                                                    self._barriers['ready'] if last_container else None )
+        return self._start_container_and_measure( db_cont, docker_id, self.docker_factory,
+                                                    self._barriers['ready'] if last_container else None,
+                                                    ipc_port, created_at, create_time )
+
+    def _create_container(self, n, recorder, run_id):
+        # n+1 is the last created container, we measure its response time
+        # to see if it takes more time for it to give a response as the scale increases.
+        last_container = self.measure_response and n+1==self.number_of_containers
+        return self._run_container(last_container, self._get_ipc_port(n), recorder, run_id)
+
+    def _create_containers(self, recorder, run_id):
+        """Creates and registers all the containers using a bounded number of threads."""
+        pool = ThreadPool(self.creation_workers)
+        start = time.time()
+        try:
+            # Array of tuples (thread, container) in creation order
+            thread_containers = pool.map(lambda n: self._create_container(n, recorder, run_id),
+                                         range(self.number_of_containers))
+        finally:
+            pool.close()
+            pool.join()
+        self.creation_elapsed = time.time() - start
+        logging.info('%d containers created in %.2f seconds using %d workers.' %
+                        (self.number_of_containers, self.creation_elapsed, self.creation_workers))
+        return thread_containers
+
+    def _adopt_containers(self, run_id):
+        """Takes the containers created by a previous (interrupted) attempt of the run which were never started."""
+        self._adoptable = deque(find_adoptable(self.allocate, run_id))
+        if self._adoptable:
+            logging.info('%d containers created by an interrupted attempt of the run will be reused.' % len(self._adoptable))
+
+    def _discard_unused_adoptable(self):
+        while self._adoptable:
+            docker_id = self._adoptable.popleft().get('Id')
+            with self.allocate() as docker:
+                docker.remove_container(docker_id, force=True)
+
+    def _checkpoint(self, recorder, phase, containers):
+        """The phase is stored with the rows pending, so it is not recorded if they are not written."""
+        if self._db_run:
+            self._db_run.phase = phase
+        for container in containers:
+            container.container.phase = phase
+        recorder.flush()
+
+    def _end_phase(self, phase, phase_start):
+        """Records the duration of a phase and returns when the next one starts."""
+        now = time.time()
+        self.phase_times[phase] = now - phase_start
+        if self._host_sampler:
+            # The previous parts of the execution are delimited by the barriers (see _mark_host_phase)
+            self._host_sampler.end_phase('stop' if phase == 'execution' else phase)
+        return now
+
+    def _mark_host_phase(self, phase):
+        if self._host_sampler:
+            self._host_sampler.end_phase(phase)
+
+    def _all_started(self):
+        """Called once all the containers have been started and have run for the minimum time."""
+        self._mark_host_phase('start')
+        if self._shared_memory:
+            # While all of them are running
+            self.ksm = self._shared_memory.get_ksm()
 
     def run(self, dao, run_id):
-        thread_containers = []  # Array of tuples (thread, container)
+        self.create(dao, run_id)
+        self.execute(run_id)
+
+    def create(self, dao, run_id, host_id=None):
+        """
+        Creates the containers of the run. Their threads wait for the 'init' barrier, which is opened in execute().
+
+        :param host_id: if provided, the containers are placed in this host and the measures of the whole run
+                        (e.g., disk) are left to the coordinator of the hosts.
+        """
+        self._started = started = time.time()
+        self._host_id = host_id
+        self.phase_times.clear()
+        self.ksm = None
+        self._host_sampler = None
+        if self.host_sampling_interval:
+            self._host_sampler = HostSampler(self.host_sampling_interval, self.proc_root)
+            self._host_sampler.start()
+        recorder = self._recorder = MeasuresRecorder(dao, defer=self.defer_writes)
+        if not host_id:
+            # Loaded in the session of this thread, which is the one used by the recorder.
+            # Otherwise, the coordinator of the hosts records the phase of the run.
+            self._db_run = dao.get_session().query(Run).get(run_id)
+        if self._pool is not None:
+            # Pooled containers must not be created while measuring
+            self._pool.wait()
+        if self.docker_factory.call_log is not None:
+            # Calls made before the run (e.g., removing the orphan containers) are not part of it
+            self.docker_factory.call_log.drain()
+        self._adopt_containers(run_id)
+        self._readiness = create_readiness_monitor(self.readiness, self.docker_factory, self.readiness_marker,
+                                                   self.readiness_timeout)
+        self._events = None
+        if self.docker_events:
+            # A single stream for all the containers of the run (opened before they are created)
+            self._events = DockerEventsListener(self.docker_factory.create_streaming())
+            self._events.start()
         self._record_init_disk_size()
-        for n in range(self.number_of_containers):
-            # n+1 is the last created container, we measure its response time
-            # to see if it takes more time for it to give a response as the scale increases.
-            last_container = n+1==self.number_of_containers
-            thread_containers.append( self._run_container(last_container, dao, run_id) )
-
-        start_daemon(self._rmeter.measure, args=(20,),
-                        begin_barrier=self._barriers['ready'],
-                        end_barrier=self._barriers['end'])
-        # It ensures that containers run for at least 5 seconds
-        start_daemon(target=wait_at_least, args=(5,),
-                        begin_barrier=self._barriers['init'],
-                        end_barrier=self._barriers['before_save'])
-
-        session = dao.get_session()
-        # Waits for the rest of the threads
-        for thread, container in thread_containers:
-            thread.join()
+        phase_start = self._end_phase('preparation', started)
+        self._thread_containers = self._create_containers(recorder, run_id)
+        self._discard_unused_adoptable()
+        # Containers registered
+        self._checkpoint(recorder, CREATED, [container for _, container in self._thread_containers])
+        self._end_phase('creation', phase_start)
+
+    def execute(self, run_id):
+        """Runs, measures and removes the containers created."""
+        started = self._started
+        recorder = self._recorder
+        thread_containers = self._thread_containers
+        phase_start = time.time()
+        containers = [container for _, container in thread_containers]
+        # Once started, the containers cannot be reused if the run is interrupted
+        self._checkpoint(recorder, STARTED, containers)
+        disk_sampler = None
+        if self.disk_sampling_interval:
+            disk_sampler = DiskUsageSampler(self._dmeter, self.disk_sampling_interval)
+            disk_sampler.start()
+        ramp_sampler = None
+        if self.arrival_offsets:
+            ramp_sampler = self._schedule_arrivals(containers)
+        if self._readiness:
+            self._readiness.start()
+        if self.engine == PHASED_ENGINE:
+            self._run_phases(containers)
+        else:
+            self._run_threads(thread_containers)
+        ready = {}
+        if self._readiness:
+            self._readiness.stop()
+            ready = self._readiness.ready
+
+        self._wait_samplers(containers)
+        for container in containers:
             if container.thrown_exception:
-                container.save_error(session)
+                container.save_error(recorder)
             else:
-                container.save_measures(session)
+                container.save_measures(recorder)
+            container.save_startup_timeline(recorder, ready.get(container.docker_id))
+        self.startup_histograms = get_startup_histograms(containers, ready if self._readiness else None)
+        if not self._host_id:
+            save_startup_distributions(recorder, run_id, self.startup_histograms, self.number_of_containers)
+        if ramp_sampler:
+            ramp_sampler.stop()
+            self._save_ramp(recorder, run_id, ramp_sampler)
+        if disk_sampler:
+            disk_sampler.stop()
+            self._save_disk_usage(recorder, disk_sampler, containers)
+        phase_start = self._end_phase('execution', phase_start)
 
         # while it is running a container consumes less disk
-        self._save(session, run_id)
+        self._save(recorder, run_id)
+        self._checkpoint(recorder, MEASURED, containers)  # Measures taken
+        phase_start = self._end_phase('saving', phase_start)
+
+        if self._pool is not None:
+            # Containers for the next run (the one with bound ports is always created)
+            self._pool.refill(self.number_of_containers - 1)
+        self._remove_containers(recorder, [container for _, container in thread_containers])
+        self._save_concurrency_decisions(recorder, run_id, started)
+        self._save_api_calls(recorder, run_id)
+        if self._host_sampler:
+            self._host_sampler.stop('teardown')
+            self._save_host_samples(recorder, run_id)
+        if self._db_run:
+            self._db_run.phase = REMOVED
+        for container in containers:
+            if container.remove_time is not None:
+                container.container.phase = REMOVED
+        recorder.flush(final=True)
+        self._end_phase('teardown', phase_start)
+        logging.info('%d rows saved in %d flushes (the database grew %s).' %
+                        (recorder.rows_written, recorder.flushes, format_size(recorder.database_growth)))
+
+    def _run_threads(self, thread_containers):
+        """Opens the barriers which the thread of each container is waiting for and waits for all of them."""
+        threads = [thread for thread, _ in thread_containers]
+        if self.measure_response:
+            threads.append(start_daemon(self._rmeter.measure, args=(20,),
+                            begin_barrier=self._barriers['ready'],
+                            end_barrier=self._barriers['end'],
+                            callback=lambda: self._mark_host_phase('measurement')))
+        # It ensures that containers run for at least some seconds
+        threads.append(start_daemon(target=self._wait_running_time,
+                        args=([container for _, container in thread_containers],),
+                        begin_barrier=self._barriers['init'],
+                        end_barrier=self._barriers['before_save'],
+                        callback=self._all_started))
+        # Waits for the rest of the threads (including their callbacks)
+        for thread in threads:
+            thread.join()
 
-        for _, container in thread_containers:
+    def _wait_samplers(self, containers, timeout=5):
+        """Waits for the stats streams of all the containers for at most the given seconds altogether."""
+        for container in containers:
+            container.stop_sampler()
+        deadline = time.time() + timeout
+        for container in containers:
+            container.wait_sampler(max(0, deadline - time.time()))
+
+    def _wait_running_time(self, containers):
+        """Waits for the minimum running time counting from the last scheduled start (if any)."""
+        scheduled = [container.scheduled_start for container in containers if container.scheduled_start]
+        if scheduled:
+            time.sleep(max(0, max(scheduled) - time.time()))
+        wait_at_least(self.min_running_time)
+
+    def _start_all(self, pool, containers):
+        if not self.arrival_offsets:
+            pool.map(lambda container: container.attempt(container.start), containers)
+            return
+        results = []
+        for container in sorted(containers, key=lambda container: container.scheduled_start):
+            time.sleep(max(0, container.scheduled_start - time.time()))
+            results.append(pool.apply_async(container.attempt, (container.start,)))
+        for result in results:
+            result.get()
+
+    def _run_phases(self, containers):
+        """
+        Instead of a thread per container, each phase is applied to all the containers using a fixed number of threads.
+        The phases keep the semantics of the barriers: no container is measured before all of them have been
+        started and the minimum running time has passed, and none is stopped before all of them (and the
+        response time) have been measured.
+        """
+        pool = ThreadPool(self.engine_workers)
+        try:
+            waiting = start_daemon(target=self._wait_running_time, args=(containers,))
+            self._start_all(pool, containers)
+            response = start_daemon(self._rmeter.measure, args=(20,)) if self.measure_response else None
+            waiting.join()
+            self._all_started()
+            pool.map(lambda container: container.attempt(container.take_measures), containers)
+            if response:
+                response.join()
+            self._mark_host_phase('measurement')
+            pool.map(lambda container: container.attempt(container.finish), containers)
+        finally:
+            pool.close()
+            pool.join()
+            for container in containers:
+                container.stop_sampler()
+
+    def discard(self):
+        """Removes the containers created without running them."""
+        for _, container in self._thread_containers:
             container.remove()
+        if self._events:
+            self._events.stop()
+        if self._host_sampler:
+            self._host_sampler.stop()
+
+    def _schedule_arrivals(self, containers):
+        """Sets when each container will be started and starts sampling the ramp."""
+        ramp_start = time.time()
+        for container, offset in zip(containers, self.arrival_offsets):
+            container.scheduled_start = ramp_start + offset
+        logging.info('%d containers will be started during %.2f seconds.' %
+                        (len(containers), max(self.arrival_offsets)))
+        rmeter = None
+        if self._checker_jar_path and self._ramp_probe_port:
+            rmeter = ResponseTimeMeter(self._checker_jar_path, self._ramp_probe_port, self._checker_host)
+        sampler = RampSampler(containers, self.ramp_sampling_interval, rmeter)
+        sampler.start(ramp_start)
+        return sampler
+
+    def _save_ramp(self, recorder, run_id, ramp_sampler):
+        for elapsed, running, startup_time, response_time in ramp_sampler.samples:
+            recorder.add(RampSample( run_id = run_id, elapsed = elapsed, running = running,
+                                     startup_time = startup_time, response_time = response_time ))
+
+    def _save_host_samples(self, recorder, run_id):
+        samples = self._host_sampler.get_samples()
+        for sample in samples:
+            recorder.add(HostSample(run_id=run_id, **sample))
+        logging.info('%d samples of the host resources taken (%d disks).' % (len(samples), len(self._host_sampler.disks)))
+
+    def _remove_containers(self, recorder, containers):
+        """Removes the containers using a bounded number of threads and waits until Docker is idle again."""
+        pool = ThreadPool(self.teardown_workers)
+        start = time.time()
+        try:
+            pool.map(lambda container: container.remove(), containers)
+        finally:
+            pool.close()
+            pool.join()
+        logging.info('%d containers removed in %.2f seconds using %d workers.' %
+                        (len(containers), time.time() - start, self.teardown_workers))
+        for container in containers:
+            container.save_teardown_time(recorder)
+        # Otherwise, the next run would compete with the removals still in progress
+        waited = wait_until_idle(self.allocate, [container.docker_id for container in containers],
+                                 self.idle_latency, self.idle_timeout)
+        logging.info('Docker was idle after %.2f seconds.' % waited)
+        if self._events:
+            # The containers are no longer listed, so their 'destroy' events have been sent (but maybe not read yet)
+            removed = [container.docker_id for container in containers if container.remove_time is not None]
+            if not self._events.wait_destroyed(removed):
+                logging.warning('Not all the events of the removed containers were received from Docker.')
+            self._events.stop()
+            for container in containers:
+                container.save_lifecycle(recorder)
+            oom_killed = len([container for container in containers if container.oom_killed])
+            if oom_killed:
+                logging.warning('%d containers ran out of memory.' % oom_killed)
 
     def _record_init_disk_size(self):
         self._dmeter.record_init_disk_size()
 
-    def _save_disk_size(self, session, run_id, size):
+    def _save_disk_usage(self, recorder, disk_sampler, containers):
+        for container in containers:
+            if container.docker_id in disk_sampler.series:
+                save_series(recorder, container.container, 'disk', disk_sampler.series[container.docker_id],
+                            self.stats_series_points)
+
+    def _save_disk_size(self, recorder, run_id, size):
         d = DiskRequired(run_id=run_id, size=size)
-        session.add(d)
-        session.commit()
+        recorder.add(d)
 
-    def _save_response_time(self, session, run_id, response_time):
+    def _save_response_time(self, recorder, run_id, response_time):
         s = ResponseTime(run_id=run_id, time=response_time)
-        session.add(s)
-        session.commit()
-
-    def _save(self, session, run_id):
-        self._save_disk_size(session, run_id, self._dmeter.get_disk_size_increase())
-        self._save_response_time(session, run_id, self._rmeter.response_time)
+        recorder.add(s)
+
+    def _save_response_distribution(self, recorder, run_id):
+        histogram = self._rmeter.histogram
+        r = ResponseTimeDistribution( run_id = run_id, containers = self.probed_containers,
+                                      samples = histogram.total, errors = self._rmeter.errors,
+                                      minimum = histogram.minimum, mean = histogram.mean(),
+                                      p50 = histogram.percentile(50), p90 = histogram.percentile(90),
+                                      p99 = histogram.percentile(99), p999 = histogram.percentile(99.9),
+                                      maximum = histogram.maximum )
+        recorder.add(r)
+
+    def _save_concurrency_decisions(self, recorder, run_id, since):
+        decisions = self.docker_factory.limiter.get_decisions(since)
+        for timestamp, limit, latency, reason in decisions:
+            recorder.add(ConcurrencyDecision( run_id = run_id, timestamp = datetime.fromtimestamp(timestamp),
+                                              limit = limit, latency = latency, reason = reason ))
+        logging.info('Simultaneous Docker requests changed %d times (current limit: %d).' %
+                        (len(decisions), self.docker_factory.limiter.limit))
+
+    def _save_api_calls(self, recorder, run_id):
+        if self.docker_factory.call_log is None:
+            return
+        calls = self.docker_factory.call_log.drain()
+        for operation, started, wait, duration, outcome in calls:
+            recorder.add(ApiCall( run_id = run_id, operation = operation, started = datetime.fromtimestamp(started),
+                                  wait = wait, duration = duration, outcome = outcome ))
+        if calls:
+            logging.info('%d Docker API calls: %.2f seconds waiting and %.2f seconds in Docker.' %
+                            (len(calls), sum(c[2] for c in calls), sum(c[3] for c in calls)))
+
+    def _save_creation_phase(self, recorder, run_id):
+        c = CreationPhase(run_id=run_id, elapsed=self.creation_elapsed, workers=self.creation_workers)
+        recorder.add(c)
+
+    def _save_ksm_usage(self, recorder, run_id):
+        recorder.add(KsmUsage(run_id=run_id, **self.ksm))
+        logging.info('KSM saved %s.' % format_size(self.ksm['saved']))
+
+    def _save(self, recorder, run_id):
+        self.disk_size_increase = self._dmeter.get_disk_size_increase()
+        if not self._host_id:
+            self._save_disk_size(recorder, run_id, self.disk_size_increase)
+            self._save_creation_phase(recorder, run_id)
+        if self.ksm:
+            self._save_ksm_usage(recorder, run_id)
+        if self.measure_response:
+            self._save_response_time(recorder, run_id, self._rmeter.response_time)
+            if self.response_duration:
+                self._save_response_distribution(recorder, run_id)
 
 
 class RunningContainer(object):
     """
     It starts a container, takes measures and saves them.
     """
-    def __init__(self, container_id, container_docker_id, docker_client, container_meter):
-        self.id = container_id
+    def __init__(self, db_container, container_docker_id, docker_client, container_meter,
+                 stats_sampler=None, stats_series_points=60, readiness_monitor=None, ipc_address=None,
+                 created_at=None, create_time=None, shared_memory_meter=None):
+        self.container = db_container  # Container model (it might not have been written yet)
         self.docker_id = container_docker_id
         self.allocate = docker_client
         self._meter = container_meter
+        self._sampler = stats_sampler
+        self._series_points = stats_series_points
         self.thrown_exception = None
+        self.stop_time = None  # In seconds
+        self.remove_time = None  # In seconds
+        self.scheduled_start = None  # Timestamp when it should be started (as soon as possible if None)
+        self.created_at = created_at  # Timestamp when it was created (None if it was created beforehand)
+        self.create_time = create_time  # In seconds
+        self.started_at = None  # Timestamp when it was started
+        self.elapsed = None  # Seconds taken by the start API call
+        self.daemon_events = {}  # Timestamp of the first event of each type sent by Docker
+        self.exit_code = None
+        self.oom_killed = False
+        self.ipc_address = ipc_address  # Host and port bound to its IPC port (if any)
+        self._readiness = readiness_monitor
+        self._shared_memory = shared_memory_meter
+        self.shared_memory = None  # Memory of its processes (see SharedMemoryMeter.measure)
 
     def start(self):
         start = time.time()
@@ -140,109 +594,268 @@ class RunningContainer(object):
         logging.info('Running container "%s".\n\t%s' % (self.docker_id, response))
         # naive measure
         self.elapsed = time.time() - start
+        self.started_at = time.time()
+        if self._readiness:
+            self._watch_readiness()
+        if self._sampler:
+            self._sampler.start()
         self._meter.initial_measure()
 
+    def _watch_readiness(self):
+        try:
+            self._readiness.watch(self)
+        except Exception as e:
+            # It is not an error of the container
+            logging.error('The readiness of container "%s" cannot be detected: %s.' % (self.docker_id, e))
+
     def take_measures(self):
         logging.info('Measuring container "%s".' % self.docker_id)
         self._meter.final_measure()
+        if self._shared_memory:
+            self._measure_shared_memory()
 
-    def _save_cpu(self, session):
-        c = CpuRequired( container_id = self.id,
+    def _measure_shared_memory(self):
+        try:
+            self.shared_memory = self._shared_memory.measure(self.docker_id)
+        except IOError as e:
+            # The rest of the measures are still valid
+            logging.error('Shared memory of container "%s" not measured: %s.' % (self.docker_id, e))
+
+    def _save_cpu(self, recorder):
+        c = CpuRequired( container = self.container,
                          total_cpu = self._meter.get_cpu_total(),
                          percentual_cpu = self._meter.get_cpu_percent() )
-        session.add(c)
+        recorder.add(c)
 
-    def _save_memory(self, session):
-        m = MemoryRequired( container_id = self.id,
+    def _save_memory(self, recorder):
+        m = MemoryRequired( container = self.container,
                             usage = self._meter.get_memory_usage(),
                             percentual = self._meter.get_memory_percent(),
                             maximum = self._meter.get_memory_maximum() )
-        session.add(m)
+        recorder.add(m)
 
-    def _save_start_time(self, session):
-        c = CreationTime(container_id=self.id, startup_time=self.elapsed)
-        session.add(c)
+    def _save_start_time(self, recorder):
+        c = CreationTime(container=self.container, startup_time=self.elapsed)
+        recorder.add(c)
 
-    def save_measures(self, session):
-        logging.info('Saving container "%s" measures.' % self.docker_id)
-        self._save_cpu(session)
-        self._save_memory(session)
-        self._save_start_time(session)
-        session.commit()
+    def _save_stats_series(self, recorder):
+        # See TestRun._wait_samplers
+        for metric, series in self._sampler.series.items():
+            save_series(recorder, self.container, metric, series, self._series_points)
 
-    def save_error(self, session):
+    def save_measures(self, recorder):
+        logging.info('Saving container "%s" measures.' % self.docker_id)
+        self._save_cpu(recorder)
+        self._save_memory(recorder)
+        self._save_start_time(recorder)
+        if self.shared_memory:
+            recorder.add(SharedMemory(container=self.container, **self.shared_memory))
+        if self._sampler:
+            self._save_stats_series(recorder)
+
+    def record_event(self, action, timestamp, attributes):
+        """Called from the thread of the events listener with each lifecycle event of the container in Docker."""
+        self.daemon_events.setdefault(action, timestamp)
+        if action == 'oom':
+            self.oom_killed = True
+        elif action == 'die' and 'exitCode' in attributes:
+            self.exit_code = int(attributes['exitCode'])
+
+    def save_lifecycle(self, recorder):
+        l = ContainerLifecycle( container = self.container,
+                                created = to_datetime(self.daemon_events.get('create')),
+                                started = to_datetime(self.daemon_events.get('start')),
+                                died = to_datetime(self.daemon_events.get('die')),
+                                destroyed = to_datetime(self.daemon_events.get('destroy')),
+                                exit_code = self.exit_code, oom_killed = self.oom_killed )
+        recorder.add(l)
+
+    def save_startup_timeline(self, recorder, ready_at=None):
+        """:param ready_at: timestamp when it was ready (None if it was not detected)."""
+        t = StartupTimeline( container = self.container,
+                             created = to_datetime(self.created_at), create_time = self.create_time,
+                             started = to_datetime(self.started_at), start_time = self.elapsed,
+                             ready = to_datetime(ready_at),
+                             time_to_ready = ready_at - self.started_at if ready_at and self.started_at else None )
+        recorder.add(t)
+
+    def save_error(self, recorder):
         logging.info('Saving errors in container "%s".' % self.docker_id)
-        e = ExecutionError(container_id=self.id, message=self.thrown_exception)
-        session.add(e)
-        session.commit()
+        e = ExecutionError(container=self.container, message=self.thrown_exception)
+        recorder.add(e)
+
+    def save_teardown_time(self, recorder):
+        t = TeardownTime(container=self.container, stop_time=self.stop_time, remove_time=self.remove_time)
+        recorder.add(t)
 
     def stop(self):
+        start = time.time()
         with self.allocate() as docker:
             docker.stop(self.docker_id)
+        self.stop_time = time.time() - start
         logging.info('Stopping container "%s".' % (self.docker_id))
 
     def remove(self):  # Clear dist
-        # Force just in case stop hadn't be called properly due to an exception
-        with self.allocate() as docker:
-            docker.remove_container(self.docker_id, force=True)
-        logging.info('Removing container "%s".' % (self.docker_id))
+        start = time.time()
+        try:
+            # Force just in case stop hadn't be called properly due to an exception
+            with self.allocate() as docker:
+                docker.remove_container(self.docker_id, force=True)
+            self.remove_time = time.time() - start
+            logging.info('Removing container "%s".' % (self.docker_id))
+        except (Timeout, APIError) as e:
+            logging.error('Container "%s" could not be removed: %s.' % (self.docker_id, e))
 
     def _wait(self, barrier, waiting_list):
         barrier.wait()
         waiting_list.remove(barrier)
 
-    """
-    Run container, measure it and close it.
+    def stop_sampler(self):
+        if self._sampler:
+            self._sampler.stop()
 
-    :param dao: benchmarking data access object
-    :param all_started_barrier: Barrier which ensures that all containers are running
-                            (i.e., they are all compiting for computing resources)
-                            when their performance is measured.
-    :param end_barrier: Barrier which ensures that no container is stopped
-                            before all the measurements have been taken.
-    """
-    def run(self, all_started_barrier, end_barrier, ready_barrier=None):
-        to_wait = [all_started_barrier, end_barrier]
-        if ready_barrier: to_wait.insert(0, ready_barrier)  # The order is important here
+    def wait_sampler(self, timeout):
+        if self._sampler:
+            self._sampler.wait(timeout)
+
+    def finish(self):
+        self.stop_sampler()
+        self.stop()
+
+    @contextmanager
+    def _recording_errors(self):
+        """Records the errors thrown by the steps run within it."""
         try:
-            self.start()
-            # Preference over other barriers to ensure that the response time measure thread starts first
-            if ready_barrier:
-                self._wait(ready_barrier, to_wait)
-            self._wait(all_started_barrier, to_wait)
-            self.take_measures()
-            self._wait(end_barrier, to_wait)
-            self.stop()
+            yield
         except Timeout as e:
             logging.error('Docker timeout: %s.' % e.message)
             self.thrown_exception = 'Docker client timeout'
         except APIError as ae:
             logging.error('Docker API exception. %s.' % ae)
             self.thrown_exception = str(ae)
+        except EnvironmentError as ee:
+            # E.g., the cgroup of the container could not be read
+            logging.error('Measures could not be taken: %s.' % ee)
+            self.thrown_exception = str(ee)
         except Exception as others:
             logging.error('Unexpected exception: %s.' % others)
             print 'Prepare yourself because everything will crash now.'
             import sys, traceback
             exc_type, exc_value, exc_traceback = sys.exc_info()
             traceback.print_exception(exc_type, exc_value, exc_traceback, limit=2, file=sys.stdout)
+
+    def attempt(self, step):
+        """Runs a step (e.g., start) unless a previous one failed. Used when the container has no thread."""
+        if not self.thrown_exception:
+            with self._recording_errors():
+                step()
+
+    """
+    Run container, measure it and close it.
+
+    :param dao: benchmarking data access object
+    :param all_started_barrier: Barrier which ensures that all containers are running
+                            (i.e., they are all compiting for computing resources)
+                            when their performance is measured.
+    :param end_barrier: Barrier which ensures that no container is stopped
+                            before all the measurements have been taken.
+    """
+    def run(self, all_started_barrier, end_barrier, ready_barrier=None):
+        to_wait = [all_started_barrier, end_barrier]
+        if ready_barrier: to_wait.insert(0, ready_barrier)  # The order is important here
+        try:
+            with self._recording_errors():
+                if self.scheduled_start:
+                    time.sleep(max(0, self.scheduled_start - time.time()))
+                self.start()
+                # Preference over other barriers to ensure that the response time measure thread starts first
+                if ready_barrier:
+                    self._wait(ready_barrier, to_wait)
+                self._wait(all_started_barrier, to_wait)
+                self.take_measures()
+                self._wait(end_barrier, to_wait)
+                self.finish()
         finally:
             # Other threads might be still waiting for this barriers to be opened:
             for w in to_wait: w.wait()
+            self.stop_sampler()
+
+
+THREADS_ENGINE = 'threads'  # A thread per container synchronised with barriers
+PHASED_ENGINE = 'phased'  # A fixed number of threads applying each phase to all the containers
+ENGINES = (THREADS_ENGINE, PHASED_ENGINE)
 
+def create_barriers(number_of_containers, waiting_threads=1, response_threads=1):
+    """
+    :param waiting_threads: threads which ensure that the containers run for at least some seconds
+                            (one per run sharing the barriers).
+    :param response_threads: threads which measure the response time (none if it is not measured).
+    """
+    return {
+        # Barrier which ensures that the creation of all containers starts
+        #(approximately) at the same moment.
+        # (it is probably unuseful as container creation takes no so much time)
+        'init': Barrier(number_of_containers + waiting_threads),  # Waiting thread
+        # No container will start before passing it
+        'before_save': Barrier(number_of_containers + waiting_threads),  # Waiting thread
+        # No container will be stopped before passing it
+        'end': Barrier(number_of_containers + response_threads),  # Response time measuring thread
+        'ready': Barrier (2),  # Response time measuring thread
+    }
+
+STARTUP_STAGES = ('create', 'start', 'ready')
+
+def get_startup_histograms(containers, ready=None):
+    """
+    Returns the latencies (in ms) of each startup stage of the containers.
+    :param ready: timestamp when each container (by Docker ID) was ready or None if it was not detected.
+    """
+    histograms = OrderedDict((stage, LatencyHistogram()) for stage in STARTUP_STAGES)
+    if ready is None:
+        del histograms['ready']
+    for container in containers:
+        ready_at = ready.get(container.docker_id) if ready else None
+        latencies = { 'create': container.create_time, 'start': container.elapsed,
+                      'ready': ready_at - container.started_at if ready_at and container.started_at else None }
+        for stage, histogram in histograms.items():
+            if latencies[stage] is not None:
+                histogram.record(latencies[stage] * 1000)
+    return histograms
+
+def save_startup_distributions(recorder, run_id, histograms, number_of_containers):
+    for stage, histogram in histograms.items():
+        recorder.add(StartupDistribution( run_id = run_id, stage = stage, samples = histogram.total,
+                                          missing = number_of_containers - histogram.total,
+                                          minimum = histogram.minimum, mean = histogram.mean(),
+                                          p50 = histogram.percentile(50), p90 = histogram.percentile(90),
+                                          p99 = histogram.percentile(99), maximum = histogram.maximum ))
+
+def to_datetime(timestamp):
+    return datetime.fromtimestamp(timestamp) if timestamp else None
+
+def save_series(recorder, db_container, metric, series, points):
+    """Saves the summary and a downsampled version of a container's time series."""
+    p50, p95, p99 = series.percentiles((50, 95, 99))
+    recorder.add(StatsSummary( container = db_container, metric = metric, samples = series.samples,
+                               minimum = series.minimum, maximum = series.maximum,
+                               p50 = p50, p95 = p95, p99 = p99 ))
+    for elapsed, value in series.downsample(points):
+        recorder.add(StatsSample(container=db_container, metric=metric, elapsed=elapsed, value=value))
 
 def wait_at_least(seconds):
-    with Spinner(label="Waiting", total=5) as spinner:
+    with Spinner(label="Waiting", total=seconds) as spinner:
         for progress in range(1, seconds + 1):  # Update each second
             spinner.step(progress)
             time.sleep(1)
 
-def run_with_barrier(target, args, begin_barrier, end_barrier):
+def run_with_barrier(target, args, begin_barrier, end_barrier, callback=None):
     if begin_barrier: begin_barrier.wait()
     target(*args)
     if end_barrier: end_barrier.wait()
+    if callback: callback()  # Once the end barrier has been passed
 
-def start_daemon(target, args, begin_barrier=None, end_barrier=None):
-    t = Thread(target=run_with_barrier, args=(target, args, begin_barrier, end_barrier))
+def start_daemon(target, args, begin_barrier=None, end_barrier=None, callback=None):
+    t = Thread(target=run_with_barrier, args=(target, args, begin_barrier, end_barrier, callback))
     t.daemon = True
     t.start()
     return t
@@ -0,0 +1,176 @@
+"""
+Created on 18/10/2026
+@author: Aitor Gomez Goiri <aitor.gomez-goiri@open.ac.uk>
+Script to measure the resources used by the harness itself.
+
+Each size is run in its own process against a simulated Docker daemon (which runs in another process),
+so the CPU time, peak memory and threads reported only belong to the harness.
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import logging
+import resource
+import tempfile
+import threading
+from argparse import ArgumentParser
+from collections import OrderedDict
+from multiprocessing import Process, Queue
+from docker_utils import DockerClientFactory
+from fake_docker import FakeDocker, FakeDockerServer, parse_operation_values
+from models import PerformanceTestDAO, Test, Run
+from benchmark import TestRun, ENGINES
+
+
+DEFAULT_SIZES = (1, 10, 100, 600, 2000)
+
+
+class ThreadCounter(object):
+    """It samples the number of threads of this process to find its peak."""
+
+    def __init__(self, interval=0.05):
+        self.peak = threading.active_count()
+        self._interval = interval
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def _sample(self):
+        while not self._stopped.wait(self._interval):
+            self.peak = max(self.peak, threading.active_count())
+
+    def start(self):
+        self._thread = threading.Thread(target=self._sample)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        self._thread.join()
+
+
+def get_rss():
+    """Returns the resident memory of this process in KB."""
+    with open('/proc/self/status') as status:
+        for line in status:
+            if line.startswith('VmRSS:'):
+                return int(line.split()[1])
+
+def measure_run(docker_url, number_of_containers, database_path, options):
+    """Runs a test with the given number of containers and returns the resources used by the harness."""
+    dao = PerformanceTestDAO(database_path)
+    session = dao.get_session()
+    test = Test(image_id='fake', number_of_containers=number_of_containers, repetitions=1)
+    session.add(test)
+    session.commit()
+    run = Run(test_id=test.id)
+    session.add(run)
+    session.commit()
+
+    docker_factory = DockerClientFactory(docker_url)
+    test_run = TestRun(docker_factory, number_of_containers, 'fake', None, options.ipc_port, None,
+                       creation_workers=options.creation_workers, stream_stats=options.stream_stats,
+                       engine=options.engine, engine_workers=options.engine_workers,
+                       min_running_time=options.min_running_time)
+    counter = ThreadCounter()
+    counter.start()
+    baseline_rss = get_rss()
+    before = resource.getrusage(resource.RUSAGE_SELF)
+    start = time.time()
+    test_run.run(dao, run.id)
+    wall_time = time.time() - start
+    after = resource.getrusage(resource.RUSAGE_SELF)
+    counter.stop()
+
+    cpu_time = (after.ru_utime - before.ru_utime) + (after.ru_stime - before.ru_stime)
+    return OrderedDict((
+        ('containers', number_of_containers),
+        ('wall_time', wall_time),
+        ('cpu_user', after.ru_utime - before.ru_utime),
+        ('cpu_system', after.ru_stime - before.ru_stime),
+        ('cpu_time_per_container', cpu_time / number_of_containers),
+        ('baseline_rss_kb', baseline_rss),
+        ('peak_rss_kb', after.ru_maxrss),
+        ('peak_threads', counter.peak),
+        ('context_switches', (after.ru_nvcsw - before.ru_nvcsw) + (after.ru_nivcsw - before.ru_nivcsw)),
+        ('phases', test_run.phase_times),
+    ))
+
+def _measure_in_process(queue, docker_url, number_of_containers, database_path, options):
+    try:
+        queue.put(measure_run(docker_url, number_of_containers, database_path, options))
+    except Exception as e:
+        logging.exception('Harness benchmark with %d containers failed.' % number_of_containers)
+        queue.put(OrderedDict((('containers', number_of_containers), ('error', str(e)))))
+
+def _serve_fake_docker(socket_path, latencies, failure_rates):
+    FakeDockerServer(socket_path, FakeDocker(latencies, failure_rates)).serve_forever()
+
+def _wait_for_socket(socket_path, timeout=10):
+    start = time.time()
+    while not os.path.exists(socket_path):
+        if time.time() - start > timeout:
+            raise IOError('The simulated Docker did not start.')
+        time.sleep(0.1)
+
+def main(sizes, options):
+    working_dir = tempfile.mkdtemp(prefix='harness-benchmark-')
+    socket_path = os.path.join(working_dir, 'docker.sock')
+    daemon = Process(target=_serve_fake_docker, args=(socket_path, options.latencies, options.failure_rates))
+    daemon.daemon = True
+    daemon.start()
+    results = []
+    try:
+        _wait_for_socket(socket_path)
+        for number_of_containers in sizes:
+            logging.info('Measuring the harness with %d containers.' % number_of_containers)
+            queue = Queue()
+            database_path = os.path.join(working_dir, 'benchmark-%d.db' % number_of_containers)
+            p = Process(target=_measure_in_process,
+                        args=(queue, 'unix://' + socket_path, number_of_containers, database_path, options))
+            p.start()
+            results.append(queue.get())
+            p.join()
+    finally:
+        daemon.terminate()
+        shutil.rmtree(working_dir, ignore_errors=True)
+    return results
+
+def entry_point():
+    parser = ArgumentParser(description='Measure the overhead of the harness using a simulated Docker.')
+    parser.add_argument('-sizes', default=','.join(str(s) for s in DEFAULT_SIZES), dest='sizes',
+                            help='Comma separated numbers of containers to run.')
+    parser.add_argument('-output', dest='output', help='JSON file where the results will be saved (stdout by default).')
+    parser.add_argument('-log', default='/tmp/harness-benchmark.log', dest='log', help='Log file.')
+    parser.add_argument('-workers', default=5, type=int, dest='creation_workers', help='Containers created simultaneously.')
+    parser.add_argument('-engine', default='threads', choices=ENGINES, dest='engine',
+                            help='Engine which runs the containers.')
+    parser.add_argument('-engine-workers', default=20, type=int, dest='engine_workers',
+                            help='Threads used by the phased engine.')
+    parser.add_argument('-stream-stats', action='store_true', dest='stream_stats', help='Stream the stats of each container.')
+    parser.add_argument('-min-running-time', default=1, type=int, dest='min_running_time',
+                            help='Seconds that the containers run at least.')
+    parser.add_argument('-ipc-port', default=39999, type=int, dest='ipc_port', help='Port exposed by the measured container.')
+    parser.add_argument('-latency', action='append', dest='latencies', metavar='OPERATION=DISTRIBUTION',
+                            help='Latency of an operation of the simulated Docker (e.g., create=lognormal:0.05,0.5).')
+    parser.add_argument('-failure', action='append', dest='failures', metavar='OPERATION=RATE',
+                            help='Probability of failure of an operation of the simulated Docker (e.g., start=0.01).')
+    args = parser.parse_args()
+    args.latencies = parse_operation_values(args.latencies, lambda d: d)
+    args.failure_rates = parse_operation_values(args.failures, float)
+
+    FORMAT = '%(asctime)-15s %(message)s'
+    logging.basicConfig(filename=args.log, level=logging.INFO, format=FORMAT)
+
+    results = main([int(s) for s in args.sizes.split(',')], args)
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump(results, output, indent=2)
+    else:
+        json.dump(results, sys.stdout, indent=2)
+
+
+if __name__ == "__main__":
+    entry_point()
@@ -0,0 +1,130 @@
+"""
+Created on 18/10/2026
+@author: Aitor Gomez Goiri <aitor.gomez-goiri@open.ac.uk>
+Confidence intervals of the measures of a test and the sequential stopping rule which uses them
+to decide how many runs a test needs.
+"""
+
+import math
+import logging
+import numpy
+from models import AggregatedMeasures, RunAggregate, ConfidenceInterval
+
+
+# Fields of the aggregates of the runs which can be used as metrics
+METRICS = tuple(column.name for column in RunAggregate.__table__.columns if hasattr(AggregatedMeasures, column.name))
+
+
+def normal_quantile(p):
+    """Inverse of the standard normal CDF (Acklam's rational approximation, relative error below 1.2e-9)."""
+    a = (-3.969683028665376e+01, 2.209460984245205e+02, -2.759285104469687e+02,
+         1.383577518672690e+02, -3.066479806614716e+01, 2.506628277459239e+00)
+    b = (-5.447609879822406e+01, 1.615858368580409e+02, -1.556989798598866e+02,
+         6.680131188771972e+01, -1.328068155288572e+01)
+    c = (-7.784894002430293e-03, -3.223964580411365e-01, -2.400758277161838e+00,
+         -2.549732539343734e+00, 4.374664141464968e+00, 2.938163982698783e+00)
+    d = (7.784695709041462e-03, 3.224671290700398e-01, 2.445134137142996e+00, 3.754408661907416e+00)
+    if p < 0.02425:
+        q = math.sqrt(-2 * math.log(p))
+        return (((((c[0] * q + c[1]) * q + c[2]) * q + c[3]) * q + c[4]) * q + c[5]) / \
+               ((((d[0] * q + d[1]) * q + d[2]) * q + d[3]) * q + 1)
+    if p > 1 - 0.02425:
+        return -normal_quantile(1 - p)
+    q = p - 0.5
+    r = q * q
+    return (((((a[0] * r + a[1]) * r + a[2]) * r + a[3]) * r + a[4]) * r + a[5]) * q / \
+           (((((b[0] * r + b[1]) * r + b[2]) * r + b[3]) * r + b[4]) * r + 1)
+
+def t_quantile(p, degrees_of_freedom):
+    """
+    Inverse of Student's t CDF.
+    It is exact for 1 and 2 degrees of freedom and uses a Cornish-Fisher expansion for the rest
+    (e.g., 3.179 instead of 3.182 for the 97.5% with 3 degrees of freedom).
+    """
+    if degrees_of_freedom == 1:
+        return math.tan(math.pi * (p - 0.5))
+    if degrees_of_freedom == 2:
+        return (2 * p - 1) / math.sqrt(2 * p * (1 - p))
+    z = normal_quantile(p)
+    g1 = (z ** 3 + z) / 4
+    g2 = (5 * z ** 5 + 16 * z ** 3 + 3 * z) / 96
+    g3 = (3 * z ** 7 + 19 * z ** 5 + 17 * z ** 3 - 15 * z) / 384
+    g4 = (79 * z ** 9 + 776 * z ** 7 + 1482 * z ** 5 - 1920 * z ** 3 - 945 * z) / 92160
+    df = float(degrees_of_freedom)
+    return z + g1 / df + g2 / df ** 2 + g3 / df ** 3 + g4 / df ** 4
+
+def confidence_interval(values, confidence=0.95):
+    """
+    Returns the mean of the values and the lower and upper bounds of its confidence interval.
+    NaN values are ignored. The bounds are NaN if there are less than two values.
+    """
+    values = numpy.asarray(values, dtype=numpy.float64)
+    values = values[~numpy.isnan(values)]
+    if not len(values):
+        return numpy.nan, numpy.nan, numpy.nan
+    mean = values.mean()
+    if len(values) < 2:
+        return mean, numpy.nan, numpy.nan
+    half_width = t_quantile((1 + confidence) / 2.0, len(values) - 1) * values.std(ddof=1) / math.sqrt(len(values))
+    return mean, mean - half_width, mean + half_width
+
+def relative_width(mean, lower, upper):
+    """Width of the interval relative to the mean (NaN if it cannot be calculated)."""
+    width = upper - lower
+    if numpy.isnan(width):
+        return numpy.nan
+    if mean == 0:
+        return 0.0 if width == 0 else numpy.inf
+    return width / abs(mean)
+
+
+class SequentialStoppingRule(object):
+    """
+    It decides whether a test needs more runs.
+
+    A test needs more runs while it has less than the minimum or while the confidence interval of any
+    of the metrics is wider than the target (relative to its mean), unless it reached the maximum.
+    The metrics are the fields of the aggregates of the runs (see generate_plots.py).
+    Metrics without values in any run (e.g., response times which were not measured) are ignored.
+    """
+    def __init__(self, metrics, target_width, minimum=3, maximum=20, confidence=0.95):
+        unknown = [metric for metric in metrics if metric not in METRICS]
+        if unknown:
+            raise ValueError('Unknown confidence metrics: %s. Valid values: %s.' % (', '.join(unknown), ', '.join(METRICS)))
+        self.metrics = metrics
+        self.target_width = target_width
+        self.minimum = minimum
+        self.maximum = maximum
+        self.confidence = confidence
+
+    def update_intervals(self, session, test_id):
+        """Calculates and stores the confidence interval of each metric. Returns the number of runs and the intervals."""
+        runs = session.query(RunAggregate).filter(RunAggregate.test_id == test_id).all()
+        session.query(ConfidenceInterval).filter(ConfidenceInterval.test_id == test_id).delete()
+        intervals = []
+        for metric in self.metrics:
+            mean, lower, upper = confidence_interval([numpy.nan if getattr(run, metric) is None else getattr(run, metric)
+                                                      for run in runs], self.confidence)
+            if numpy.isnan(mean):
+                continue
+            width = relative_width(mean, lower, upper)
+            intervals.append(ConfidenceInterval(test_id=test_id, metric=metric, runs=len(runs), confidence=self.confidence,
+                                                mean=mean, lower=None if numpy.isnan(lower) else lower,
+                                                upper=None if numpy.isnan(upper) else upper,
+                                                relative_width=None if numpy.isnan(width) else width))
+        session.add_all(intervals)
+        session.commit()
+        return len(runs), intervals
+
+    def needs_more_runs(self, session, test_id):
+        runs, intervals = self.update_intervals(session, test_id)
+        if runs < self.minimum:
+            return True
+        if runs >= self.maximum:
+            if any(not self._is_narrow(interval) for interval in intervals):
+                logging.warning('Test %d reached %d runs without the target precision.' % (test_id, runs))
+            return False
+        return any(not self._is_narrow(interval) for interval in intervals)
+
+    def _is_narrow(self, interval):
+        return interval.relative_width is not None and interval.relative_width <= self.target_width
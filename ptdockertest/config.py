@@ -15,6 +15,11 @@ class ConfigFileReader(object):
     def set_file_path(self, file_path):
         self.config.read(file_path)
 
+    def _get_optional(self, section, option, default):
+        if self.config.has_option(section, option):
+            return self.config.get(section, option)
+        return default
+
     def get_log(self, overriden_log=None):
         if overriden_log: return overriden_log
         return self.config.get('benchmark', 'log')
@@ -26,10 +31,155 @@ class ConfigFileReader(object):
     def get_exposed_port(self):
         return self.config.get('benchmark', 'exposed_pt_port')
 
+    def get_creation_workers(self):
+        return int(self._get_optional('benchmark', 'creation_workers', 5))
+
+    def _get_optional_boolean(self, section, option, default):
+        if self.config.has_option(section, option):
+            return self.config.getboolean(section, option)
+        return default
+
+    def get_stream_stats(self):
+        return self._get_optional_boolean('benchmark', 'stream_stats', False)
+
+    def get_stats_series_points(self):
+        return int(self._get_optional('benchmark', 'stats_series_points', 60))
+
+    def get_wal(self):
+        return self._get_optional_boolean('benchmark', 'wal', False)
+
+    def get_defer_writes(self):
+        return self._get_optional_boolean('benchmark', 'defer_writes', False)
+
+    def get_container_pool(self):
+        return self._get_optional_boolean('benchmark', 'container_pool', False)
+
+    def get_response_sample(self):
+        """Returns the number of containers whose response time is measured or None for all of them."""
+        sample = self._get_optional('benchmark', 'response_sample', '1')
+        return None if sample == 'all' else int(sample)
+
+    def get_response_duration(self):
+        """Returns the seconds during which the containers are probed or None to measure a single response."""
+        duration = int(self._get_optional('benchmark', 'response_duration', 0))
+        return duration or None
+
+    def get_response_concurrency(self):
+        return int(self._get_optional('benchmark', 'response_concurrency', 10))
+
+    def get_teardown_workers(self):
+        return int(self._get_optional('benchmark', 'teardown_workers', 5))
+
+    def get_idle_latency(self):
+        return float(self._get_optional('benchmark', 'idle_latency', 0.5))
+
+    def get_idle_timeout(self):
+        return int(self._get_optional('benchmark', 'idle_timeout', 300))
+
+    def get_disk_accounting(self):
+        return self._get_optional('benchmark', 'disk_accounting', 'auto')
+
+    def get_compare_du(self):
+        return self._get_optional_boolean('benchmark', 'compare_du', False)
+
+    def get_disk_sampling_interval(self):
+        """Returns the seconds between disk usage samples or None if it is not sampled during the runs."""
+        interval = float(self._get_optional('benchmark', 'disk_sampling_interval', 0))
+        return interval or None
+
+    def get_stats_collector(self):
+        return self._get_optional('benchmark', 'stats_collector', 'docker')
+
+    def get_cgroup_root(self):
+        return self._get_optional('benchmark', 'cgroup_root', '/sys/fs/cgroup')
+
+    def get_cgroup_driver(self):
+        return self._get_optional('benchmark', 'cgroup_driver', 'cgroupfs')
+
+    def get_engine(self):
+        return self._get_optional('benchmark', 'engine', 'threads')
+
+    def get_engine_workers(self):
+        return int(self._get_optional('benchmark', 'engine_workers', 20))
+
+    def get_ramp_sampling_interval(self):
+        return float(self._get_optional('benchmark', 'ramp_sampling_interval', 1))
+
+    def get_host_sampling_interval(self):
+        """Returns the seconds between samples of the host's resources or None if they are not sampled."""
+        interval = float(self._get_optional('benchmark', 'host_sampling_interval', 0))
+        return interval or None
+
+    def get_proc_root(self):
+        return self._get_optional('benchmark', 'proc_root', '/proc')
+
+    def get_shared_memory(self):
+        return self._get_optional_boolean('benchmark', 'shared_memory', False)
+
+    def get_docker_events(self):
+        return self._get_optional_boolean('benchmark', 'docker_events', False)
+
+    def get_readiness(self):
+        return self._get_optional('benchmark', 'readiness', 'none')
+
+    def get_readiness_marker(self):
+        return self._get_optional('benchmark', 'readiness_marker', None)
+
+    def get_readiness_timeout(self):
+        return float(self._get_optional('benchmark', 'readiness_timeout', 60))
+
+    def get_adaptive_repetitions(self):
+        return self._get_optional_boolean('benchmark', 'adaptive_repetitions', False)
+
+    def get_min_repetitions(self):
+        return int(self._get_optional('benchmark', 'min_repetitions', 3))
+
+    def get_max_repetitions(self):
+        return int(self._get_optional('benchmark', 'max_repetitions', 20))
+
+    def get_confidence_metrics(self):
+        metrics = self._get_optional('benchmark', 'confidence_metrics', 'response, cpu_percentage')
+        return [metric.strip() for metric in metrics.split(',')]
+
+    def get_confidence_width(self):
+        return float(self._get_optional('benchmark', 'confidence_width', 0.1))
+
+    def get_confidence(self):
+        return float(self._get_optional('benchmark', 'confidence', 0.95))
+
     def get_docker_url(self, overriden_url=None):
         if overriden_url: return overriden_url
         return self.config.get('docker', 'url')
 
+    def get_docker_hosts(self, overriden_hosts=None):
+        """Returns a list of tuples (url, capacity) or None if a single Docker host is used."""
+        hosts = overriden_hosts or self._get_optional('docker', 'hosts', None)
+        if not hosts:
+            return None
+        ret = []
+        for host in hosts.split(','):
+            url, separator, capacity = host.strip().rpartition('=')
+            ret.append((url, float(capacity)) if separator else (capacity, 1.0))
+        return ret
+
+    def get_simultaneous_requests(self):
+        return int(self._get_optional('docker', 'simultaneous_requests', 5))
+
+    def get_adaptive_requests(self):
+        return self._get_optional_boolean('docker', 'adaptive_requests', False)
+
+    def get_min_requests(self):
+        return int(self._get_optional('docker', 'min_requests', 1))
+
+    def get_max_requests(self):
+        return int(self._get_optional('docker', 'max_requests', 50))
+
+    def get_target_latency(self):
+        return float(self._get_optional('docker', 'target_latency', 1.0))
+
+    def get_record_calls(self):
+        return self._get_optional_boolean('docker', 'record_calls', False)
+
     def get_jar_path(self):
         return self.config.get('pt_checker', 'jar_path')
 
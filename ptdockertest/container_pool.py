@@ -0,0 +1,95 @@
+"""
+Created on 18/10/2026
+@author: Aitor Gomez Goiri <aitor.gomez-goiri@open.ac.uk>
+Pool of created (but not started) containers reused across runs.
+"""
+
+import logging
+from collections import deque
+from threading import Thread, Lock, local
+from multiprocessing.pool import ThreadPool
+from docker_utils import create_container
+from recovery import get_labels, POOL
+
+
+class ContainerPool(object):
+    """
+    It keeps containers which have been created but never started, so the runs do not need to create them.
+
+    Once a container has been taken, it belongs to the run which took it (i.e., it is started and removed by it).
+    The pool is topped up in the background, so creating the containers does not interfere with the
+    measurements as long as the runs wait for it before starting (see wait()).
+    """
+    def __init__(self, docker_factory, workers=5):
+        self.docker_factory = docker_factory
+        # Its calls are not made by any run, so they are not recorded (see ApiCallLog)
+        self.allocate = docker_factory.create(record_calls=False)
+        self._workers = workers
+        self._image_id = None
+        self._volumes_from = None
+        self._containers = deque()
+        self._lock = Lock()
+        self._refill_thread = None
+        # Each creation thread uses its own client
+        self._creation_clients = local()
+
+    def __len__(self):
+        return len(self._containers)
+
+    def prepare(self, image_id, volumes_from):
+        """Pooled containers are discarded if they do not have the image and volumes required."""
+        if (image_id, volumes_from) != (self._image_id, self._volumes_from):
+            self.clear()
+            self._image_id = image_id
+            self._volumes_from = volumes_from
+
+    def take(self):
+        """Returns a created container or None if the pool is empty."""
+        with self._lock:
+            return self._containers.popleft() if self._containers else None
+
+    def _allocate_creation_client(self):
+        if not hasattr(self._creation_clients, 'allocate'):
+            self._creation_clients.allocate = self.docker_factory.create(record_calls=False)
+        return self._creation_clients.allocate
+
+    def _create(self):
+        with self._allocate_creation_client()() as docker:
+            container = create_container(docker, self._image_id, self._volumes_from, labels=get_labels(POOL))
+        with self._lock:
+            self._containers.append(container)
+
+    def _fill(self, size):
+        missing = size - len(self)
+        if missing <= 0:
+            return
+        logging.info('Adding %d containers to the pool.' % missing)
+        pool = ThreadPool(self._workers)
+        try:
+            pool.map(lambda _: self._create(), range(missing))
+        except Exception as e:
+            logging.error('The pool could not be filled: %s.' % e)
+        finally:
+            pool.close()
+            pool.join()
+
+    def refill(self, size):
+        """Creates containers in the background until the pool has the given size."""
+        self.wait()
+        self._refill_thread = Thread(target=self._fill, args=(size,))
+        self._refill_thread.daemon = True
+        self._refill_thread.start()
+
+    def wait(self):
+        """Waits until the pool has been topped up."""
+        if self._refill_thread:
+            self._refill_thread.join()
+            self._refill_thread = None
+
+    def clear(self):
+        self.wait()
+        while self._containers:
+            container = self._containers.popleft()
+            with self.allocate() as docker:
+                docker.remove_container(container.get('Id'), force=True)
+        logging.info('Container pool emptied.')
@@ -1,50 +1,283 @@
+import time
+import logging
 from itertools import cycle
+from functools import partial
+from collections import deque
 from contextlib import contextmanager
-from threading import BoundedSemaphore
+from threading import Condition, Lock
+from requests.exceptions import Timeout
 from docker import Client
+from docker.errors import APIError
 
 
+def create_container(docker, image_id, volumes_from=None, ports=None, labels=None):
+    """
+    Creates (but does not start) a container.
+
+    :param volumes_from: comma separated names of the containers whose volumes will be mounted.
+    :param ports: dictionary with the container ports as keys and the host ports as values.
+    :param labels: dictionary with the labels of the container (see recovery.get_labels).
+    """
+    volumes = [] if not volumes_from else [v for v in volumes_from.split(',')]
+    ports = ports or {}
+    host_config = docker.create_host_config(port_bindings = ports, volumes_from=volumes)
+    return docker.create_container(image = image_id,
+                                   ports = list(ports.keys()),
+                                   host_config = host_config,
+                                   labels = labels)
+
+
+def wait_until_idle(allocate, removed_ids, max_latency=0.5, timeout=300, interval=1):
+    """
+    Waits until Docker no longer lists the removed containers and answers requests
+    in less than max_latency seconds.
+    Returns the seconds waited.
+    """
+    start = time.time()
+    pending = set(removed_ids)
+    while time.time() - start < timeout:
+        request_start = time.time()
+        with allocate() as docker:
+            existing = set(c['Id'] for c in docker.containers(all=True))
+        latency = time.time() - request_start
+        pending &= existing
+        if not pending and latency < max_latency:
+            break
+        time.sleep(interval)
+    else:
+        logging.warning('Docker was still busy after %d seconds (%d containers not removed).' % (timeout, len(pending)))
+    return time.time() - start
+
+
+class AdaptiveLimiter(object):
+    """
+    It limits the simultaneous requests to Docker adapting the limit to how fast Docker answers (AIMD).
+
+    While the requests take less than the target latency, the limit grows by one each time
+    as many requests as the current limit have finished (additive increase).
+    When a request takes longer or times out, the limit is multiplied by the backoff factor
+    (multiplicative decrease). Slow requests which started before the last decrease are ignored,
+    otherwise the requests already in flight would shrink the limit several times in a row.
+
+    Only the latency of the short control-plane calls (see CONTROL_OPERATIONS) is considered: others,
+    such as the stats calls, take about a second regardless of how busy Docker is.
+
+    With the same minimum and maximum, it behaves as a bounded semaphore.
+    """
+    def __init__(self, initial=5, minimum=1, maximum=50, target_latency=1.0, backoff=0.5, history=1000):
+        self.limit = float(initial)
+        self.minimum = minimum
+        self.maximum = maximum
+        self.target_latency = target_latency
+        self.backoff = backoff
+        self.in_flight = 0
+        # Tuples (timestamp, limit, latency, reason) with the last changes of the limit
+        self.decisions = deque(maxlen=history)
+        self._condition = Condition(Lock())
+        self._fast_requests = 0
+        self._last_decrease = 0
+
+    def _change_limit(self, limit, latency, reason):
+        previous, self.limit = self.limit, max(self.minimum, min(self.maximum, limit))
+        if int(previous) != int(self.limit):
+            self.decisions.append((time.time(), int(self.limit), latency, reason))
+            logging.debug('Simultaneous Docker requests limited to %d (%s).' % (self.limit, reason))
+
+    def acquire(self):
+        with self._condition:
+            while self.in_flight >= int(self.limit):
+                self._condition.wait()
+            self.in_flight += 1
+            return time.time()
+
+    def _record(self, started, latency, timed_out):
+        if timed_out or latency > self.target_latency:
+            self._fast_requests = 0
+            if started > self._last_decrease:
+                self._last_decrease = time.time()
+                self._change_limit(self.limit * self.backoff, latency, 'timeout' if timed_out else 'slow')
+        else:
+            self._fast_requests += 1
+            if self._fast_requests >= int(self.limit):
+                self._fast_requests = 0
+                self._change_limit(self.limit + 1, latency, 'fast')
+
+    def release(self, calls=()):
+        """:param calls: tuples (started, latency, timed out) of the control-plane calls made with the permit."""
+        with self._condition:
+            self.in_flight -= 1
+            for started, latency, timed_out in calls:
+                self._record(started, latency, timed_out)
+            self._condition.notify_all()
+
+    def get_decisions(self, since=0):
+        """Returns the changes of the limit made after the given timestamp."""
+        return [decision for decision in list(self.decisions) if decision[0] >= since]
+
+
+class ApiCallLog(object):
+    """
+    It collects the Docker API calls made by the instrumented clients.
+    Each call is a tuple (operation, started, wait, duration, outcome).
+    """
+    def __init__(self):
+        self._calls = deque()
+
+    def record(self, operation, started, wait, duration, outcome):
+        # deque.append is thread safe
+        self._calls.append((operation, started, wait, duration, outcome))
+
+    def drain(self):
+        """Returns and forgets the calls recorded so far."""
+        calls = []
+        while self._calls:
+            calls.append(self._calls.popleft())
+        return calls
+
+
+# Short calls whose latency reflects how busy Docker is (the container listings are only timed without sizes)
+CONTROL_OPERATIONS = ('create_container', 'start', 'stop', 'inspect_container', 'remove_container', 'containers')
+
+class LatencyProbe(object):
+    """Proxy of a Docker client which times its control-plane calls (see AdaptiveLimiter)."""
+
+    def __init__(self, client):
+        self._client = client
+        self.calls = []  # Tuples (started, latency, timed out)
+
+    def __getattr__(self, name):
+        attribute = getattr(self._client, name)
+        if name not in CONTROL_OPERATIONS:
+            return attribute
+
+        def call(*args, **kwargs):
+            if kwargs.get('size'):
+                # Calculating the size of the containers is slow on purpose
+                return attribute(*args, **kwargs)
+            started = time.time()
+            timed_out = False
+            try:
+                return attribute(*args, **kwargs)
+            except Timeout:
+                timed_out = True
+                raise
+            finally:
+                self.calls.append((started, time.time() - started, timed_out))
+        return call
+
+
+class InstrumentedClient(object):
+    """
+    Proxy of a Docker client which records the duration and outcome of each API call.
+    The time spent waiting for the limiter is attributed to the first call made with the proxy.
+    """
+    # Methods which do not call the API
+    LOCAL_METHODS = ('create_host_config',)
+
+    def __init__(self, client, call_log, wait=0.0):
+        self._client = client
+        self._log = call_log
+        self._wait = wait
+
+    def __getattr__(self, name):
+        attribute = getattr(self._client, name)
+        if not callable(attribute) or name.startswith('_') or name in InstrumentedClient.LOCAL_METHODS:
+            return attribute
+
+        def call(*args, **kwargs):
+            wait, self._wait = self._wait, 0.0
+            started = time.time()
+            outcome = 'ok'
+            try:
+                return attribute(*args, **kwargs)
+            except Timeout:
+                outcome = 'timeout'
+                raise
+            except APIError:
+                outcome = 'api_error'
+                raise
+            except Exception:
+                outcome = 'error'
+                raise
+            finally:
+                self._log.record(name, started, wait, time.time() - started, outcome)
+        return call
+
 
 class DockerClientFactory(object):
 
-    def __init__(self, base_url, max_simultaneous_requests=5, max_clients=100):
+    def __init__(self, base_url, max_simultaneous_requests=5, max_clients=100, limiter=None, call_log=None):
         self._base_url = base_url
-        self._semaphore = BoundedSemaphore(max_simultaneous_requests)
+        self.call_log = call_log  # If provided, the API calls are recorded
+        # By default, a fixed number of simultaneous requests
+        self.limiter = limiter or AdaptiveLimiter(max_simultaneous_requests,
+                                                  minimum=max_simultaneous_requests,
+                                                  maximum=max_simultaneous_requests)
         self._pool = []
         self._max_clients = max_clients
         self._pool_cycle = None
+        # Clients might be requested from different threads (e.g., while containers are created)
+        self._lock = Lock()
 
-    def create(self):
-        if len(self._pool) < self._max_clients:
-            client = DockerBoundedClient(self._base_url, self._semaphore)
-            self._pool.append(client)
-            return client.get
-        else:
-            if len(self._pool) == self._max_clients:
-                self._pool_cycle = cycle(self._pool)
-            return next(self._pool_cycle).get
+    def create(self, record_calls=True):
+        """:param record_calls: if False, the calls are not recorded (e.g., they are not made by any run)."""
+        with self._lock:
+            if len(self._pool) < self._max_clients:
+                client = DockerBoundedClient(self._base_url, self.limiter, self.call_log)
+                self._pool.append(client)
+            else:
+                if self._pool_cycle is None:
+                    self._pool_cycle = cycle(self._pool)
+                client = next(self._pool_cycle)
+        return client.get if record_calls else partial(client.get, record_calls=False)
+
+    def create_streaming(self):
+        """
+        Returns a client for long-lived requests (e.g., stats streams).
+        It does not use the limiter, otherwise each stream would block a permit for the whole run.
+        """
+        return DockerStreamingClient(self._base_url, self.call_log).get
 
 
 """
 I have experienced that Docker gets stuck with many simultaneous requests.
 
 Used together the 'with' clause, this class ensures that the docker client will
-only be used when the (bounded) semaphore is opened.
+only be used when the limiter allows it.
 
 NOTE: the simultaneous request don't affect Docker getting blocked.
 It was the amount of CPU consumed by the many containers created.
 """
 class DockerBoundedClient(object):
 
-    def __init__(self, base_url, semaphore):
-        self._semaphore = semaphore
+    def __init__(self, base_url, limiter, call_log=None):
+        self._limiter = limiter
+        self._call_log = call_log
         # FIXME we can reuse the client once we know for sure that it is Thread safe...
         self._client = Client(base_url, version='1.19')
 
     @contextmanager
-    def get(self):
+    def get(self, record_calls=True):
+        requested = time.time()
+        started = self._limiter.acquire()
+        probe = LatencyProbe(self._client)
         try:
-            self._semaphore.acquire()
-            yield self._client
+            if self._call_log is None or not record_calls:
+                yield probe
+            else:
+                yield InstrumentedClient(probe, self._call_log, started - requested)
         finally:
-            self._semaphore.release()
+            self._limiter.release(probe.calls)
+
+
+class DockerStreamingClient(object):
+
+    def __init__(self, base_url, call_log=None):
+        self._base_url = base_url
+        self._call_log = call_log
+
+    @contextmanager
+    def get(self):
+        # Each stream uses its own connection
+        client = Client(self._base_url, version='1.19')
+        yield client if self._call_log is None else InstrumentedClient(client, self._call_log)
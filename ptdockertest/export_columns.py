@@ -0,0 +1,55 @@
+"""
+Created on 18/10/2026
+@author: Aitor Gomez Goiri <aitor.gomez-goiri@open.ac.uk>
+Script to export the measures of each test to columnar files.
+
+Each test is exported to a directory with a NumPy array (.npy) per table and column
+(e.g., 'cpu.percentage.npy') and its description ('test.json').
+The arrays are keyed by the identifiers of the runs and containers, so they can be memory-mapped
+and analysed without joining the tables of the database (see generate_plots.py -columns).
+"""
+
+import os
+import json
+import numpy
+from argparse import ArgumentParser
+from models import PerformanceTestDAO, Test, Run, CpuRequired, MemoryRequired
+from generate_plots import COLUMNS, TEST_FILE, fetch_array, ended_runs_query, container_measures_query
+
+
+def save_columns(directory, table, array):
+    for position, name in enumerate(COLUMNS[table]):
+        numpy.save(os.path.join(directory, '%s.%s.npy' % (table, name)), numpy.ascontiguousarray(array[:, position]))
+
+def export_test(session, test, directory):
+    test_directory = os.path.join(directory, 'test-%d' % test.id)
+    if not os.path.isdir(test_directory):
+        os.makedirs(test_directory)
+    save_columns(test_directory, 'run', fetch_array(session, ended_runs_query(session).filter(Run.test_id == test.id)))
+    cpu = container_measures_query(session, CpuRequired.total_cpu, CpuRequired.percentual_cpu, CpuRequired.container_id)
+    save_columns(test_directory, 'cpu', fetch_array(session, cpu.filter(Run.test_id == test.id)))
+    memory = container_measures_query(session, MemoryRequired.usage, MemoryRequired.maximum,
+                                      MemoryRequired.percentual, MemoryRequired.container_id)
+    save_columns(test_directory, 'memory', fetch_array(session, memory.filter(Run.test_id == test.id)))
+    # Written last, so only complete exports are read
+    with open(os.path.join(test_directory, TEST_FILE), 'w') as test_file:
+        json.dump({ 'id': test.id, 'image_id': test.image_id, 'volumes_from': test.volumes_from,
+                    'number_of_containers': test.number_of_containers, 'repetitions': test.repetitions }, test_file)
+
+def main(database_file, directory):
+    dao = PerformanceTestDAO(database_file)
+    session = dao.get_session()
+    for test in session.query(Test):
+        export_test(session, test, directory)
+        print "Test %d exported." % test.id
+
+def entry_point():
+    parser = ArgumentParser(description='Export the measures of each test to columnar files.')
+    parser.add_argument('-db', default='/tmp/benchmark.db', dest='database', help='Database file.')
+    parser.add_argument('-output', default='/tmp/columns', dest='directory', help='Folder where the tests will be exported.')
+    args = parser.parse_args()
+    main(args.database, args.directory)
+
+
+if __name__ == "__main__":
+    entry_point()
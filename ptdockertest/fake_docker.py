@@ -0,0 +1,587 @@
+"""
+Created on 18/10/2026
+@author: Aitor Gomez Goiri <aitor.gomez-goiri@open.ac.uk>
+Simulated Docker daemon to benchmark the harness itself without Docker or Packet Tracer.
+
+It serves the subset of the Docker Engine API used by this project through a unix socket:
+container creation, start, stats, logs, stop, removal, inspection and listing, the daemon information
+and its events.
+The latency and failure rate of each operation can be configured and the stats are synthetic
+(running containers compete for the simulated CPUs and their memory grows over time).
+Once started, each container prints READY_MARKER after the latency of the 'ready' pseudo-operation.
+The containers run out of memory with the failure rate of the 'oom' pseudo-operation (after its latency).
+"""
+
+import os
+import re
+import json
+import math
+import time
+import uuid
+import random
+import struct
+import logging
+from argparse import ArgumentParser
+from collections import deque
+from threading import Thread, Lock, Condition, Timer
+from urlparse import urlparse, parse_qs
+from SocketServer import ThreadingMixIn, UnixStreamServer
+from BaseHTTPServer import BaseHTTPRequestHandler
+
+
+OPERATIONS = ('create', 'start', 'stats', 'logs', 'stop', 'remove', 'inspect', 'list', 'info', 'events')
+READY_MARKER = 'Ready to accept IPC connections'
+
+
+def parse_distribution(description):
+    """
+    Returns a function which generates random latencies (in seconds) following the described distribution.
+
+    Valid descriptions: 'fixed:x', 'uniform:a,b', 'exponential:mean', 'normal:mean,deviation' and
+    'lognormal:median,sigma'.
+    """
+    name, _, params = description.partition(':')
+    values = [float(v) for v in params.split(',')] if params else []
+    try:
+        if name == 'fixed':
+            return lambda: values[0]
+        elif name == 'uniform':
+            return lambda: random.uniform(values[0], values[1])
+        elif name == 'exponential':
+            return lambda: random.expovariate(1.0 / values[0]) if values[0] else 0.0
+        elif name == 'normal':
+            return lambda: max(0.0, random.gauss(values[0], values[1]))
+        elif name == 'lognormal':
+            return lambda: random.lognormvariate(math.log(values[0]), values[1])
+    except IndexError:
+        pass
+    raise ValueError('Invalid latency distribution "%s".' % description)
+
+
+class FakeContainer(object):
+
+    def __init__(self, image, labels=None):
+        self.id = uuid.uuid4().hex + uuid.uuid4().hex
+        self.image = image
+        self.labels = labels or {}
+        self.created = time.time()
+        self.state = 'created'
+        self.cpu_usage = 0  # In nanoseconds, until the last time it was stopped
+        self.cpu_offset = 0  # CPU time given to each running container when it was started
+        self.started = None
+        self.ready = None  # When READY_MARKER is printed
+        self.finished = None
+        self.memory_max = 0
+
+
+def has_label(container, label):
+    """:param label: a label filter ('key' or 'key=value')."""
+    key, separator, value = label.partition('=')
+    return key in container.labels and (not separator or container.labels[key] == value)
+
+
+class FakeDocker(object):
+    """
+    State of the simulated daemon.
+
+    :param latencies: dictionary with a latency distribution (see parse_distribution) per operation.
+    :param failure_rates: dictionary with the probability of failing of each operation.
+    :param cpus: CPUs of the simulated host.
+    :param cpu_demand: fraction of a CPU that each running container would like to use.
+    :param memory_limit: memory of the simulated host in bytes.
+    :param memory_base: memory used by a container once started in bytes.
+    :param memory_growth: bytes per second that the memory of a running container grows.
+    :param disk_base: bytes of the writable layer of a new container.
+    :param disk_growth: bytes per second that the writable layer of a running container grows.
+    """
+    def __init__(self, latencies=None, failure_rates=None, cpus=4, cpu_demand=0.2,
+                 memory_limit=16 * 1024 ** 3, memory_base=120 * 1024 ** 2, memory_growth=256 * 1024,
+                 disk_base=1024 ** 2, disk_growth=64 * 1024, stats_interval=1.0):
+        self.latencies = dict((op, parse_distribution(d)) for op, d in (latencies or {}).items())
+        self.failure_rates = failure_rates or {}
+        self.cpus = cpus
+        self.cpu_demand = cpu_demand
+        self.memory_limit = memory_limit
+        self.memory_base = memory_base
+        self.memory_growth = memory_growth
+        self.disk_base = disk_base
+        self.disk_growth = disk_growth
+        self.stats_interval = stats_interval
+        self.containers = {}
+        self._running = 0
+        self._lock = Lock()
+        # All the running containers get the same CPU time, so it is accumulated only once
+        self._cpu_per_container = 0  # In nanoseconds
+        self._cpu_updated = time.time()
+        self._events = deque(maxlen=10000)  # Tuples (sequence number, event)
+        self._events_sent = 0
+        self._new_event = Condition()
+
+    def delay(self, operation):
+        if operation in self.latencies:
+            time.sleep(self.latencies[operation]())
+
+    def sample_latency(self, operation):
+        return self.latencies[operation]() if operation in self.latencies else 0.0
+
+    def fails(self, operation):
+        return random.random() < self.failure_rates.get(operation, 0.0)
+
+    def _update_cpu(self):
+        """Distributes the CPU time since the last update among the running containers."""
+        now = time.time()
+        if self._running:
+            demand = self._running * self.cpu_demand
+            share = self.cpu_demand * min(1.0, self.cpus / demand)
+            self._cpu_per_container += int((now - self._cpu_updated) * share * 1e9)
+        self._cpu_updated = now
+
+    def _get_cpu_usage(self, container):
+        if container.state == 'running':
+            return container.cpu_usage + self._cpu_per_container - container.cpu_offset
+        return container.cpu_usage
+
+    def find(self, container_id):
+        """Returns the container with the given identifier (or prefix) or None."""
+        if container_id in self.containers:
+            return self.containers[container_id]
+        for identifier, container in self.containers.items():
+            if identifier.startswith(container_id):
+                return container
+        return None
+
+    def emit(self, container, action, **attributes):
+        """Sends an event (in the format of API 1.22) to the subscribers."""
+        now = time.time()
+        attributes.update(container.labels)
+        attributes['image'] = container.image
+        event = { 'status': action, 'id': container.id, 'from': container.image, 'Type': 'container', 'Action': action,
+                  'Actor': {'ID': container.id, 'Attributes': attributes},
+                  'time': int(now), 'timeNano': int(now * 1e9) }
+        with self._new_event:
+            self._events_sent += 1
+            self._events.append((self._events_sent, event))
+            self._new_event.notify_all()
+
+    def get_events(self, since_event=0, since_time=None, timeout=1):
+        """
+        Returns the number of the last event sent and the events sent after since_event
+        (and since since_time, in seconds), waiting at most timeout seconds for new ones.
+        """
+        with self._new_event:
+            if self._events_sent <= since_event:
+                self._new_event.wait(timeout)
+            events = [event for number, event in self._events if number > since_event and
+                                                                 (since_time is None or event['time'] >= since_time)]
+            return self._events_sent, events
+
+    def create(self, image, labels=None):
+        container = FakeContainer(image, labels)
+        with self._lock:
+            self.containers[container.id] = container
+        self.emit(container, 'create')
+        return container
+
+    def start(self, container):
+        with self._lock:
+            self._update_cpu()
+            container.state = 'running'
+            container.cpu_offset = self._cpu_per_container
+            container.started = time.time()
+            container.ready = container.started + self.sample_latency('ready')
+            self._running += 1
+        self.emit(container, 'start')
+        if self.fails('oom'):
+            killer = Timer(self.sample_latency('oom'), self._kill_out_of_memory, args=(container,))
+            killer.daemon = True
+            killer.start()
+
+    def _kill_out_of_memory(self, container):
+        if container.state == 'running':
+            self.emit(container, 'oom')
+            self._exit(container, 137)
+
+    def _exit(self, container, exit_code):
+        with self._lock:
+            self._update_cpu()
+            if container.state != 'running':
+                return
+            container.cpu_usage = self._get_cpu_usage(container)
+            container.state = 'exited'
+            container.finished = time.time()
+            self._running -= 1
+        self.emit(container, 'die', exitCode=str(exit_code))
+
+    def stop(self, container):
+        self._exit(container, 0)
+
+    def remove(self, container):
+        self.stop(container)
+        with self._lock:
+            del self.containers[container.id]
+        self.emit(container, 'destroy')
+
+    def memory_usage(self, container):
+        if container.state != 'running':
+            return 0
+        usage = self.memory_base + self.memory_growth * (time.time() - container.started)
+        usage = int(min(self.memory_limit, usage * random.uniform(0.98, 1.02)))
+        container.memory_max = max(container.memory_max, usage)
+        return usage
+
+    def logs(self, container):
+        """Returns the lines printed by the container so far."""
+        lines = []
+        if container.started:
+            lines.append('Starting Packet Tracer\n')
+            if time.time() >= container.ready:
+                lines.append(READY_MARKER + '\n')
+        return lines
+
+    def disk_usage(self, container):
+        running_time = 0
+        if container.started:
+            running_time = (container.finished or time.time()) - container.started
+        return int(self.disk_base + self.disk_growth * running_time)
+
+    def stats(self, container):
+        with self._lock:
+            self._update_cpu()
+            cpu_usage = self._get_cpu_usage(container)
+        per_cpu = cpu_usage // self.cpus
+        return {
+            'read': time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime()),
+            'cpu_stats': {
+                'cpu_usage': {'total_usage': cpu_usage, 'percpu_usage': [per_cpu] * self.cpus},
+                'system_cpu_usage': int(time.time() * 1e9 * self.cpus),
+            },
+            'memory_stats': {
+                'usage': self.memory_usage(container),
+                'max_usage': container.memory_max,
+                'limit': self.memory_limit,
+            },
+        }
+
+    def describe(self, container, size=False):
+        description = {
+            'Id': container.id,
+            'Image': container.image,
+            'Labels': container.labels,
+            'Created': int(container.created),
+            'State': container.state,
+            'Status': container.state,
+        }
+        if size:
+            description['SizeRw'] = self.disk_usage(container)
+        return description
+
+    def inspect(self, container):
+        return {
+            'Id': container.id,
+            'Image': container.image,
+            'Config': {'Labels': container.labels, 'Tty': False},
+            # The simulated containers share the network of the host
+            'NetworkSettings': {'IPAddress': '127.0.0.1'},
+            'State': {'Status': container.state, 'Running': container.state == 'running'},
+            'GraphDriver': {'Name': 'overlay', 'Data': {'UpperDir': '/var/lib/docker/overlay/%s/upper' % container.id}},
+        }
+
+    def info(self):
+        with self._lock:
+            containers = list(self.containers.values())
+        return {
+            'Containers': len(containers),
+            'ContainersRunning': len([c for c in containers if c.state == 'running']),
+            'NCPU': self.cpus,
+            'MemTotal': self.memory_limit,
+            'DockerRootDir': '/var/lib/docker',
+            'Driver': 'devicemapper',
+            'DriverStatus': [['Data Space Used', str(sum(self.disk_usage(c) for c in containers))]],
+        }
+
+
+class FakeDockerHandler(BaseHTTPRequestHandler):
+    # Needed for the chunked stats streams
+    protocol_version = 'HTTP/1.1'
+    ROUTES = (
+        ('POST', r'^/containers/create$', 'create'),
+        ('POST', r'^/containers/(?P<id>[^/]+)/start$', 'start'),
+        ('POST', r'^/containers/(?P<id>[^/]+)/stop$', 'stop'),
+        ('GET', r'^/containers/(?P<id>[^/]+)/stats$', 'stats'),
+        ('GET', r'^/containers/(?P<id>[^/]+)/logs$', 'logs'),
+        ('GET', r'^/containers/json$', 'list'),
+        ('GET', r'^/containers/(?P<id>[^/]+)/json$', 'inspect'),
+        ('DELETE', r'^/containers/(?P<id>[^/]+)$', 'remove'),
+        ('GET', r'^/info$', 'info'),
+        ('GET', r'^/events$', 'events'),
+        ('GET', r'^/_ping$', 'ping'),
+        ('GET', r'^/version$', 'version'),
+    )
+
+    def log_message(self, format, *args):
+        logging.debug('Fake Docker: ' + format % args)
+
+    @property
+    def docker(self):
+        return self.server.docker
+
+    def _send_json(self, status, body=None):
+        data = json.dumps(body) if body is not None else ''
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _send_error(self, status, message):
+        self._send_json(status, {'message': message})
+
+    def _read_body(self):
+        length = int(self.headers.getheader('Content-Length') or 0)
+        body = self.rfile.read(length) if length else ''
+        return json.loads(body) if body else {}
+
+    def _dispatch(self, method):
+        url = urlparse(self.path)
+        path = re.sub(r'^/v[0-9.]+', '', url.path)
+        query = parse_qs(url.query)
+        for route_method, pattern, operation in FakeDockerHandler.ROUTES:
+            match = re.match(pattern, path)
+            if route_method == method and match:
+                self.docker.delay(operation)
+                if self.docker.fails(operation):
+                    return self._send_error(500, 'Simulated failure in operation "%s".' % operation)
+                container = None
+                if 'id' in match.groupdict():
+                    container = self.docker.find(match.group('id'))
+                    if not container:
+                        return self._send_error(404, 'No such container: %s' % match.group('id'))
+                return getattr(self, '_handle_' + operation)(container, query)
+        self._send_error(404, 'Page not found')
+
+    def do_GET(self):
+        self._dispatch('GET')
+
+    def do_POST(self):
+        self._dispatch('POST')
+
+    def do_DELETE(self):
+        self._dispatch('DELETE')
+
+    def _handle_create(self, _, query):
+        body = self._read_body()
+        container = self.docker.create(body.get('Image'), body.get('Labels'))
+        self._send_json(201, {'Id': container.id, 'Warnings': None})
+
+    def _handle_start(self, container, query):
+        self._read_body()
+        if container.state == 'running':
+            return self._send_json(304)
+        self.docker.start(container)
+        self._send_json(204)
+
+    def _handle_stop(self, container, query):
+        self.docker.stop(container)
+        self._send_json(204)
+
+    def _handle_remove(self, container, query):
+        if container.state == 'running' and query.get('force', ['0'])[0] not in ('1', 'true', 'True'):
+            return self._send_error(409, 'You cannot remove a running container.')
+        self.docker.remove(container)
+        self._send_json(204)
+
+    def _handle_inspect(self, container, query):
+        self._send_json(200, self.docker.inspect(container))
+
+    def _handle_list(self, _, query):
+        show_all = query.get('all', ['0'])[0] in ('1', 'true', 'True')
+        size = query.get('size', ['0'])[0] in ('1', 'true', 'True')
+        labels = json.loads(query.get('filters', ['{}'])[0]).get('label', [])
+        containers = [c for c in list(self.docker.containers.values()) if (show_all or c.state == 'running') and
+                                                                           all(has_label(c, label) for label in labels)]
+        self._send_json(200, [self.docker.describe(c, size) for c in containers])
+
+    def _handle_info(self, _, query):
+        self._send_json(200, self.docker.info())
+
+    def _handle_ping(self, _, query):
+        self.send_response(200)
+        self.send_header('Content-Length', '2')
+        self.end_headers()
+        self.wfile.write('OK')
+
+    def _handle_version(self, _, query):
+        self._send_json(200, {'Version': '1.7.1-fake', 'ApiVersion': '1.19'})
+
+    def _write_chunk(self, data):
+        self.wfile.write('%x\r\n%s\r\n' % (len(data), data))
+        self.wfile.flush()
+
+    def _handle_logs(self, container, query):
+        # Like Docker for containers without TTY, each line is framed with its stream (stdout) and length
+        frame = lambda line: struct.pack('>BxxxL', 1, len(line)) + line
+        if query.get('follow', ['0'])[0] in ('0', 'false', 'False'):
+            body = ''.join(frame(line) for line in self.docker.logs(container))
+            self.send_response(200)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+            return
+        self.send_response(200)
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        try:
+            sent = 0
+            # The stream ends once the container is stopped
+            while True:
+                lines = self.docker.logs(container)
+                for line in lines[sent:]:
+                    self._write_chunk(frame(line))
+                sent = len(lines)
+                if container.state != 'running' or container.id not in self.docker.containers:
+                    break
+                time.sleep(0.05)
+            self._write_chunk('')
+        except IOError:
+            pass  # The client closed the stream
+        self.close_connection = True
+
+    def _handle_events(self, _, query):
+        since = int(query['since'][0]) if 'since' in query else None
+        filters = json.loads(query.get('filters', ['{}'])[0])
+        accepted = lambda event: event['Type'] in filters.get('type', [event['Type']]) and \
+                                 event['Action'] in filters.get('event', [event['Action']])
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        try:
+            # Like Docker, the past events are only sent if 'since' is provided
+            last, events = self.docker.get_events(since_time=since, timeout=0) if since is not None else \
+                           self.docker.get_events(self.docker.get_events(timeout=0)[0], timeout=0)
+            while True:
+                for event in events:
+                    if accepted(event):
+                        self._write_chunk(json.dumps(event) + '\n')
+                last, events = self.docker.get_events(last)
+        except IOError:
+            pass  # The client closed the stream
+        self.close_connection = True
+
+    def _handle_stats(self, container, query):
+        stream = query.get('stream', ['1'])[0] not in ('0', 'false', 'False')
+        if not stream:
+            return self._send_json(200, self.docker.stats(container))
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        try:
+            # Like Docker, one document per interval while the container exists and is running
+            while True:
+                self._write_chunk(json.dumps(self.docker.stats(container)) + '\n')
+                time.sleep(self.docker.stats_interval)
+                if container.state != 'running' or container.id not in self.docker.containers:
+                    break
+            self._write_chunk('')
+        except IOError:
+            pass  # The client closed the stream
+        self.close_connection = True
+
+
+class FakeDockerServer(ThreadingMixIn, UnixStreamServer):
+    daemon_threads = True
+    # Thousands of containers can connect at the same time (e.g., to stream their stats)
+    request_queue_size = 4096
+
+    def __init__(self, socket_path, docker):
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+        UnixStreamServer.__init__(self, socket_path, FakeDockerHandler)
+        self.docker = docker
+
+    def get_request(self):
+        request, _ = UnixStreamServer.get_request(self)
+        # BaseHTTPRequestHandler expects a (host, port) address
+        return request, ('fake-docker', 0)
+
+    def handle_error(self, request, client_address):
+        # E.g., the client closed a stream
+        logging.debug('Fake Docker: request interrupted.', exc_info=True)
+
+
+class FakeDockerDaemon(object):
+    """
+    It serves a FakeDocker through a unix socket in a background thread.
+    The harness can use it with the URL returned by get_url().
+    """
+    def __init__(self, socket_path, docker=None):
+        self.socket_path = socket_path
+        self.docker = docker or FakeDocker()
+        self._server = None
+        self._thread = None
+
+    def get_url(self):
+        return 'unix://' + self.socket_path
+
+    def start(self):
+        self._server = FakeDockerServer(self.socket_path, self.docker)
+        self._thread = Thread(target=self._server.serve_forever)
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def stop(self):
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+            os.remove(self.socket_path)
+            self._server = None
+
+
+def parse_operation_values(values, parse, operations=OPERATIONS):
+    """Parses a list of 'operation=value' strings."""
+    ret = {}
+    for value in values or []:
+        operation, _, description = value.partition('=')
+        if operation not in operations:
+            raise ValueError('Unknown operation "%s". Valid operations: %s.' % (operation, ', '.join(operations)))
+        ret[operation] = parse(description)
+    return ret
+
+def main(socket_path, latencies, failure_rates, cpus, cpu_demand, memory_limit):
+    docker = FakeDocker(latencies, failure_rates, cpus, cpu_demand, memory_limit)
+    server = FakeDockerServer(socket_path, docker)
+    print 'Simulated Docker listening in unix://%s' % socket_path
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        os.remove(socket_path)
+
+def entry_point():
+    parser = ArgumentParser(description='Run a simulated Docker daemon.')
+    parser.add_argument('-socket', default='/tmp/fake-docker.sock', dest='socket', help='Unix socket to listen to.')
+    parser.add_argument('-latency', action='append', dest='latencies', metavar='OPERATION=DISTRIBUTION',
+                            help='Latency of an operation (e.g., create=lognormal:0.05,0.5). ' +
+                            'Operations: %s, ready (since a container is started ' % ', '.join(OPERATIONS) +
+                            'until it prints "%s") and oom (since it is started until it runs out of memory).' % READY_MARKER)
+    parser.add_argument('-failure', action='append', dest='failures', metavar='OPERATION=RATE',
+                            help='Probability of failure of an operation (e.g., start=0.01) or of running out of ' +
+                            'memory once started (oom).')
+    parser.add_argument('-cpus', default=4, type=int, dest='cpus', help='CPUs of the simulated host.')
+    parser.add_argument('-cpu-demand', default=0.2, type=float, dest='cpu_demand',
+                            help='Fraction of a CPU each running container tries to use.')
+    parser.add_argument('-memory', default=16 * 1024 ** 3, type=int, dest='memory', help='Memory of the simulated host in bytes.')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    main(args.socket,
+         parse_operation_values(args.latencies, lambda d: d, OPERATIONS + ('ready', 'oom')),
+         parse_operation_values(args.failures, float, OPERATIONS + ('oom',)),
+         args.cpus, args.cpu_demand, args.memory)
+
+
+if __name__ == "__main__":
+    entry_point()
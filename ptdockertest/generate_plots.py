@@ -4,10 +4,14 @@ Created on 22/09/2015
 Script to run benchmarks.
 """
 
+import os
+import json
 import numpy
 from argparse import ArgumentParser
 from collections import OrderedDict
-from models import PerformanceTestDAO, Test
+from models import PerformanceTestDAO, Test, Run, Container, CpuRequired, MemoryRequired, DiskRequired, ResponseTime, ExecutionError, \
+                   RunAggregate, TestAggregate
+from confidence import confidence_interval
 
 
 PER_CONTAINER_SUFFIX = '_per_container'
@@ -24,15 +28,24 @@ MEMORY_MAX_PC = MEMORY_MAX + PER_CONTAINER_SUFFIX
 MEMORY_PERC = 'memory_percentage'
 MEMORY_PERC_PC = MEMORY_PERC + PER_CONTAINER_SUFFIX
 ALL_FIELDS = (SIZE, RESPONSE_TIME, CPU_TOTAL, CPU_TOTAL_PC, CPU_PERC, CPU_PERC_PC, MEMORY, MEMORY_PC, MEMORY_MAX, MEMORY_MAX_PC, MEMORY_PERC, MEMORY_PERC_PC)
+# Percentiles of the runs of each test shown next to their mean
+PERCENTILES = (5, 50, 95)
 
 
-def generate_data_json(measures):
+def generate_data_json(measures, summaries=None):
+    """
+    :param summaries: if provided, the percentiles and the confidence interval of each mean (see summarise_per_test).
+    """
     print '{'
     for indicator, imeasures in measures.items():
         print '\t"' + indicator + '": ['
         print '\t\t{x: 0, y: 0.0},'
         for num_containers, measure in imeasures.items():
-            print '\t\t{x: %d, y: %f},' % (num_containers, measure)
+            summary = ''
+            if summaries and num_containers in summaries[indicator]:
+                names = ['p%d' % percentile for percentile in PERCENTILES] + ['ci_low', 'ci_high']
+                summary = ''.join(', %s: %f' % item for item in zip(names, summaries[indicator][num_containers]))
+            print '\t\t{x: %d, y: %f%s},' % (num_containers, measure, summary)
         print '\t],'
     print '}'
 
@@ -45,47 +58,225 @@ def create_dictionary(contains_dicts=True, fields=ALL_FIELDS):
             ret[field] = []
     return ret
 
-def main(database_file, log_file):
-    print "Generating plots..."
-    dao = PerformanceTestDAO(database_file)
-    session = dao.get_session()
+def fetch_array(session, query):
+    """Runs the query in a single statement and returns its rows as a 2D array of floats (NULL values become NaN)."""
+    statement = query.statement.compile(session.bind, compile_kwargs={'literal_binds': True})
+    cursor = session.connection().connection.cursor()
+    try:
+        cursor.execute(str(statement))
+        rows = cursor.fetchall()
+    finally:
+        cursor.close()
+    return numpy.array(rows, dtype=numpy.float64).reshape(-1, len(query.column_descriptions))
+
+def group_sum(groups, values, number_of_groups):
+    return numpy.bincount(groups, weights=values, minlength=number_of_groups)
+
+def group_mean(groups, values, number_of_groups):
+    with numpy.errstate(invalid='ignore', divide='ignore'):  # Empty groups have NaN as mean
+        return group_sum(groups, values, number_of_groups) / numpy.bincount(groups, minlength=number_of_groups)
+
+def ended_runs_query(session):
+    return session.query(Run.id, Run.test_id, DiskRequired.size, ResponseTime.time). \
+                outerjoin(DiskRequired, DiskRequired.run_id == Run.id). \
+                outerjoin(ResponseTime, ResponseTime.run_id == Run.id). \
+                filter(Run.ended != None). \
+                order_by(Run.id)
+
+def container_measures_query(session, *columns):
+    """Measures of the containers without errors in the ended runs."""
+    measure_table = columns[0].class_
+    return session.query(Container.run_id, *columns). \
+                join(Run, Run.id == Container.run_id). \
+                join(measure_table, measure_table.container_id == Container.id). \
+                outerjoin(ExecutionError, ExecutionError.container_id == Container.id). \
+                filter(Run.ended != None, ExecutionError.id == None)
+
+# Columns of the measures per container and the fields calculated with each of them (total and per container)
+CPU_FIELDS = ((CPU_TOTAL, CPU_TOTAL_PC), (CPU_PERC, CPU_PERC_PC))
+MEMORY_FIELDS = ((MEMORY, MEMORY_PC), (MEMORY_MAX, MEMORY_MAX_PC), (MEMORY_PERC, MEMORY_PERC_PC))
+
+# Files of the columnar export: a NumPy array per table and column
+COLUMNS = OrderedDict((
+    ('run', ('id', 'test_id', 'disk', 'response')),
+    ('cpu', ('run_id', 'total', 'percentage', 'container_id')),
+    ('memory', ('run_id', 'usage', 'maximum', 'percentage', 'container_id')),
+))
+TEST_FILE = 'test.json'
+
+def compute_per_run(runs, cpu, memory):
+    """
+    :param runs: columns with the identifier, test, disk and response time of each run (sorted by identifier).
+    :param cpu: columns with the run, total and percentage of CPU of each container.
+    :param memory: columns with the run, usage, maximum and percentage of memory of each container.
+    """
+    run_ids = runs[0]
+    per_run = { SIZE: runs[2], RESPONSE_TIME: runs[3] }
+    number_of_runs = len(run_ids)
+    for measures, fields in ((cpu, CPU_FIELDS), (memory, MEMORY_FIELDS)):
+        # Position of the run of each container in run_ids
+        groups = numpy.searchsorted(run_ids, measures[0])
+        for column, (total_field, per_container_field) in enumerate(fields, 1):
+            per_run[total_field] = group_sum(groups, measures[column], number_of_runs)
+            per_run[per_container_field] = group_mean(groups, measures[column], number_of_runs)
+    return run_ids, runs[1], per_run
+
+def aggregate_per_test(tests, run_test_ids, per_run):
+    """
+    :param tests: list of tuples (identifier, number of containers) sorted by number of containers.
+    """
     measures = create_dictionary()
-    for test in session.query(Test).order_by(Test.number_of_containers):
-        per_run = create_dictionary(contains_dicts=False)
-        for run in test.runs:
-            if run.ended:  # Ignore runs which have not ended
-                per_container = create_dictionary(contains_dicts=False, fields=(CPU_TOTAL, CPU_PERC, MEMORY, MEMORY_MAX, MEMORY_PERC))
-                for container in run.containers:
-                    if not container.error:
-                        per_container[CPU_TOTAL].append(container.cpu.total_cpu)
-                        per_container[CPU_PERC].append(container.cpu.percentual_cpu)
-                        per_container[MEMORY].append(container.memory.usage)
-                        per_container[MEMORY_MAX].append(container.memory.maximum)
-                        per_container[MEMORY_PERC].append(container.memory.percentual)
-                per_run[SIZE].append(run.disk.size)
-                per_run[RESPONSE_TIME].append(run.response_time.time)
-                per_run[CPU_TOTAL].append(numpy.sum(per_container[CPU_TOTAL]))
-                per_run[CPU_TOTAL_PC].append(numpy.mean(per_container[CPU_TOTAL]))
-                per_run[CPU_PERC].append(numpy.sum(per_container[CPU_PERC]))
-                per_run[CPU_PERC_PC].append(numpy.mean(per_container[CPU_PERC]))
-                per_run[MEMORY].append(numpy.sum(per_container[MEMORY]))
-                per_run[MEMORY_PC].append(numpy.mean(per_container[MEMORY]))
-                per_run[MEMORY_MAX].append(numpy.sum(per_container[MEMORY_MAX]))
-                per_run[MEMORY_MAX_PC].append(numpy.mean(per_container[MEMORY_MAX]))
-                per_run[MEMORY_PERC].append(numpy.sum(per_container[MEMORY_PERC]))
-                per_run[MEMORY_PERC_PC].append(numpy.mean(per_container[MEMORY_PERC]))
+    test_ids = numpy.array([test_id for test_id, _ in tests], dtype=numpy.float64)
+    # Tests are not sorted by identifier, so we need the sorted positions to locate them
+    sorter = numpy.argsort(test_ids)
+    groups = sorter[numpy.searchsorted(test_ids, run_test_ids, sorter=sorter)]
+    per_test = dict((field, group_mean(groups, per_run[field], len(tests))) for field in measures)
+    for position, (_, number_of_containers) in enumerate(tests):
         for key in measures:
-            measures[key][test.number_of_containers] = numpy.mean(per_run[key])
-    generate_data_json(measures)
+            measures[key][number_of_containers] = per_test[key][position]
+    return measures
+
+def summarise_per_test(tests, run_test_ids, per_run, confidence=0.95):
+    """
+    Returns the percentiles (see PERCENTILES) of the runs of each test and the bounds of the
+    confidence interval of their mean (NaN if they cannot be calculated).
+    :param tests: list of tuples (identifier, number of containers) sorted by number of containers.
+    """
+    summaries = create_dictionary()
+    for test_id, number_of_containers in tests:
+        in_test = run_test_ids == test_id
+        for field in summaries:
+            values = per_run[field][in_test]
+            values = values[~numpy.isnan(values)]
+            percentiles = tuple(numpy.percentile(values, PERCENTILES)) if len(values) else (numpy.nan,) * len(PERCENTILES)
+            summaries[field][number_of_containers] = percentiles + confidence_interval(values, confidence)[1:]
+    return summaries
+
+def _to_column(value):
+    return None if numpy.isnan(value) else float(value)
 
+def _to_array(values):
+    return numpy.array([numpy.nan if value is None else value for value in values], dtype=numpy.float64)
+
+def update_test_aggregates(session, test_ids):
+    """Calculates the aggregates of the tests from the aggregates of their runs."""
+    for test_id in test_ids:
+        runs = session.query(RunAggregate).filter(RunAggregate.test_id == test_id).order_by(RunAggregate.run_id).all()
+        groups = numpy.zeros(len(runs), dtype=numpy.int64)
+        aggregate = TestAggregate(test_id=test_id, runs=len(runs))
+        for field in ALL_FIELDS:
+            values = _to_array([getattr(run, field) for run in runs])
+            setattr(aggregate, field, _to_column(group_mean(groups, values, 1)[0]))
+        session.query(TestAggregate).filter(TestAggregate.test_id == test_id).delete()
+        session.add(aggregate)
+
+def update_aggregates(session, run_ids):
+    """Calculates the aggregates of the given ended runs and updates the aggregates of their tests."""
+    runs = fetch_array(session, ended_runs_query(session).filter(Run.id.in_(run_ids)))
+    cpu = fetch_array(session, container_measures_query(session, CpuRequired.total_cpu, CpuRequired.percentual_cpu).
+                                    filter(Run.id.in_(run_ids)))
+    memory = fetch_array(session, container_measures_query(session, MemoryRequired.usage, MemoryRequired.maximum,
+                                                           MemoryRequired.percentual).filter(Run.id.in_(run_ids)))
+    aggregated_ids, run_test_ids, per_run = compute_per_run(runs.T, cpu.T, memory.T)
+    session.query(RunAggregate).filter(RunAggregate.run_id.in_(run_ids)).delete(synchronize_session=False)
+    for position, (run_id, test_id) in enumerate(zip(aggregated_ids, run_test_ids)):
+        aggregate = RunAggregate(run_id=int(run_id), test_id=int(test_id))
+        for field in ALL_FIELDS:
+            setattr(aggregate, field, _to_column(per_run[field][position]))
+        session.add(aggregate)
+    session.flush()
+    update_test_aggregates(session, set(int(test_id) for test_id in run_test_ids))
+    session.commit()
+
+def update_missing_aggregates(session):
+    """Aggregates the ended runs which have not been aggregated yet (e.g., the ones run by previous versions)."""
+    missing = [run_id for (run_id,) in session.query(Run.id).
+                    outerjoin(RunAggregate, RunAggregate.run_id == Run.id).
+                    filter(Run.ended != None, RunAggregate.id == None)]
+    if missing:
+        update_aggregates(session, missing)
+
+def read_aggregates(session):
+    """Returns the measures of each test from their aggregates."""
+    measures = create_dictionary()
+    tests = session.query(Test.number_of_containers, TestAggregate). \
+                outerjoin(TestAggregate, TestAggregate.test_id == Test.id). \
+                order_by(Test.number_of_containers)
+    for number_of_containers, aggregate in tests:
+        for field in measures:
+            value = getattr(aggregate, field) if aggregate else None
+            measures[field][number_of_containers] = numpy.nan if value is None else value
+    return measures
+
+def read_run_aggregates(session):
+    """Returns the tests, the test of each aggregated run and a dictionary with the value of each field per run."""
+    tests = session.query(Test.id, Test.number_of_containers).order_by(Test.number_of_containers).all()
+    runs = session.query(RunAggregate).order_by(RunAggregate.run_id).all()
+    per_run = dict((field, _to_array([getattr(run, field) for run in runs])) for field in ALL_FIELDS)
+    return tests, numpy.array([run.test_id for run in runs], dtype=numpy.float64), per_run
+
+def load_columns(directory):
+    """
+    Reads the tests exported to the directory (see export_columns.py).
+    Yields each test (identifier and number of containers) and its columns (memory-mapped) per table.
+    """
+    for test_directory in sorted(os.listdir(directory)):
+        path = os.path.join(directory, test_directory)
+        if not os.path.isfile(os.path.join(path, TEST_FILE)):
+            continue
+        with open(os.path.join(path, TEST_FILE)) as test_file:
+            test = json.load(test_file)
+        columns = dict((table, [numpy.load(os.path.join(path, '%s.%s.npy' % (table, name)), mmap_mode='r')
+                                for name in names])
+                       for table, names in COLUMNS.items())
+        yield (test['id'], test['number_of_containers']), columns
+
+def aggregate_columns(directory, confidence=0.95):
+    """
+    Returns the measures of each test and their summaries (see summarise_per_test).
+    The measures of the containers of each test are aggregated per run where they are mapped,
+    so only the values per run of all the tests are kept in memory.
+    """
+    tests = []
+    run_test_ids = []
+    per_run = {}
+    for test, columns in load_columns(directory):
+        tests.append(test)
+        runs = columns['run']
+        # Runs must be sorted by identifier to locate them
+        order = numpy.argsort(runs[0])
+        _, test_ids, test_per_run = compute_per_run([column[order] for column in runs],
+                                                    columns['cpu'], columns['memory'])
+        run_test_ids.append(test_ids)
+        for field, values in test_per_run.items():
+            per_run.setdefault(field, []).append(values)
+    run_test_ids = numpy.concatenate(run_test_ids) if run_test_ids else numpy.empty(0)
+    per_run = dict((field, numpy.concatenate(per_run.get(field, [numpy.empty(0)]))) for field in ALL_FIELDS)
+    tests.sort(key=lambda test: test[1])
+    return aggregate_per_test(tests, run_test_ids, per_run), summarise_per_test(tests, run_test_ids, per_run, confidence)
+
+def main(database_file, log_file, columns_directory=None, confidence=0.95):
+    print "Generating plots..."
+    if columns_directory:
+        generate_data_json(*aggregate_columns(columns_directory, confidence))
+    else:
+        dao = PerformanceTestDAO(database_file)
+        session = dao.get_session()
+        update_missing_aggregates(session)
+        summaries = summarise_per_test(*read_run_aggregates(session), confidence=confidence)
+        generate_data_json(read_aggregates(session), summaries)
 
 
 def entry_point():
     parser = ArgumentParser(description='Generate plots for a benchmark.')
     parser.add_argument('-db', default='/tmp/benchmark.db', dest='database', help='Database file.')
     parser.add_argument('-output', default='/tmp/plots', dest='plot_folder', help='Folder where plots will be saved.')
+    parser.add_argument('-columns', dest='columns', help='Directory with the measures exported by export_columns.py ' +
+                            '(it is read instead of the database).')
+    parser.add_argument('-confidence', default=0.95, type=float, dest='confidence',
+                            help='Confidence level of the intervals shown next to each mean.')
     args = parser.parse_args()
-    main(args.database, args.plot_folder)
+    main(args.database, args.plot_folder, args.columns, args.confidence)
 
 
 if __name__ == "__main__":
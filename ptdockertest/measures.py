@@ -4,44 +4,540 @@ Created on 30/10/2015
 Classes to take measures.
 """
 
+import os
+import stat
+import time
+import errno
+import json
+import select
+import socket
+import numpy
 import logging
 import subprocess
+from itertools import cycle, islice
+from threading import Thread, Event, Lock, Condition
+from multiprocessing.pool import ThreadPool
 from humanfriendly import format_size, parse_size
 import ptchecker
+try:
+    from os import scandir  # Python 3.5+
+except ImportError:
+    try:
+        from scandir import scandir  # Backport
+    except ImportError:
+        scandir = None
 
 
 class ResponseTimeMeter(object):
 
-    def __init__(self, checker_jar_path, ipc_port):
+    def __init__(self, checker_jar_path, ipc_port, host='localhost'):
         self.response_time = None
         self._jar_path = checker_jar_path
+        self._host = host
         self._port = ipc_port
 
     def measure(self, timeout):
+        if not self._jar_path:
+            logging.warning('Response time not measured: no checker has been configured.')
+            return
         try:
             logging.info('Measuring response time.')
-            self.response_time = ptchecker.get_roundtrip_time(self._jar_path, 'localhost', self._port, float(timeout))
+            self.response_time = ptchecker.get_roundtrip_time(self._jar_path, self._host, self._port, float(timeout))
             logging.info('Response time: %d.' % self.response_time)
         except ptchecker.TimeoutError as e:
             self.response_time = -1
             logging.error('The instance could not be contacted: %s.' % e)
 
 
-class DockerMeter(object):
+class LatencyHistogram(object):
+    """
+    HDR-style histogram: buckets are linear within each power of two, so the relative error of the
+    recorded values is bounded (below 1/2^(sub_bucket_bits-1)) with a fixed and small number of counters.
+    Values are positive integers (e.g., milliseconds).
+    """
+    def __init__(self, sub_bucket_bits=7, max_value_bits=40):
+        self._sub_bits = sub_bucket_bits
+        self._half = 1 << (sub_bucket_bits - 1)
+        self._counts = numpy.zeros((max_value_bits - sub_bucket_bits + 2) << (sub_bucket_bits - 1), dtype=numpy.int64)
+        self.total = 0
+        self.minimum = None
+        self.maximum = None
+        self._sum = 0
+
+    def _index(self, value):
+        if value < (1 << self._sub_bits):
+            return value
+        shift = value.bit_length() - self._sub_bits
+        return (shift << (self._sub_bits - 1)) + (value >> shift)
+
+    def _value(self, index):
+        """Returns the middle value of a bucket."""
+        if index < (1 << self._sub_bits):
+            return float(index)
+        shift = (index >> (self._sub_bits - 1)) - 1
+        mantissa = index - (shift << (self._sub_bits - 1))
+        return (mantissa << shift) + ((1 << shift) - 1) / 2.0
+
+    def record(self, value):
+        value = max(0, int(value))
+        self._counts[min(self._index(value), len(self._counts) - 1)] += 1
+        self.total += 1
+        self._sum += value
+        self.minimum = value if self.minimum is None else min(self.minimum, value)
+        self.maximum = value if self.maximum is None else max(self.maximum, value)
+
+    def merge(self, other):
+        self._counts += other._counts
+        self.total += other.total
+        self._sum += other._sum
+        for value in (other.minimum, other.maximum):
+            if value is not None:
+                self.minimum = value if self.minimum is None else min(self.minimum, value)
+                self.maximum = value if self.maximum is None else max(self.maximum, value)
+
+    def mean(self):
+        return self._sum / float(self.total) if self.total else None
+
+    def percentile(self, percentile):
+        if not self.total:
+            return None
+        if percentile >= 100:
+            return float(self.maximum)
+        rank = max(1, int(numpy.ceil(percentile / 100.0 * self.total)))
+        index = numpy.searchsorted(numpy.cumsum(self._counts), rank)
+        return min(self._value(int(index)), self.maximum)
+
+
+class ResponseTimeLoadMeter(object):
+    """
+    It probes the IPC port of several containers concurrently during a period of time.
+    Like ResponseTimeMeter, response_time contains a single value (the median) which summarizes the measure.
+    """
+    def __init__(self, checker_jar_path, ipc_ports, duration, concurrency=10, host='localhost'):
+        self.response_time = None
+        self.histogram = LatencyHistogram()
+        self.errors = 0
+        self._jar_path = checker_jar_path
+        self._host = host
+        self._ports = ipc_ports
+        self._duration = duration
+        self._concurrency = concurrency
 
+    def _probe(self, worker, deadline, timeout):
+        histogram = LatencyHistogram()
+        errors = 0
+        # Each worker starts with a different container
+        for port in islice(cycle(self._ports), worker, None):
+            if time.time() >= deadline:
+                break
+            try:
+                histogram.record(ptchecker.get_roundtrip_time(self._jar_path, self._host, port, float(timeout)))
+            except ptchecker.TimeoutError as e:
+                errors += 1
+                logging.debug('The instance at port %d could not be contacted: %s.' % (port, e))
+        return histogram, errors
+
+    def measure(self, timeout):
+        logging.info('Measuring response time of %d containers during %d seconds.' % (len(self._ports), self._duration))
+        deadline = time.time() + self._duration
+        pool = ThreadPool(self._concurrency)
+        try:
+            results = pool.map(lambda worker: self._probe(worker, deadline, timeout), range(self._concurrency))
+        finally:
+            pool.close()
+            pool.join()
+        for histogram, errors in results:
+            self.histogram.merge(histogram)
+            self.errors += errors
+        self.response_time = self.histogram.percentile(50) if self.histogram.total else -1
+        logging.info('Response time: %s (%d probes, %d errors).' % (self.response_time, self.histogram.total, self.errors))
+
+
+def _directory_size(path):
+    """Returns the bytes that the files in a directory tree (without following links) use in disk."""
+    total = 0
+    pending = [path]
+    while pending:
+        current = pending.pop()
+        try:
+            if scandir:
+                for entry in scandir(current):
+                    if entry.is_dir(follow_symlinks=False):
+                        pending.append(entry.path)
+                    total += entry.stat(follow_symlinks=False).st_blocks * 512
+            else:
+                for name in os.listdir(current):
+                    entry_path = os.path.join(current, name)
+                    info = os.lstat(entry_path)
+                    if stat.S_ISDIR(info.st_mode):
+                        pending.append(entry_path)
+                    total += info.st_blocks * 512
+        except OSError as e:
+            logging.debug('"%s" could not be read: %s.' % (current, e))
+    return total
+
+
+class DevicemapperDiskAccounting(object):
+    """
+    Data used by Docker according to the devicemapper storage driver.
+    It does not provide sizes per container.
+    """
     def __init__(self, allocate_docker):
         self.allocate = allocate_docker
-        self.init_size = None
-        self.init_size_du = None
 
-    def _get_disk_size(self):
+    def get_total_size(self):
         """Returns data used by Docker in bytes."""
         # docker.info() returns an awful data structure...
         with self.allocate() as docker:
-            for field in docker.info()['DriverStatus']:
-                if field[0]=='Data Space Used':
-                    return parse_size(field[1])  # Value in bytes
-            logging.error('"Data Space Used" field was not found in the data returned by Docker.')
+            info = docker.info()
+        for field in info.get('DriverStatus') or []:
+            if field[0]=='Data Space Used':
+                return parse_size(field[1])  # Value in bytes
+        raise ValueError('Docker does not report "Data Space Used" (its storage driver is "%s"), ' % info.get('Driver') +
+                         'so the devicemapper disk accounting cannot be used.')
+
+    def get_sizes(self, container_ids):
+        return {}
+
+
+class InspectDiskAccounting(object):
+    """
+    Size of the writable layer of each container as calculated by Docker.
+    The sizes of all the containers are obtained with a single request.
+    """
+    def __init__(self, allocate_docker):
+        self.allocate = allocate_docker
+
+    def get_total_size(self):
+        return None
+
+    def get_sizes(self, container_ids):
+        """Returns a dictionary with the bytes used by the writable layer of each container."""
+        wanted = set(container_ids)
+        with self.allocate() as docker:
+            containers = docker.containers(all=True, size=True)
+        return dict((c['Id'], c.get('SizeRw', 0)) for c in containers if c['Id'] in wanted)
+
+
+class OverlayDiskAccounting(object):
+    """
+    Size of the writable layer (i.e., upper directory) of each container using the overlay storage driver.
+    The directories are scanned in parallel, so it requires permissions to read Docker's root directory.
+    """
+    def __init__(self, allocate_docker, workers=8):
+        self.allocate = allocate_docker
+        self._workers = workers
+        self._upper_dirs = {}
+
+    def get_total_size(self):
+        return None
+
+    def _get_upper_dir(self, container_id):
+        if container_id not in self._upper_dirs:
+            with self.allocate() as docker:
+                info = docker.inspect_container(container_id)
+            self._upper_dirs[container_id] = info['GraphDriver']['Data']['UpperDir']
+        return self._upper_dirs[container_id]
+
+    def get_sizes(self, container_ids):
+        """Returns a dictionary with the bytes used by the writable layer of each container."""
+        upper_dirs = [self._get_upper_dir(container_id) for container_id in container_ids]
+        pool = ThreadPool(self._workers)
+        try:
+            sizes = pool.map(_directory_size, upper_dirs)
+        finally:
+            pool.close()
+            pool.join()
+        return dict(zip(container_ids, sizes))
+
+
+DISK_ACCOUNTING = {
+    'devicemapper': DevicemapperDiskAccounting,
+    'inspect': InspectDiskAccounting,
+    'overlay': OverlayDiskAccounting,
+}
+
+AUTO_DISK_ACCOUNTING = 'auto'
+
+def detect_disk_accounting(allocate_docker):
+    """Returns the disk accounting suitable for Docker's storage driver."""
+    with allocate_docker() as docker:
+        driver = docker.info().get('Driver')
+    # The rest of the drivers do not report the space used, but Docker calculates the size of each container
+    name = 'devicemapper' if driver == 'devicemapper' else 'inspect'
+    logging.info('Disk measured with the %s accounting (Docker uses the %s storage driver).' % (name, driver))
+    return name
+
+def create_disk_accounting(name, allocate_docker):
+    if name == AUTO_DISK_ACCOUNTING:
+        name = detect_disk_accounting(allocate_docker)
+    try:
+        return DISK_ACCOUNTING[name](allocate_docker)
+    except KeyError:
+        raise ValueError('Unknown disk accounting "%s". Valid values: %s.' %
+                         (name, ', '.join((AUTO_DISK_ACCOUNTING,) + tuple(DISK_ACCOUNTING))))
+
+
+class CgroupStatsCollector(object):
+    """
+    It reads the stats of the containers from their cgroup (v1 or v2) accounting files instead of using
+    Docker's stats API, which blocks for about a second per container and goes through the limited clients.
+
+    The stats returned have the same shape as Docker's (at least the fields used by DockerContainerMeter).
+    The containers registered are read in a single pass, which is reused by the containers measured shortly after.
+    The roots are configurable, so it can read a fake tree.
+    """
+    # Cgroup of each container according to Docker's cgroup driver
+    GROUPS = {
+        'cgroupfs': 'docker/%s',
+        'systemd': 'system.slice/docker-%s.scope',
+    }
+
+    def __init__(self, root='/sys/fs/cgroup', driver='cgroupfs', proc_root='/proc', max_age=0.2):
+        if driver not in CgroupStatsCollector.GROUPS:
+            raise ValueError('Unknown cgroup driver "%s". Valid values: %s.' % (driver, ', '.join(CgroupStatsCollector.GROUPS)))
+        self._root = root
+        self._group = CgroupStatsCollector.GROUPS[driver]
+        self._proc_root = proc_root
+        self._max_age = max_age
+        # cgroup v2 has a single hierarchy
+        self.unified = os.path.exists(os.path.join(root, 'cgroup.controllers'))
+        self._clock_ticks = os.sysconf('SC_CLK_TCK')
+        self._container_ids = []
+        self._snapshot = {}
+        self._snapshot_time = 0
+        self._lock = Lock()
+
+    def register(self, container_id):
+        with self._lock:
+            self._container_ids.append(container_id)
+
+    def _read(self, *path):
+        with open(os.path.join(*path)) as f:
+            return f.read().strip()
+
+    def _read_keyed(self, *path):
+        """Reads files with a 'key value' pair per line."""
+        return dict((key, int(value)) for key, value in (line.split() for line in self._read(*path).splitlines()))
+
+    def _read_system(self):
+        """Returns the CPU time of the host in nanoseconds, its online CPUs and its memory in bytes."""
+        system_cpu, cpus = 0, 0
+        with open(os.path.join(self._proc_root, 'stat')) as stat:
+            for line in stat:
+                if line.startswith('cpu '):
+                    # Like Docker: user, nice, system, idle, iowait, irq and softirq
+                    ticks = sum(int(field) for field in line.split()[1:8])
+                    system_cpu = ticks * 1000000000 // self._clock_ticks
+                elif line.startswith('cpu'):
+                    cpus += 1
+        memory = None
+        with open(os.path.join(self._proc_root, 'meminfo')) as meminfo:
+            for line in meminfo:
+                if line.startswith('MemTotal:'):
+                    memory = int(line.split()[1]) * 1024
+                    break
+        return system_cpu, cpus, memory
+
+    def _read_v1(self, group):
+        cpu = int(self._read(self._root, 'cpuacct', group, 'cpuacct.usage'))
+        percpu = [int(v) for v in self._read(self._root, 'cpuacct', group, 'cpuacct.usage_percpu').split()]
+        memory = os.path.join(self._root, 'memory', group)
+        usage = int(self._read(memory, 'memory.usage_in_bytes'))
+        max_usage = int(self._read(memory, 'memory.max_usage_in_bytes'))
+        limit = int(self._read(memory, 'memory.limit_in_bytes'))
+        io = {'Read': 0, 'Write': 0}
+        blkio = os.path.join(self._root, 'blkio', group, 'blkio.throttle.io_service_bytes')
+        if os.path.exists(blkio):
+            for line in self._read(blkio).splitlines():
+                fields = line.split()  # E.g., '8:0 Read 4096'
+                if len(fields) == 3 and fields[1] in io:
+                    io[fields[1]] += int(fields[2])
+        return cpu, percpu, usage, max_usage, limit, io['Read'], io['Write']
+
+    def _read_v2(self, group):
+        directory = os.path.join(self._root, group)
+        cpu = self._read_keyed(directory, 'cpu.stat')['usage_usec'] * 1000
+        usage = int(self._read(directory, 'memory.current'))
+        # memory.peak is only available since Linux 5.19
+        max_usage = int(self._read(directory, 'memory.peak')) if os.path.exists(os.path.join(directory, 'memory.peak')) else usage
+        limit = self._read(directory, 'memory.max')
+        read = written = 0
+        if os.path.exists(os.path.join(directory, 'io.stat')):
+            for line in self._read(directory, 'io.stat').splitlines():
+                fields = dict(field.split('=') for field in line.split()[1:])  # E.g., '8:0 rbytes=4096 wbytes=0 ...'
+                read += int(fields.get('rbytes', 0))
+                written += int(fields.get('wbytes', 0))
+        return cpu, [], usage, max_usage, None if limit == 'max' else int(limit), read, written
+
+    def _read_container(self, container_id, system):
+        try:
+            read = self._read_v2 if self.unified else self._read_v1
+            cpu, percpu, usage, max_usage, limit, read_bytes, written_bytes = read(self._group % container_id)
+        except (IOError, OSError, KeyError, ValueError) as e:
+            raise IOError('The cgroup of container "%s" could not be read: %s' % (container_id, e))
+        system_cpu, cpus, host_memory = system
+        return {
+            'cpu_stats': {
+                'cpu_usage': { 'total_usage': cpu, 'percpu_usage': percpu },
+                'system_cpu_usage': system_cpu,
+                'online_cpus': cpus,
+            },
+            'memory_stats': {
+                'usage': usage,
+                'max_usage': max_usage,
+                # Like Docker, the memory of the host if it is not limited
+                'limit': min(limit, host_memory) if limit else host_memory,
+            },
+            'blkio_stats': {
+                'io_service_bytes_recursive': [ {'op': 'Read', 'value': read_bytes},
+                                                {'op': 'Write', 'value': written_bytes} ],
+            },
+        }
+
+    def collect(self):
+        """Reads the stats of all the registered containers (the ones which are not running are ignored)."""
+        system = self._read_system()
+        snapshot = {}
+        for container_id in self._container_ids:
+            try:
+                snapshot[container_id] = self._read_container(container_id, system)
+            except IOError:
+                pass
+        self._snapshot, self._snapshot_time = snapshot, time.time()
+        return snapshot
+
+    def get_stats(self, container_id):
+        """Returns the stats of a container, reusing the last pass if it is recent enough."""
+        with self._lock:
+            if time.time() - self._snapshot_time > self._max_age:
+                self.collect()
+            if container_id not in self._snapshot:
+                # E.g., it has been started after the last pass
+                self._snapshot[container_id] = self._read_container(container_id, self._read_system())
+            return self._snapshot[container_id]
+
+
+STATS_COLLECTORS = ('docker', 'cgroup')
+
+def create_stats_collector(name, cgroup_root='/sys/fs/cgroup', cgroup_driver='cgroupfs'):
+    """Returns None if the stats are taken from Docker's API."""
+    if name == 'docker':
+        return None
+    elif name == 'cgroup':
+        return CgroupStatsCollector(cgroup_root, cgroup_driver)
+    raise ValueError('Unknown stats collector "%s". Valid values: %s.' % (name, ', '.join(STATS_COLLECTORS)))
+
+
+class SharedMemoryMeter(object):
+    """
+    It measures the memory of the processes of each container from their smaps, accounting the pages shared
+    with other processes (e.g., the libraries of identical containers) proportionally (PSS) instead of
+    once per container, as its cgroup does. Also the memory saved by KSM (kernel same-page merging).
+
+    The processes are found in the cgroup of the container, so Docker must run in this host.
+    """
+    # Fields of smaps (in kB) accumulated per container
+    FIELDS = ('Rss', 'Pss', 'Shared_Clean', 'Shared_Dirty', 'Private_Clean', 'Private_Dirty', 'SwapPss')
+
+    def __init__(self, cgroup_root='/sys/fs/cgroup', cgroup_driver='cgroupfs', proc_root='/proc',
+                 ksm_root='/sys/kernel/mm/ksm'):
+        if cgroup_driver not in CgroupStatsCollector.GROUPS:
+            raise ValueError('Unknown cgroup driver "%s". Valid values: %s.' %
+                             (cgroup_driver, ', '.join(CgroupStatsCollector.GROUPS)))
+        self._group = CgroupStatsCollector.GROUPS[cgroup_driver]
+        # cgroup v2 has a single hierarchy
+        unified = os.path.exists(os.path.join(cgroup_root, 'cgroup.controllers'))
+        self._cgroup_root = cgroup_root if unified else os.path.join(cgroup_root, 'memory')
+        self._proc_root = proc_root
+        self._ksm_root = ksm_root
+        self._page_size = os.sysconf('SC_PAGE_SIZE')
+
+    def get_pids(self, container_id):
+        with open(os.path.join(self._cgroup_root, self._group % container_id, 'cgroup.procs')) as procs:
+            return [int(pid) for pid in procs.read().split()]
+
+    def _read_smaps(self, pid, totals):
+        process = os.path.join(self._proc_root, str(pid))
+        # smaps_rollup is only available since Linux 4.14 (and it is much cheaper than smaps)
+        path = os.path.join(process, 'smaps_rollup')
+        if not os.path.exists(path):
+            path = os.path.join(process, 'smaps')
+        with open(path) as smaps:
+            for line in smaps:
+                fields = line.split()
+                key = fields[0].rstrip(':')
+                if key in totals:
+                    totals[key] += int(fields[1])
+
+    def _read_ksm_merging_pages(self, pid):
+        """Returns the pages of a process merged by KSM or None if it is unknown (before Linux 5.19)."""
+        try:
+            with open(os.path.join(self._proc_root, str(pid), 'ksm_merging_pages')) as merging:
+                return int(merging.read())
+        except (IOError, ValueError):
+            return None
+
+    def measure(self, container_id):
+        """Returns the memory of the processes of a container (in bytes)."""
+        try:
+            pids = self.get_pids(container_id)
+        except IOError as e:
+            raise IOError('The processes of container "%s" could not be found: %s' % (container_id, e))
+        totals = dict((field, 0) for field in SharedMemoryMeter.FIELDS)
+        processes = 0
+        ksm_merging = None
+        for pid in pids:
+            try:
+                self._read_smaps(pid, totals)
+            except IOError:
+                continue  # The process has finished
+            processes += 1
+            merging = self._read_ksm_merging_pages(pid)
+            if merging is not None:
+                ksm_merging = (ksm_merging or 0) + merging
+        if not processes:
+            raise IOError('The memory of the processes of container "%s" could not be read.' % container_id)
+        return {
+            'processes': processes,
+            'rss': totals['Rss'] * 1024,
+            'pss': totals['Pss'] * 1024,
+            'uss': (totals['Private_Clean'] + totals['Private_Dirty']) * 1024,
+            'shared': (totals['Shared_Clean'] + totals['Shared_Dirty']) * 1024,
+            'swap_pss': totals['SwapPss'] * 1024,
+            'ksm_merged': None if ksm_merging is None else ksm_merging * self._page_size,
+        }
+
+    def _read_ksm(self, name):
+        with open(os.path.join(self._ksm_root, name)) as f:
+            return int(f.read())
+
+    def get_ksm(self):
+        """Returns the pages merged by KSM in the host and the memory saved (in bytes) or None if it is not running."""
+        try:
+            if self._read_ksm('run') != 1:
+                return None
+            pages_sharing = self._read_ksm('pages_sharing')
+            return {
+                'pages_shared': self._read_ksm('pages_shared'),  # Merged pages
+                'pages_sharing': pages_sharing,  # Pages which point to them (i.e., saved)
+                'pages_unshared': self._read_ksm('pages_unshared'),
+                'saved': pages_sharing * self._page_size,
+            }
+        except (IOError, ValueError):
+            return None
+
+
+class DockerMeter(object):
+
+    def __init__(self, allocate_docker, disk_accounting=None, compare_du=False, stats_collector=None):
+        self.allocate = allocate_docker
+        self.disk = disk_accounting or DevicemapperDiskAccounting(allocate_docker)
+        self.stats_collector = stats_collector  # If None, Docker's stats API is used
+        self.container_ids = []  # Containers of the run
+        self.init_size = None
+        self.init_size_du = None
+        self._compare_du = compare_du
 
     def _get_disk_size_du(self):
         """Returns in Docker's root directory size in KBs."""
@@ -65,23 +561,364 @@ class DockerMeter(object):
             logging.warning('du measures %s less than docker.info().' % format_size(difference*-1))
 
     def record_init_disk_size(self):
-        self.init_size = self._get_disk_size()
-        #self.init_size_du = self._get_disk_size_du()
+        self.init_size = self.disk.get_total_size()
+        if self._compare_du:
+            self.init_size_du = self._get_disk_size_du()
+
+    def get_container_sizes(self):
+        """Returns a dictionary with the bytes used by each container of the run."""
+        return self.disk.get_sizes(self.container_ids)
 
     def get_disk_size_increase(self):
-        folder_size_increase = self._get_disk_size() - self.init_size
-        #post_size_du = self._get_disk_size_du()
-        if self.init_size_du and post_size_du:
-            folder_size_increase_du = post_size_du - self.init_size_du
-            self._log_measure_comparison(folder_size_increase, folder_size_increase_du * 1024)
+        """Returns the bytes used by the run or None if they could not be measured."""
+        if self.init_size is not None:
+            folder_size_increase = self.disk.get_total_size() - self.init_size
         else:
-            logging.warning('At least one of the du measures could not be get and compared to the folder size reported by Docker.')
+            # The containers are created during the run, so all the disk they use is new
+            sizes = self.get_container_sizes()
+            if self.container_ids and not sizes:
+                logging.warning('The size of the containers of the run is unknown, so its disk usage is not stored.')
+                return None
+            folder_size_increase = sum(sizes.values())
+        if self._compare_du and folder_size_increase is not None:
+            post_size_du = self._get_disk_size_du()
+            if self.init_size_du and post_size_du:
+                folder_size_increase_du = post_size_du - self.init_size_du
+                self._log_measure_comparison(folder_size_increase, folder_size_increase_du * 1024)
+            else:
+                logging.warning('At least one of the du measures could not be get and compared to the folder size reported by Docker.')
         return folder_size_increase
 
     def get_container_meter(self, container_id):
+        self.container_ids.append(container_id)
+        if self.stats_collector:
+            self.stats_collector.register(container_id)
+            return CgroupContainerMeter(container_id, self.stats_collector)
         return DockerContainerMeter(container_id, self.allocate)
 
 
+class DiskUsageSampler(object):
+    """
+    It periodically records the size of the writable layer of each container during a run.
+    """
+    def __init__(self, docker_meter, interval, capacity=512):
+        self._meter = docker_meter
+        self._interval = interval
+        self._capacity = capacity
+        self.series = {}  # Time series per container
+        self._stopped = Event()
+        self._thread = None
+
+    def _sample(self):
+        start = time.time()
+        while True:
+            sample_start = time.time()
+            try:
+                for container_id, size in self._meter.get_container_sizes().items():
+                    if container_id not in self.series:
+                        self.series[container_id] = TimeSeries(self._capacity)
+                    self.series[container_id].append(sample_start - start, size)
+            except Exception as e:
+                logging.error('Disk usage could not be sampled: %s.' % e)
+            # The last sample is taken after stop() has been called
+            if self._stopped.wait(max(0, self._interval - (time.time() - sample_start))):
+                break
+
+    def start(self):
+        self._thread = Thread(target=self._sample)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        if self._thread:
+            self._thread.join()
+
+
+class RampSampler(object):
+    """
+    It periodically samples how a run degrades while its containers are started: the containers running,
+    the startup time of the ones started since the previous sample and the response time of the first one.
+
+    Containers are expected to have 'started_at' (None until started), 'elapsed' (startup time) and
+    'thrown_exception' attributes. Sampling finishes once all of them have been started or failed.
+    """
+    def __init__(self, containers, interval=1, response_meter=None, response_timeout=5):
+        self._containers = containers
+        self._interval = interval
+        self._rmeter = response_meter
+        self._response_timeout = response_timeout
+        self.samples = []  # Tuples (elapsed, running, startup_time, response_time)
+        self._stopped = Event()
+        self._thread = None
+
+    def _take_sample(self, start, previous, now):
+        started = [c for c in self._containers if c.started_at and c.started_at <= now]
+        new_startups = [c.elapsed for c in started if c.started_at > previous]
+        startup_time = sum(new_startups) / len(new_startups) if new_startups else None
+        response_time = None
+        if self._rmeter and self._containers[0].started_at:
+            self._rmeter.measure(self._response_timeout)
+            response_time = self._rmeter.response_time
+        self.samples.append((now - start, len(started), startup_time, response_time))
+
+    def _finished(self):
+        return all(c.started_at or c.thrown_exception for c in self._containers)
+
+    def _sample(self, start):
+        previous = 0
+        while True:
+            # Checked before sampling, so the last sample includes every container
+            finished = self._finished()
+            sample_start = time.time()
+            try:
+                self._take_sample(start, previous, sample_start)
+            except Exception as e:
+                logging.error('Ramp could not be sampled: %s.' % e)
+            previous = sample_start
+            if finished or self._stopped.wait(max(0, self._interval - (time.time() - sample_start))):
+                break
+
+    def start(self, start=None):
+        """:param start: timestamp considered the beginning of the ramp."""
+        self._thread = Thread(target=self._sample, args=(start or time.time(),))
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        if self._thread:
+            self._thread.join()
+
+
+class HostSampler(object):
+    """
+    It periodically samples the resources of the host (CPU, memory, paging and disks) from procfs during a run.
+
+    The files are kept open and reread from their beginning, and the samples are stored in preallocated
+    arrays (the raw counters, so the rates are only calculated once the run has finished). When the arrays
+    get full, every other sample is discarded and the interval is doubled.
+    Each sample is labelled with the phase of the run during which it was taken (see end_phase).
+    """
+    FILES = ('stat', 'loadavg', 'meminfo', 'vmstat', 'diskstats')
+    # Raw fields stored per sample (the rest of the columns are the I/O time of each disk in ms)
+    CPU = ('user', 'nice', 'system', 'idle', 'iowait', 'irq', 'softirq', 'steal')  # In clock ticks
+    FIELDS = CPU + ('ctxt', 'procs_running', 'procs_blocked', 'load1', 'MemAvailable', 'Cached', 'Dirty',
+                    'SwapTotal', 'SwapFree', 'pgmajfault', 'pswpin', 'pswpout', 'pgscan', 'sectors_read',
+                    'sectors_written')
+    VMSTAT = ('pgmajfault', 'pswpin', 'pswpout', 'pgscan_kswapd', 'pgscan_direct')
+    VIRTUAL_DISKS = ('loop', 'ram', 'zram', 'dm-', 'md')  # Their I/O is also accounted in the physical disks
+    SECTOR_SIZE = 512  # Bytes per sector in diskstats (regardless of the device)
+
+    def __init__(self, interval, proc_root='/proc', capacity=1024):
+        self._interval = interval
+        self._proc_root = proc_root
+        self._files = dict((name, os.open(os.path.join(proc_root, name), os.O_RDONLY))
+                           for name in HostSampler.FILES)
+        self._columns = dict((field, position) for position, field in enumerate(HostSampler.FIELDS))
+        self.disks = self._find_disks()
+        self._elapsed = numpy.zeros(capacity, dtype=numpy.float64)
+        self._values = numpy.zeros((capacity, len(HostSampler.FIELDS) + len(self.disks)), dtype=numpy.float64)
+        self._phases = numpy.full(capacity, -1, dtype=numpy.int16)  # Position in self.phases (-1 if unknown)
+        self._size = 0
+        self.phases = []  # Names of the phases (in order)
+        self._start = None
+        self._lock = Lock()
+        self._stopped = Event()
+        self._thread = None
+
+    def _read(self, name):
+        fd = self._files[name]
+        os.lseek(fd, 0, os.SEEK_SET)
+        chunks = []
+        while True:
+            chunk = os.read(fd, 65536)
+            if not chunk:
+                return ''.join(chunks)
+            chunks.append(chunk)
+
+    def _find_disks(self):
+        """Returns the physical disks (their partitions and virtual devices are ignored)."""
+        disks = []
+        for line in self._read('diskstats').splitlines():
+            name = line.split()[2]
+            # Partitions are listed after their disk (e.g., sda1 or nvme0n1p1)
+            if not name.startswith(HostSampler.VIRTUAL_DISKS) and not any(name.startswith(disk) for disk in disks):
+                disks.append(name)
+        return disks
+
+    def _read_sample(self, row):
+        columns = self._columns
+        for line in self._read('stat').splitlines():
+            fields = line.split()
+            if fields[0] == 'cpu':
+                # The oldest kernels do not have the steal time
+                for position, value in enumerate(fields[1:len(HostSampler.CPU) + 1]):
+                    row[position] = int(value)
+            elif fields[0] in ('ctxt', 'procs_running', 'procs_blocked'):
+                row[columns[fields[0]]] = int(fields[1])
+        row[columns['load1']] = float(self._read('loadavg').split()[0])
+        for line in self._read('meminfo').splitlines():
+            key, value = line.split()[:2]
+            key = key.rstrip(':')
+            if key in columns:
+                row[columns[key]] = int(value) * 1024  # In kB
+        row[columns['pgscan']] = 0
+        for line in self._read('vmstat').splitlines():
+            key, value = line.split()
+            # Older kernels have a counter per zone (e.g., pgscan_kswapd_normal)
+            if key.startswith(HostSampler.VMSTAT) and key != 'pgscan_direct_throttle':
+                if key.startswith('pgscan'):
+                    row[columns['pgscan']] += int(value)
+                else:
+                    row[columns[key]] = int(value)
+        row[columns['sectors_read']] = row[columns['sectors_written']] = 0
+        for line in self._read('diskstats').splitlines():
+            fields = line.split()
+            if fields[2] in self.disks:
+                row[columns['sectors_read']] += int(fields[5])
+                row[columns['sectors_written']] += int(fields[9])
+                row[len(HostSampler.FIELDS) + self.disks.index(fields[2])] = int(fields[12])
+
+    def _decimate(self):
+        # The last sample of each phase is kept, so the phases are still delimited
+        positions = numpy.arange(self._size)
+        last_of_phase = numpy.append(self._phases[:self._size - 1] != self._phases[1:self._size], True)
+        kept = numpy.flatnonzero((positions % 2 == 0) | last_of_phase)
+        size = len(kept)
+        self._elapsed[:size] = self._elapsed[kept]
+        self._values[:size] = self._values[kept]
+        self._phases[:size] = self._phases[kept]
+        self._phases[size:] = -1
+        self._size = size
+        self._interval *= 2
+
+    def _take_sample(self):
+        with self._lock:
+            if self._size == len(self._elapsed):
+                self._decimate()
+            try:
+                self._read_sample(self._values[self._size])
+            except (OSError, ValueError, IndexError) as e:
+                logging.error('Host resources could not be sampled: %s.' % e)
+                return
+            self._elapsed[self._size] = time.time() - self._start
+            self._size += 1
+
+    def _sample(self):
+        while True:
+            sample_start = time.time()
+            self._take_sample()
+            if self._stopped.wait(max(0, self._interval - (time.time() - sample_start))):
+                break
+
+    def end_phase(self, phase):
+        """Takes a sample and labels the ones taken since the previous phase ended with the given phase."""
+        if self._stopped.is_set():
+            return
+        self._take_sample()
+        with self._lock:
+            self.phases.append(phase)
+            unlabelled = self._phases[:self._size] == -1
+            self._phases[:self._size][unlabelled] = len(self.phases) - 1
+
+    def start(self):
+        self._start = time.time()
+        self._thread = Thread(target=self._sample)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self, last_phase=None):
+        """:param last_phase: phase of the samples taken since the previous phase ended."""
+        if last_phase:
+            self.end_phase(last_phase)
+        self._stopped.set()
+        if self._thread:
+            self._thread.join()
+        for fd in self._files.values():
+            os.close(fd)
+        self._files.clear()
+
+    def _column(self, field):
+        return self._values[:self._size, self._columns[field]]
+
+    def _get_activity(self, size):
+        """Returns the rates (per second) and CPU percentages between consecutive samples."""
+        values = self._values[:size]
+        interval = numpy.diff(self._elapsed[:size])
+        ticks = numpy.diff(values[:, :len(HostSampler.CPU)], axis=0)
+        total_ticks = numpy.maximum(ticks.sum(axis=1), 1)
+        cpu = lambda field: 100.0 * ticks[:, HostSampler.CPU.index(field)] / total_ticks
+        rate = lambda field: numpy.diff(self._column(field)[:size]) / interval
+        busy = numpy.diff(values[:, len(HostSampler.FIELDS):], axis=0) / (interval[:, None] * 1000) * 100
+        return {
+            'cpu_user': cpu('user') + cpu('nice'),
+            'cpu_system': cpu('system') + cpu('irq') + cpu('softirq'),
+            'cpu_iowait': cpu('iowait'),
+            'cpu_steal': cpu('steal'),
+            'cpu_idle': cpu('idle'),
+            'context_switches': rate('ctxt'),
+            'major_faults': rate('pgmajfault'),
+            'swap_in': rate('pswpin'),
+            'swap_out': rate('pswpout'),
+            'page_scans': rate('pgscan'),
+            'disk_read': rate('sectors_read') * HostSampler.SECTOR_SIZE,
+            'disk_written': rate('sectors_written') * HostSampler.SECTOR_SIZE,
+            'disk_busy': numpy.minimum(busy.max(axis=1), 100) if self.disks else numpy.zeros(size - 1),
+        }
+
+    def get_samples(self):
+        """
+        Returns a dictionary per labelled sample with the state of the host when it was taken and its activity
+        since the previous one (None in the first sample).
+        """
+        size = numpy.count_nonzero(self._phases[:self._size] != -1)
+        if not size:
+            return []
+        with numpy.errstate(divide='ignore', invalid='ignore'):
+            activity = self._get_activity(size)
+        elapsed = self._elapsed[:size]
+        interval = numpy.diff(elapsed)
+        state = {
+            'load': self._column('load1')[:size],
+            'processes_running': self._column('procs_running')[:size],
+            'processes_blocked': self._column('procs_blocked')[:size],
+            'memory_available': self._column('MemAvailable')[:size],
+            'page_cache': self._column('Cached')[:size],
+            'dirty': self._column('Dirty')[:size],
+            'swap_used': self._column('SwapTotal')[:size] - self._column('SwapFree')[:size],
+        }
+        samples = []
+        for position in range(size):
+            sample = { 'phase': self.phases[self._phases[position]], 'elapsed': float(elapsed[position]) }
+            for name, column in state.items():
+                sample[name] = float(column[position]) if name == 'load' else int(column[position])
+            for name, column in activity.items():
+                # Nothing can be calculated if two samples were taken at the same time
+                valid = position > 0 and interval[position - 1] > 0
+                sample[name] = float(column[position - 1]) if valid else None
+            samples.append(sample)
+        return samples
+
+
+def calculate_cpu_percent(pre_measure, measure):
+    # translating it from calculateCPUPercent in https://github.com/docker/docker/blob/master/api/client/stats.go
+    cpu_percent = 0.0
+    previous_cpu = pre_measure['cpu_stats']['cpu_usage']['total_usage']
+    previous_system = pre_measure['cpu_stats']['system_cpu_usage']
+    post_cpu = measure['cpu_stats']['cpu_usage']['total_usage']
+    post_system = measure['cpu_stats']['system_cpu_usage']
+    # Otherwise, if both are numbers are integer, the division will return an integer.
+    # Alternatively, we could use: from __future__ import division
+    cpu_delta = post_cpu - previous_cpu
+    system_delta = float(post_system - previous_system)
+    # Newer APIs (and the cgroup v2 stats) do not have the usage per CPU
+    cpus = measure['cpu_stats'].get('online_cpus') or len(measure['cpu_stats']['cpu_usage']['percpu_usage'])
+    if system_delta > 0.0 and cpu_delta > 0.0:
+        cpu_percent = (cpu_delta / system_delta) * cpus * 100.0
+    return cpu_percent
+
+
 class DockerContainerMeter(object):
 
     def __init__(self, container_id, allocate_docker):
@@ -104,19 +941,7 @@ class DockerContainerMeter(object):
         return self._measure['cpu_stats']['cpu_usage']['total_usage']
 
     def get_cpu_percent(self):
-        # translating it from calculateCPUPercent in https://github.com/docker/docker/blob/master/api/client/stats.go
-        cpu_percent = 0.0
-        previous_cpu = self._pre_measure['cpu_stats']['cpu_usage']['total_usage']
-        previous_system = self._pre_measure['cpu_stats']['system_cpu_usage']
-        post_cpu = self._measure['cpu_stats']['cpu_usage']['total_usage']
-        post_system = self._measure['cpu_stats']['system_cpu_usage']
-        # Otherwise, if both are numbers are integer, the division will return an integer.
-        # Alternatively, we could use: from __future__ import division
-        cpu_delta = post_cpu - previous_cpu
-        system_delta = float(post_system - previous_system)
-        if system_delta > 0.0 and cpu_delta > 0.0:
-            cpu_percent = (cpu_delta / system_delta) * len(self._measure['cpu_stats']['cpu_usage']['percpu_usage']) * 100.0
-        return cpu_percent
+        return calculate_cpu_percent(self._pre_measure, self._measure)
 
     def get_memory_usage(self):
         return self._measure['memory_stats']['usage']
@@ -126,3 +951,390 @@ class DockerContainerMeter(object):
 
     def get_memory_maximum(self):
         return self._measure['memory_stats']['max_usage']
+
+
+class CgroupContainerMeter(DockerContainerMeter):
+    """It takes the same measures as DockerContainerMeter reading the cgroup of the container."""
+
+    def __init__(self, container_id, stats_collector):
+        super(CgroupContainerMeter, self).__init__(container_id, None)
+        self._collector = stats_collector
+
+    def _get_measure(self):
+        return self._collector.get_stats(self.container_id)
+
+
+class TimeSeries(object):
+    """
+    Fixed-size numeric buffer for a metric sampled during a run.
+    When it gets full, consecutive samples are averaged in pairs to make room for the new ones,
+    so the buffer always covers the whole run (with less resolution as the run goes on).
+    The minimum and maximum are tracked with every sample, so no spike is lost.
+    """
+    def __init__(self, capacity=512):
+        self._elapsed = numpy.zeros(capacity, dtype=numpy.float64)
+        self._values = numpy.zeros(capacity, dtype=numpy.float64)
+        self._size = 0
+        self._stride = 1  # Samples aggregated in each stored position
+        self._accumulated = 0  # Samples aggregated in the next position
+        self.samples = 0
+        self.minimum = None
+        self.maximum = None
+
+    def _compact(self):
+        half = self._size // 2
+        self._elapsed[:half] = (self._elapsed[0:2*half:2] + self._elapsed[1:2*half:2]) / 2.0
+        self._values[:half] = (self._values[0:2*half:2] + self._values[1:2*half:2]) / 2.0
+        self._size = half
+        self._stride *= 2
+
+    def append(self, elapsed, value):
+        self.samples += 1
+        self.minimum = value if self.minimum is None else min(self.minimum, value)
+        self.maximum = value if self.maximum is None else max(self.maximum, value)
+        if self._accumulated == 0:
+            if self._size == len(self._values):
+                self._compact()
+            self._elapsed[self._size] = 0.0
+            self._values[self._size] = 0.0
+            self._size += 1
+        # Running mean of the samples aggregated in the last position
+        self._accumulated += 1
+        self._elapsed[self._size - 1] += (elapsed - self._elapsed[self._size - 1]) / self._accumulated
+        self._values[self._size - 1] += (value - self._values[self._size - 1]) / self._accumulated
+        if self._accumulated == self._stride:
+            self._accumulated = 0
+
+    def percentiles(self, percentiles=(50, 95, 99)):
+        if not self._size:
+            return [None] * len(percentiles)
+        return [float(p) for p in numpy.percentile(self._values[:self._size], percentiles)]
+
+    def downsample(self, points):
+        """Returns a list of (elapsed, value) tuples with at most the given number of points."""
+        if not self._size:
+            return []
+        buckets = min(points, self._size)
+        elapsed = [b.mean() for b in numpy.array_split(self._elapsed[:self._size], buckets)]
+        values = [b.mean() for b in numpy.array_split(self._values[:self._size], buckets)]
+        return zip(elapsed, values)
+
+
+class DockerStatsSampler(object):
+    """
+    It keeps the stats stream of a container open while it runs and records its evolution.
+    """
+    CPU_PERC = 'cpu_percentage'
+    MEMORY = 'memory'
+
+    def __init__(self, container_id, allocate_stream, capacity=512):
+        self.container_id = container_id
+        self.allocate = allocate_stream
+        self.series = {
+            DockerStatsSampler.CPU_PERC: TimeSeries(capacity),
+            DockerStatsSampler.MEMORY: TimeSeries(capacity),
+        }
+        self._stopped = Event()
+        self._thread = None
+
+    def _record(self, start, previous, measure):
+        elapsed = time.time() - start
+        try:
+            if previous:
+                self.series[DockerStatsSampler.CPU_PERC].append(elapsed, calculate_cpu_percent(previous, measure))
+            self.series[DockerStatsSampler.MEMORY].append(elapsed, measure['memory_stats']['usage'])
+        except KeyError:
+            # Docker sends incomplete stats while the container is stopping
+            logging.debug('Incomplete stats discarded for container "%s".' % self.container_id)
+
+    def _sample(self):
+        start = time.time()
+        previous = None
+        try:
+            with self.allocate() as docker:
+                # The stream ends when the container is stopped
+                for measure in docker.stats(self.container_id, decode=True):
+                    if self._stopped.is_set():
+                        break
+                    self._record(start, previous, measure)
+                    previous = measure
+        except Exception as e:
+            logging.error('Stats stream of container "%s" interrupted: %s.' % (self.container_id, e))
+
+    def start(self):
+        self._thread = Thread(target=self._sample)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+
+    def wait(self, timeout=5):
+        if self._thread:
+            self._thread.join(timeout)
+
+
+class DockerEventsListener(object):
+    """
+    It follows the events of the Docker daemon with a single stream and passes the lifecycle events of each
+    container to the object registered with its ID (see RunningContainer.record_event), so their
+    daemon-side timestamps are known without polling each container.
+    The events of the containers which have not been registered yet (e.g., their creation) are kept
+    until they are registered.
+    """
+    ACTIONS = ('create', 'start', 'die', 'oom', 'destroy')
+
+    def __init__(self, allocate_stream):
+        self.allocate = allocate_stream
+        self._containers = {}
+        self._unclaimed = {}  # Events of each unknown container
+        self._destroyed = set()  # Containers whose 'destroy' event has been dispatched
+        self._lock = Condition(Lock())
+        self._stopped = Event()
+        self._socket = None  # Of the stream, to close it
+        self._thread = None
+
+    def register(self, container):
+        """:param container: an object with a 'docker_id' attribute and a 'record_event' method."""
+        with self._lock:
+            self._containers[container.docker_id] = container
+            pending = self._unclaimed.pop(container.docker_id, [])
+        for action, timestamp, attributes in pending:
+            container.record_event(action, timestamp, attributes)
+
+    def _dispatch(self, event):
+        # 'status' and 'id' were replaced by 'Action' and 'Actor' in API 1.22
+        action = event.get('Action') or event.get('status')
+        if event.get('Type', 'container') != 'container' or action not in DockerEventsListener.ACTIONS:
+            return
+        docker_id = event.get('id') or event['Actor']['ID']
+        timestamp = event['timeNano'] / 1e9 if 'timeNano' in event else float(event['time'])
+        attributes = event.get('Actor', {}).get('Attributes') or {}
+        with self._lock:
+            container = self._containers.get(docker_id)
+            if not container:
+                self._unclaimed.setdefault(docker_id, []).append((action, timestamp, attributes))
+                return
+        container.record_event(action, timestamp, attributes)
+        if action == 'destroy':
+            with self._lock:
+                self._destroyed.add(docker_id)
+                self._lock.notify_all()
+
+    def _follow(self, since):
+        try:
+            with self.allocate() as docker:
+                # Like docker.events(), but keeping the socket to close the stream from stop()
+                params = { 'since': since, 'filters': json.dumps({ 'type': ['container'] }) }
+                response = docker.get(docker._url('/events'), params=params, stream=True)
+                with self._lock:
+                    self._socket = docker._get_raw_response_socket(response)
+                    if self._stopped.is_set():
+                        return
+                for event in docker._stream_helper(response, decode=True):
+                    self._dispatch(event)
+        except Exception as e:
+            if not self._stopped.is_set():
+                logging.error('Docker events stream interrupted: %s.' % e)
+
+    def start(self):
+        # The events emitted since then are sent even if the stream is opened later
+        since = int(time.time())
+        self._thread = Thread(target=self._follow, args=(since,))
+        self._thread.daemon = True
+        self._thread.start()
+
+    def wait_destroyed(self, docker_ids, timeout=10):
+        """Waits until the 'destroy' events of the given containers have been dispatched. Returns whether they were."""
+        deadline = time.time() + timeout
+        with self._lock:
+            while not set(docker_ids) <= self._destroyed:
+                remaining = deadline - time.time()
+                if remaining <= 0 or not self._thread.is_alive():
+                    return False
+                self._lock.wait(min(remaining, 1))
+        return True
+
+    def stop(self):
+        """Closes the stream (the events not dispatched yet are lost) and waits for its thread."""
+        self._stopped.set()
+        with self._lock:
+            self._unclaimed.clear()
+            if self._socket:
+                try:
+                    # Unlike close(), it interrupts the thread blocked reading it
+                    self._socket.shutdown(socket.SHUT_RDWR)
+                except socket.error:
+                    pass  # Already closed
+        if self._thread:
+            self._thread.join()
+
+
+class PortReadinessMonitor(object):
+    """
+    It detects when the containers accept connections in their IPC port.
+
+    A single thread tries to connect to all the pending containers at once (using non-blocking sockets),
+    so the detection is not delayed by the number of containers being watched.
+    Containers are expected to have 'docker_id', 'allocate' and 'ipc_address' (None if the port is not
+    bound to the host) attributes.
+
+    The port is probed in the container's IP address: the host port bound to it is only used if that address
+    cannot be reached (e.g., Docker runs in another host), since docker-proxy accepts the connections
+    before the container listens.
+    """
+    UNREACHABLE = (errno.ENETUNREACH, errno.EHOSTUNREACH, errno.EADDRNOTAVAIL)
+
+    def __init__(self, container_port=39000, interval=0.1, timeout=60):
+        self._container_port = container_port
+        self._interval = interval
+        self._timeout = timeout
+        self.ready = {}  # Timestamp when each container (by Docker ID) was ready
+        self._pending = {}  # Addresses (the one probed first) and deadline of each container
+        self._lock = Lock()
+        self._stopped = Event()
+        self._thread = None
+
+    def _get_addresses(self, container):
+        with container.allocate() as docker:
+            ip = docker.inspect_container(container.docker_id)['NetworkSettings']['IPAddress']
+        addresses = [(ip, self._container_port)] if ip else []
+        if container.ipc_address:
+            addresses.append(container.ipc_address)
+        if not addresses:
+            raise ValueError('it has neither an IP address nor a bound port')
+        return addresses
+
+    def watch(self, container):
+        """Starts watching a container which has just been started."""
+        addresses = self._get_addresses(container)
+        with self._lock:
+            self._pending[container.docker_id] = (addresses, time.time() + self._timeout)
+
+    def _fall_back(self, docker_id):
+        """Probes the next address of a container whose current one cannot be reached."""
+        with self._lock:
+            addresses = self._pending.get(docker_id, ([],))[0]
+            if len(addresses) > 1:
+                logging.debug('IP address of container "%s" unreachable, probing %s:%s.' % ((docker_id,) + addresses[1]))
+                addresses.pop(0)
+
+    def _set_ready(self, docker_id, timestamp):
+        with self._lock:
+            self._pending.pop(docker_id, None)
+            self.ready[docker_id] = timestamp
+
+    def _attempt(self):
+        """Tries to connect to every pending container once (waiting for the connections at most an interval)."""
+        now = time.time()
+        with self._lock:
+            for docker_id in [d for d, (_, deadline) in self._pending.items() if deadline < now]:
+                logging.warning('Container "%s" was not ready after %d seconds.' % (docker_id, self._timeout))
+                del self._pending[docker_id]
+            pending = list(self._pending.items())
+        connecting = {}  # Socket of each connection in progress by file descriptor
+        poller = select.poll()  # Unlike select(), it is not limited to 1024 descriptors
+        for docker_id, (addresses, _) in pending:
+            s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            s.setblocking(0)
+            error = s.connect_ex(addresses[0])
+            if error == 0:
+                self._set_ready(docker_id, time.time())
+                s.close()
+            elif error in (errno.EINPROGRESS, errno.EAGAIN):
+                connecting[s.fileno()] = (s, docker_id)
+                poller.register(s, select.POLLOUT)
+            else:  # E.g., refused
+                s.close()
+                if error in PortReadinessMonitor.UNREACHABLE:
+                    self._fall_back(docker_id)
+        deadline = time.time() + self._interval
+        while connecting and time.time() < deadline:
+            for fd, _ in poller.poll(max(0, deadline - time.time()) * 1000):
+                s, docker_id = connecting.pop(fd)
+                poller.unregister(fd)
+                error = s.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+                if error == 0:
+                    self._set_ready(docker_id, time.time())
+                elif error in PortReadinessMonitor.UNREACHABLE:
+                    self._fall_back(docker_id)
+                s.close()
+        for s, docker_id in connecting.values():
+            # A reachable address answers at once (even if it refuses the connection)
+            self._fall_back(docker_id)
+            s.close()
+
+    def _probe(self):
+        while not self._stopped.is_set():
+            attempt_start = time.time()
+            try:
+                self._attempt()
+            except Exception as e:
+                logging.error('Readiness could not be probed: %s.' % e)
+            self._stopped.wait(max(0, self._interval - (time.time() - attempt_start)))
+
+    def start(self):
+        self._thread = Thread(target=self._probe)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+
+
+class LogReadinessMonitor(object):
+    """
+    It detects when the containers write a marker in their output (e.g., once their service accepts connections).
+    Like the stats streams, it keeps a log stream per container open until the marker appears.
+    Containers are expected to have a 'docker_id' attribute.
+    """
+    def __init__(self, docker_factory, marker, timeout=60):
+        if not marker:
+            raise ValueError('A marker is required to detect the readiness in the output of the containers.')
+        self._docker_factory = docker_factory
+        self._marker = marker
+        self._timeout = timeout
+        self.ready = {}  # Timestamp when each container (by Docker ID) was ready
+        self._stopped = Event()
+
+    def _follow(self, docker_id, deadline):
+        # The marker might be split across several chunks
+        tail = ''
+        try:
+            with self._docker_factory.create_streaming()() as docker:
+                for chunk in docker.logs(docker_id, stream=True, follow=True):
+                    now = time.time()
+                    if self._stopped.is_set() or now > deadline:
+                        break
+                    tail = tail[-len(self._marker):] + chunk
+                    if self._marker in tail:
+                        self.ready[docker_id] = now
+                        break
+        except Exception as e:
+            logging.error('Log stream of container "%s" interrupted: %s.' % (docker_id, e))
+
+    def watch(self, container):
+        """Starts watching a container which has just been started."""
+        thread = Thread(target=self._follow, args=(container.docker_id, time.time() + self._timeout))
+        thread.daemon = True
+        thread.start()
+
+    def start(self):
+        pass
+
+    def stop(self):
+        self._stopped.set()
+
+
+PORT_READINESS = 'port'
+LOG_READINESS = 'log'
+
+def create_readiness_monitor(name, docker_factory, marker=None, timeout=60):
+    """Returns a monitor which detects when the containers are ready or None if it is not detected."""
+    if not name or name == 'none':
+        return None
+    if name == PORT_READINESS:
+        return PortReadinessMonitor(timeout=timeout)
+    if name == LOG_READINESS:
+        return LogReadinessMonitor(docker_factory, marker, timeout)
+    raise ValueError('Unknown readiness detection "%s". Valid values: none, %s, %s.' % (name, PORT_READINESS, LOG_READINESS))
@@ -7,9 +7,10 @@ Models of the database.
 import logging
 import os.path
 from datetime import datetime
-from sqlalchemy import create_engine
+from threading import Lock
+from sqlalchemy import create_engine, event, inspect
 from sqlalchemy.orm import relationship, sessionmaker, scoped_session
-from sqlalchemy import Column, ForeignKey, Integer, Float, String, DateTime
+from sqlalchemy import Column, ForeignKey, Integer, Float, String, DateTime, Boolean
 from sqlalchemy.ext.declarative import declarative_base
 
 
@@ -25,71 +26,350 @@ class Test(Base):
     number_of_containers = Column(Integer)  # Number of containers to create in the test
     repetitions = Column(Integer)  # Times the test will be repeated
     runs = relationship('Run', backref="test")
+    arrival_profile = relationship('ArrivalProfile', uselist=False, backref='test')  # All at once if there is none
+
+class ArrivalProfile(Base):
+    __tablename__ = 'arrival_profile'
+    id = Column(Integer, primary_key=True)
+    test_id = Column(Integer, ForeignKey('test.id'), index=True)
+    kind = Column(String(50))  # 'burst', 'fixed', 'waves' or 'poisson'
+    rate = Column(Float)  # Containers per second ('fixed' and 'poisson')
+    wave_size = Column(Integer)  # Containers per wave ('waves')
+    wave_interval = Column(Float)  # In seconds, time between waves ('waves')
+    seed = Column(Integer)  # Seed of the random arrivals ('poisson')
 
 class Run(Base):
     __tablename__ = 'run'
     id = Column(Integer, primary_key=True)
-    test_id = Column(Integer, ForeignKey('test.id'))
+    test_id = Column(Integer, ForeignKey('test.id'), index=True)
     started = Column(DateTime, default=datetime.now)
     ended = Column(DateTime)
+    phase = Column(String(10))  # Last checkpoint reached (see recovery.py)
     containers = relationship('Container', backref='run')
     disk = relationship('DiskRequired', uselist=False, backref='run')
     response_time = relationship('ResponseTime', uselist=False, backref='run')
+    response_distribution = relationship('ResponseTimeDistribution', uselist=False, backref='run')
+    startup_distributions = relationship('StartupDistribution', backref='run')  # One per stage
+    creation_phase = relationship('CreationPhase', uselist=False, backref='run')
+    concurrency_decisions = relationship('ConcurrencyDecision', backref='run')
+    api_calls = relationship('ApiCall', backref='run')
+    ramp_samples = relationship('RampSample', backref='run')
+    host_samples = relationship('HostSample', backref='run')
+    ksm_usage = relationship('KsmUsage', uselist=False, backref='run')
+    hosts = relationship('Host', backref='run')  # Only if the run was distributed across several Docker hosts
 
 class DiskRequired(Base):
     __tablename__ = 'disk'
     id = Column(Integer, primary_key=True)
-    run_id = Column(Integer, ForeignKey('run.id'))
+    run_id = Column(Integer, ForeignKey('run.id'), index=True)
     size = Column(Integer)  # In bytes
 
 class ResponseTime(Base):
     __tablename__ = 'response'
     id = Column(Integer, primary_key=True)
-    run_id = Column(Integer, ForeignKey('run.id'))
+    run_id = Column(Integer, ForeignKey('run.id'), index=True)
     time = Column(Integer)  # In miliseconds
 
+class ResponseTimeDistribution(Base):
+    __tablename__ = 'response_distribution'
+    id = Column(Integer, primary_key=True)
+    run_id = Column(Integer, ForeignKey('run.id'), index=True)
+    containers = Column(Integer)  # Containers probed
+    samples = Column(Integer)  # Successful probes
+    errors = Column(Integer)  # Probes which timed out
+    # In miliseconds
+    minimum = Column(Float)
+    mean = Column(Float)
+    p50 = Column(Float)
+    p90 = Column(Float)
+    p99 = Column(Float)
+    p999 = Column(Float)
+    maximum = Column(Float)
+
+class StartupDistribution(Base):
+    __tablename__ = 'startup_distribution'
+    id = Column(Integer, primary_key=True)
+    run_id = Column(Integer, ForeignKey('run.id'), index=True)
+    stage = Column(String(10))  # create, start or ready (see StartupTimeline)
+    samples = Column(Integer)
+    missing = Column(Integer)  # Containers without this stage (e.g., not ready before the timeout)
+    # In miliseconds
+    minimum = Column(Float)
+    mean = Column(Float)
+    p50 = Column(Float)
+    p90 = Column(Float)
+    p99 = Column(Float)
+    maximum = Column(Float)
+
+class CreationPhase(Base):
+    __tablename__ = 'creation_phase'
+    id = Column(Integer, primary_key=True)
+    run_id = Column(Integer, ForeignKey('run.id'), index=True)
+    elapsed = Column(Float)  # In seconds, time needed to create and register all the containers
+    workers = Column(Integer)  # Containers created simultaneously
+
+class ConcurrencyDecision(Base):
+    __tablename__ = 'concurrency_decision'
+    id = Column(Integer, primary_key=True)
+    run_id = Column(Integer, ForeignKey('run.id'), index=True)
+    timestamp = Column(DateTime)
+    limit = Column(Integer)  # Simultaneous requests allowed after the decision
+    latency = Column(Float)  # In seconds, latency of the request which caused it
+    reason = Column(String(50))  # 'fast', 'slow' or 'timeout'
+
+class ApiCall(Base):
+    __tablename__ = 'api_call'
+    id = Column(Integer, primary_key=True)
+    run_id = Column(Integer, ForeignKey('run.id'), index=True)
+    operation = Column(String(50))  # Method of the Docker client (e.g., 'create_container')
+    started = Column(DateTime)
+    wait = Column(Float)  # In seconds, time waiting to be allowed to make the request
+    duration = Column(Float)  # In seconds
+    outcome = Column(String(20))  # 'ok', 'timeout', 'api_error' or 'error'
+
+class RampSample(Base):
+    __tablename__ = 'ramp_sample'
+    id = Column(Integer, primary_key=True)
+    run_id = Column(Integer, ForeignKey('run.id'), index=True)
+    elapsed = Column(Float)  # In seconds since the first container was started
+    running = Column(Integer)  # Containers started so far
+    startup_time = Column(Float)  # In seconds, mean of the containers started since the previous sample
+    response_time = Column(Integer)  # In miliseconds, response time of the first container
+
+class HostSample(Base):
+    __tablename__ = 'host_sample'
+    id = Column(Integer, primary_key=True)
+    run_id = Column(Integer, ForeignKey('run.id'), index=True)
+    phase = Column(String(20))  # Phase of the run when it was taken (e.g., 'creation' or 'measurement')
+    elapsed = Column(Float)  # In seconds since the beginning of the run
+    load = Column(Float)  # Load average of the last minute
+    processes_running = Column(Integer)
+    processes_blocked = Column(Integer)  # Waiting for I/O
+    memory_available = Column(Integer)  # In bytes
+    page_cache = Column(Integer)  # In bytes
+    dirty = Column(Integer)  # In bytes, waiting to be written to disk
+    swap_used = Column(Integer)  # In bytes
+    # Since the previous sample (None in the first one)
+    cpu_user = Column(Float)  # Percentage of the CPU time of the host
+    cpu_system = Column(Float)  # Percentage, including interrupts
+    cpu_iowait = Column(Float)  # Percentage
+    cpu_steal = Column(Float)  # Percentage taken by the hypervisor
+    cpu_idle = Column(Float)  # Percentage
+    context_switches = Column(Float)  # Per second
+    major_faults = Column(Float)  # Per second
+    swap_in = Column(Float)  # Pages per second
+    swap_out = Column(Float)  # Pages per second
+    page_scans = Column(Float)  # Pages scanned to be reclaimed per second
+    disk_read = Column(Float)  # Bytes per second
+    disk_written = Column(Float)  # Bytes per second
+    disk_busy = Column(Float)  # Percentage of the time the busiest disk was doing I/O
+
+class Host(Base):
+    __tablename__ = 'host'
+    id = Column(Integer, primary_key=True)
+    run_id = Column(Integer, ForeignKey('run.id'), index=True)
+    url = Column(String(250))  # Docker URL
+    capacity = Column(Float)  # Relative weight used to share the containers of the run
+    number_of_containers = Column(Integer)
+    disk_size = Column(Integer)  # In bytes, disk required in this host
+    creation_elapsed = Column(Float)  # In seconds, time needed to create the containers of this host
+    placements = relationship('ContainerPlacement', backref='host')
+
+class ContainerPlacement(Base):
+    __tablename__ = 'container_placement'
+    id = Column(Integer, primary_key=True)
+    container_id = Column(Integer, ForeignKey('container.id'), index=True)
+    host_id = Column(Integer, ForeignKey('host.id'), index=True)
+
 class Container(Base):
     __tablename__ = 'container'
     id = Column(Integer, primary_key=True)
-    run_id = Column(Integer, ForeignKey('run.id'))
+    run_id = Column(Integer, ForeignKey('run.id'), index=True)
     docker_id = Column(String(250))  # Docker ID
+    phase = Column(String(10))  # Last checkpoint reached (see recovery.py)
     cpu = relationship('CpuRequired', uselist=False, backref='container')  # One to one
     memory = relationship('MemoryRequired', uselist=False, backref='container')  # One to one
+    shared_memory = relationship('SharedMemory', uselist=False, backref='container')  # One to one
     creation_time = relationship('CreationTime', uselist=False, backref='container')  # One to one
+    startup_timeline = relationship('StartupTimeline', uselist=False, backref='container')  # One to one
+    lifecycle = relationship('ContainerLifecycle', uselist=False, backref='container')  # One to one
     error = relationship('ExecutionError', uselist=False, backref='container')  # One to one
+    teardown_time = relationship('TeardownTime', uselist=False, backref='container')  # One to one
+    stats_summaries = relationship('StatsSummary', backref='container')  # One per metric
+    stats_samples = relationship('StatsSample', backref='container')
+    placement = relationship('ContainerPlacement', uselist=False, backref='container')  # One to one
 
 class ExecutionError(Base):
     __tablename__ = 'error'
     id = Column(Integer, primary_key=True)
-    container_id = Column(Integer, ForeignKey('container.id'))
+    container_id = Column(Integer, ForeignKey('container.id'), index=True)
     message = Column(String(250))
 
 class MemoryRequired(Base):
     __tablename__ = 'memory'
     id = Column(Integer, primary_key=True)
-    container_id = Column(Integer, ForeignKey('container.id'))
+    container_id = Column(Integer, ForeignKey('container.id'), index=True)
     usage = Column(Integer)  # In bytes
     percentual = Column(Float)
     maximum = Column(Integer)
 
+class SharedMemory(Base):
+    # Memory of the processes of the container according to their smaps (see measures.SharedMemoryMeter)
+    __tablename__ = 'shared_memory'
+    id = Column(Integer, primary_key=True)
+    container_id = Column(Integer, ForeignKey('container.id'), index=True)
+    processes = Column(Integer)
+    rss = Column(Integer)  # In bytes, the shared pages are counted by each process
+    pss = Column(Integer)  # In bytes, the shared pages are divided among the processes sharing them
+    uss = Column(Integer)  # In bytes, pages only used by its processes (i.e., freed if it is removed)
+    shared = Column(Integer)  # In bytes, pages shared with other processes
+    swap_pss = Column(Integer)  # In bytes, swapped (proportionally)
+    ksm_merged = Column(Integer)  # In bytes, pages merged by KSM (None if unknown)
+
+class KsmUsage(Base):
+    # Kernel same-page merging in the host while the containers were running (if it was enabled)
+    __tablename__ = 'ksm_usage'
+    id = Column(Integer, primary_key=True)
+    run_id = Column(Integer, ForeignKey('run.id'), index=True)
+    pages_shared = Column(Integer)  # Merged pages
+    pages_sharing = Column(Integer)  # Pages which point to the merged ones
+    pages_unshared = Column(Integer)  # Pages checked but not merged
+    saved = Column(Integer)  # In bytes
+
 class CreationTime(Base):
     __tablename__ = 'creation'
     id = Column(Integer, primary_key=True)
-    container_id = Column(Integer, ForeignKey('container.id'))
-    startup_time = Column(Integer)  # In ms?
+    container_id = Column(Integer, ForeignKey('container.id'), index=True)
+    startup_time = Column(Float)  # In seconds (only the start API call, see StartupTimeline)
+
+class ContainerLifecycle(Base):
+    # Timestamps of the events emitted by Docker (see measures.DockerEventsListener)
+    __tablename__ = 'container_lifecycle'
+    id = Column(Integer, primary_key=True)
+    container_id = Column(Integer, ForeignKey('container.id'), index=True)
+    created = Column(DateTime)  # None if it was created before the run (e.g., taken from the pool)
+    started = Column(DateTime)
+    died = Column(DateTime)
+    destroyed = Column(DateTime)
+    exit_code = Column(Integer)
+    oom_killed = Column(Boolean)
+
+class StartupTimeline(Base):
+    __tablename__ = 'startup_timeline'
+    id = Column(Integer, primary_key=True)
+    container_id = Column(Integer, ForeignKey('container.id'), index=True)
+    created = Column(DateTime)  # None if it was created beforehand (e.g., taken from the pool)
+    create_time = Column(Float)  # In seconds
+    started = Column(DateTime)  # Once the start API call finished
+    start_time = Column(Float)  # In seconds
+    ready = Column(DateTime)  # None if it was not detected
+    time_to_ready = Column(Float)  # In seconds since it was started
 
 class CpuRequired(Base):
     __tablename__ = 'cpu'
     id = Column(Integer, primary_key=True)
-    container_id = Column(Integer, ForeignKey('container.id'))
+    container_id = Column(Integer, ForeignKey('container.id'), index=True)
     total_cpu = Column(Integer)  # In nanoseconds
     percentual_cpu = Column(Float)
 
+class TeardownTime(Base):
+    __tablename__ = 'teardown'
+    id = Column(Integer, primary_key=True)
+    container_id = Column(Integer, ForeignKey('container.id'), index=True)
+    stop_time = Column(Float)  # In seconds
+    remove_time = Column(Float)  # In seconds
+
+class StatsSummary(Base):
+    __tablename__ = 'stats_summary'
+    id = Column(Integer, primary_key=True)
+    container_id = Column(Integer, ForeignKey('container.id'), index=True)
+    metric = Column(String(50))  # E.g., 'cpu_percentage', 'memory' or 'disk'
+    samples = Column(Integer)  # Samples received from the stats stream
+    minimum = Column(Float)
+    maximum = Column(Float)
+    p50 = Column(Float)
+    p95 = Column(Float)
+    p99 = Column(Float)
+
+class StatsSample(Base):
+    __tablename__ = 'stats_sample'
+    id = Column(Integer, primary_key=True)
+    container_id = Column(Integer, ForeignKey('container.id'), index=True)
+    metric = Column(String(50))
+    elapsed = Column(Float)  # In seconds since the container was started
+    value = Column(Float)
+
+class SaturationSearch(Base):
+    __tablename__ = 'saturation_search'
+    id = Column(Integer, primary_key=True)
+    image_id = Column(String(250), nullable=False)
+    volumes_from = Column(String(250))
+    metric = Column(String(50))  # 'response_time', 'cpu_percentage' or 'error_rate'
+    threshold = Column(Float)
+    started = Column(DateTime, default=datetime.now)
+    ended = Column(DateTime)
+    capacity = Column(Integer)  # Most containers measured without crossing the threshold
+    crossed_at = Column(Integer)  # Fewest containers measured crossing it (None if it was never crossed)
+    steps = relationship('SaturationStep', backref='search')
+
+class SaturationStep(Base):
+    __tablename__ = 'saturation_step'
+    id = Column(Integer, primary_key=True)
+    search_id = Column(Integer, ForeignKey('saturation_search.id'), index=True)
+    test_id = Column(Integer, ForeignKey('test.id'), index=True)
+    number_of_containers = Column(Integer)
+    value = Column(Float)  # Mean of the metric in the runs of the test
+    crossed = Column(Boolean)
+
+
+class AggregatedMeasures(object):
+    # Measures shown in the plots (see generate_plots.py)
+    size = Column(Float)  # In bytes
+    response = Column(Float)  # In miliseconds
+    cpu_total = Column(Float)
+    cpu_total_per_container = Column(Float)
+    cpu_percentage = Column(Float)
+    cpu_percentage_per_container = Column(Float)
+    memory = Column(Float)
+    memory_per_container = Column(Float)
+    memory_max = Column(Float)
+    memory_max_per_container = Column(Float)
+    memory_percentage = Column(Float)
+    memory_percentage_per_container = Column(Float)
+
+class RunAggregate(AggregatedMeasures, Base):
+    __tablename__ = 'run_aggregate'
+    id = Column(Integer, primary_key=True)
+    run_id = Column(Integer, ForeignKey('run.id'), index=True)
+    test_id = Column(Integer, ForeignKey('test.id'), index=True)
+
+class TestAggregate(AggregatedMeasures, Base):
+    __tablename__ = 'test_aggregate'
+    id = Column(Integer, primary_key=True)
+    test_id = Column(Integer, ForeignKey('test.id'), index=True)
+    runs = Column(Integer)  # Ended runs aggregated (each measure is their mean)
+
+class ConfidenceInterval(Base):
+    # Precision achieved by the runs of a test (see confidence.py)
+    __tablename__ = 'confidence_interval'
+    id = Column(Integer, primary_key=True)
+    test_id = Column(Integer, ForeignKey('test.id'), index=True)
+    metric = Column(String(50))  # Field of the aggregates
+    runs = Column(Integer)
+    confidence = Column(Float)  # E.g., 0.95
+    mean = Column(Float)
+    lower = Column(Float)  # None with a single run
+    upper = Column(Float)
+    relative_width = Column(Float)  # (upper - lower) / mean
+
 
 class PerformanceTestDAO(object):
-    def __init__(self, database_path):
+    def __init__(self, database_path, wal=False):
+        self.database_path = database_path
         database_url = 'sqlite:///' + database_path
         engine = create_engine(database_url)
+        if wal:
+            event.listen(engine, 'connect', self._enable_wal)
         self._create_database_if_not_exist(database_path, engine)
         Base.metadata.bind = engine
         session_factory = sessionmaker(bind=engine)
@@ -98,9 +378,92 @@ class PerformanceTestDAO(object):
     def _create_database_if_not_exist(self, database_path, engine):
         if not os.path.isfile(database_path):
             logging.info('Creating database "%s"...' % database_path)
-            # Create all tables in the engine. This is equivalent to "Create Table"
-            # statements in raw SQL.
-            Base.metadata.create_all(engine)
+        # Create all tables in the engine. This is equivalent to "Create Table"
+        # statements in raw SQL.
+        # Existing tables are not modified, so the tables added in newer versions
+        # are also created in the databases generated by the previous ones.
+        Base.metadata.create_all(engine)
+        self._create_missing_columns(engine)
+        self._create_missing_indexes(engine)
+
+    def _create_missing_columns(self, engine):
+        # Nor are the columns added to the tables which already existed
+        inspector = inspect(engine)
+        for table in Base.metadata.sorted_tables:
+            existing = set(column['name'] for column in inspector.get_columns(table.name))
+            for column in table.columns:
+                if column.name not in existing:
+                    logging.info('Adding column "%s.%s"...' % (table.name, column.name))
+                    engine.execute('ALTER TABLE %s ADD COLUMN %s %s' % (table.name, column.name,
+                                                                        column.type.compile(engine.dialect)))
+
+    def _create_missing_indexes(self, engine):
+        # The indexes of the tables which already existed are not created by create_all()
+        inspector = inspect(engine)
+        for table in Base.metadata.sorted_tables:
+            existing = set(index['name'] for index in inspector.get_indexes(table.name))
+            for index in table.indexes:
+                if index.name not in existing:
+                    logging.info('Creating index "%s"...' % index.name)
+                    index.create(engine)
+
+    def _enable_wal(self, dbapi_connection, connection_record):
+        # With WAL, commits are appended to a log and synced only on checkpoints.
+        cursor = dbapi_connection.cursor()
+        cursor.execute('PRAGMA journal_mode=WAL')
+        cursor.execute('PRAGMA synchronous=NORMAL')
+        cursor.close()
 
     def get_session(self):
         return self.Session()
+
+
+def _get_database_size(session):
+    """
+    Returns the bytes of the pages used by the database.
+    Unlike the size of its files, it does not change when the WAL is checkpointed.
+    """
+    page_count = session.execute('PRAGMA page_count').scalar()
+    page_size = session.execute('PRAGMA page_size').scalar()
+    return page_count * page_size
+
+
+class MeasuresRecorder(object):
+    """
+    Write-behind persistence for the measures of a run.
+    Rows are kept in memory and written in a single transaction when the recorder is flushed
+    (i.e., at the boundaries of the run phases).
+    If writes are deferred, only the final flush (done once the measures have been taken) writes them.
+    """
+    def __init__(self, dao, defer=False):
+        self._dao = dao
+        self._defer = defer
+        self._pending = []
+        self._lock = Lock()  # Rows can be added from different threads
+        self.flushes = 0
+        self.rows_written = 0
+        self.database_growth = 0  # In bytes
+
+    def add(self, row):
+        with self._lock:
+            self._pending.append(row)
+
+    def flush(self, final=False):
+        """Writes all the pending rows. It must be always called from the same thread."""
+        if self._defer and not final:
+            return
+        with self._lock:
+            rows, self._pending = self._pending, []
+        if not rows:
+            # Changes in the rows already written (e.g., checkpoints)
+            self._dao.get_session().commit()
+            return
+        session = self._dao.get_session()
+        before = _get_database_size(session)
+        session.add_all(rows)
+        session.flush()
+        # Measured within the transaction, so the session does not keep the database locked afterwards
+        self.database_growth += _get_database_size(session) - before
+        session.commit()
+        self.flushes += 1
+        self.rows_written += len(rows)
@@ -0,0 +1,143 @@
+"""
+Created on 18/10/2026
+@author: Aitor Gomez Goiri <aitor.gomez-goiri@open.ac.uk>
+Runs distributed across several Docker hosts.
+"""
+
+import logging
+from urlparse import urlparse
+from multiprocessing.pool import ThreadPool
+from threading3 import Barrier
+from benchmark import TestRun, create_barriers, save_startup_distributions, PHASED_ENGINE, THREADS_ENGINE
+from models import Run, Host, DiskRequired, CreationPhase
+from recovery import REMOVED
+
+
+def get_checker_host(docker_url):
+    """Returns the address where the containers of a Docker host can be contacted."""
+    url = urlparse(docker_url)
+    return url.hostname if url.scheme in ('tcp', 'http', 'https') and url.hostname else 'localhost'
+
+def shard_containers(number_of_containers, capacities):
+    """Shares the containers among the hosts proportionally to their capacities (largest remainder method)."""
+    total = float(sum(capacities))
+    quotas = [number_of_containers * capacity / total for capacity in capacities]
+    shares = [int(quota) for quota in quotas]
+    # The remaining containers go to the hosts with the largest remainders
+    by_remainder = sorted(range(len(quotas)), key=lambda i: shares[i] - quotas[i])
+    for i in by_remainder[:number_of_containers - sum(shares)]:
+        shares[i] += 1
+    return shares
+
+def split_arrival_offsets(offsets, counts):
+    """
+    Interleaves the arrivals among the hosts, so each one receives its containers during the whole ramp.
+    The last arrival goes to the first host, whose last container is the one whose response time is measured.
+    """
+    # Among simultaneous slots, the first host's go last
+    slots = sorted(((j + 1.0) / count, position == 0, position)
+                   for position, count in enumerate(counts) for j in range(count))
+    per_host = [[] for _ in counts]
+    for offset, (_, _, position) in zip(sorted(offsets), slots):
+        per_host[position].append(offset)
+    return per_host
+
+
+class DockerHost(object):
+
+    def __init__(self, url, capacity, docker_factory):
+        self.url = url
+        self.capacity = capacity
+        self.docker_factory = docker_factory
+        self.checker_host = get_checker_host(url)
+
+
+class MultiHostTestRun(object):
+    """
+    It runs a test across several Docker hosts.
+
+    The containers are shared among the hosts according to their capacity. There is a TestRun per host,
+    but all of them share the barriers, so the containers of all the hosts are started, measured and
+    stopped at the same time. The response time is measured in the first host.
+    """
+    def __init__(self, docker_hosts, number_of_containers, image_id, volumes_from, ipc_port, checker_jar_path,
+                 arrival_offsets=None, **options):
+        # Pooled containers belong to a single Docker host
+        options.pop('container_pool', None)
+        if options.get('engine') == PHASED_ENGINE:
+            # The hosts are synchronised with the barriers
+            logging.warning('The phased engine cannot be used with several hosts, so a thread per container is used.')
+            options['engine'] = THREADS_ENGINE
+        shares = shard_containers(number_of_containers, [host.capacity for host in docker_hosts])
+        self.hosts = [(host, share) for host, share in zip(docker_hosts, shares) if share]
+        barriers = create_barriers(number_of_containers, len(self.hosts))
+        if arrival_offsets:
+            host_offsets = split_arrival_offsets(arrival_offsets, [share for _, share in self.hosts])
+        else:
+            host_offsets = [None] * len(self.hosts)
+        # The resources of the host where the benchmark runs are only measured once
+        host_sampling_interval = options.pop('host_sampling_interval', None)
+        shared_memory = options.pop('shared_memory', False)
+        self.runs = []
+        for position, ((host, share), offsets) in enumerate(zip(self.hosts, host_offsets)):
+            self.runs.append(TestRun(host.docker_factory, share, image_id, volumes_from, ipc_port, checker_jar_path,
+                                     arrival_offsets=offsets, barriers=barriers, measure_response=position == 0,
+                                     checker_host=host.checker_host,
+                                     host_sampling_interval=host_sampling_interval if position == 0 else None,
+                                     shared_memory=shared_memory and position == 0,
+                                     **options))
+
+    def _run_host(self, dao, run_id, position, host_id, created, errors):
+        # Both phases use the same thread because the rows written belong to the session of the thread
+        test_run = self.runs[position]
+        try:
+            test_run.create(dao, run_id, host_id)
+        except Exception as e:
+            logging.error('The containers of host %d could not be created: %s.' % (host_id, e))
+            errors[position] = e
+        created.wait()
+        if any(errors):
+            # Otherwise, the containers would wait forever for the ones which were not created
+            if not errors[position]:
+                test_run.discard()
+        else:
+            test_run.execute(run_id)
+
+    def run(self, dao, run_id):
+        session = dao.get_session()
+        db_hosts = [Host(run_id=run_id, url=host.url, capacity=host.capacity, number_of_containers=share)
+                    for host, share in self.hosts]
+        session.add_all(db_hosts)
+        session.commit()
+        logging.info('Running %s containers in %d hosts.' % ('+'.join(str(share) for _, share in self.hosts), len(db_hosts)))
+
+        # The identifiers are read here because the rows cannot be loaded from other threads
+        host_ids = [db_host.id for db_host in db_hosts]
+        created = Barrier(len(self.runs))  # All the hosts have created their containers
+        errors = [None] * len(self.runs)
+        pool = ThreadPool(len(self.runs))
+        try:
+            pool.map(lambda position: self._run_host(dao, run_id, position, host_ids[position], created, errors),
+                     range(len(self.runs)))
+        finally:
+            pool.close()
+            pool.join()
+        failed = [error for error in errors if error]
+        if failed:
+            raise failed[0]
+
+        for test_run, db_host in zip(self.runs, db_hosts):
+            db_host.disk_size = test_run.disk_size_increase
+            db_host.creation_elapsed = test_run.creation_elapsed
+        disk_sizes = [test_run.disk_size_increase for test_run in self.runs]
+        session.add(DiskRequired(run_id=run_id, size=None if None in disk_sizes else sum(disk_sizes)))
+        session.add(CreationPhase(run_id=run_id, elapsed=max(test_run.creation_elapsed for test_run in self.runs),
+                                  workers=sum(test_run.creation_workers for test_run in self.runs)))
+        histograms = self.runs[0].startup_histograms
+        for test_run in self.runs[1:]:
+            for stage, histogram in histograms.items():
+                histogram.merge(test_run.startup_histograms[stage])
+        save_startup_distributions(session, run_id, histograms, sum(share for _, share in self.hosts))
+        # The hosts do not record the phases of the run, since they reach them at different moments
+        session.query(Run).get(run_id).phase = REMOVED
+        session.commit()
@@ -6,22 +6,28 @@ Script to create database.
 
 from argparse import ArgumentParser
 from models import PerformanceTestDAO, Test
+from arrivals import parse_arrival_profile
 
 
 
-def main(database_file):
+def main(database_file, arrival=None):
     dao = PerformanceTestDAO(database_file)
     session = dao.get_session()
     for num_containers in (1, 5, 10, 20, 40, 60, 80, 100, 150, 200, 250, 300, 350, 400, 450, 500, 550, 600):
         test = Test(image_id='packettracer_xvfb_mount', volumes_from='ptdata', number_of_containers=num_containers, repetitions=1)
+        if arrival:
+            test.arrival_profile = parse_arrival_profile(arrival)
         session.add(test)
     session.commit()
 
 def entry_point():
     parser = ArgumentParser(description='Create database and create data for the benchmark.')
     parser.add_argument('-db', default='/tmp/benchmark.db', dest='database', help='Database file.')
+    parser.add_argument('-arrival', dest='arrival',
+                            help='How the containers of each run are started: burst (default), fixed:rate, ' +
+                            'waves:size,interval or poisson:rate[,seed] (rates in containers per second).')
     args = parser.parse_args()
-    main(args.database)
+    main(args.database, args.arrival)
 
 
 if __name__ == "__main__":
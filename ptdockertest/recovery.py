@@ -0,0 +1,115 @@
+"""
+Created on 18/10/2026
+@author: Aitor Gomez Goiri <aitor.gomez-goiri@open.ac.uk>
+Recovery of the runs interrupted (e.g., because the harness crashed).
+
+The runs and their containers store the last phase they reached (checkpoints) and the containers
+are labelled with their run, so the ones left by an interrupted run can be found in the Docker host
+even if they were never registered in the database.
+"""
+
+import logging
+from multiprocessing.pool import ThreadPool
+from requests.exceptions import Timeout
+from docker.errors import APIError
+from models import Base, Run, Container
+
+
+# Checkpoints (in order)
+CREATED = 'created'  # All the containers have been created (but not started)
+STARTED = 'started'  # The containers might have been started
+MEASURED = 'measured'  # The measures have been saved
+REMOVED = 'removed'  # The containers have been removed
+
+RUN_LABEL = 'ptdockertest.run'  # Run which created the container
+PORTS_LABEL = 'ptdockertest.ports'  # Only in the containers which bind ports
+POOL = 'pool'  # Run of the pooled containers (see container_pool.py)
+
+
+def get_labels(run, ports=None):
+    """
+    :param run: identifier of the run or POOL.
+    :param ports: ports bound by the container.
+    """
+    labels = { RUN_LABEL: str(run) }
+    if ports:
+        labels[PORTS_LABEL] = ','.join(str(port) for port in sorted(ports))
+    return labels
+
+def get_resumable_run_ids(session):
+    """Returns the identifiers (as labelled) of the unfinished runs whose containers were not started."""
+    runs = session.query(Run.id).filter(Run.ended == None, (Run.phase == None) | (Run.phase == CREATED))
+    return set(str(run_id) for (run_id,) in runs)
+
+def is_adoptable(container, resumable_run_ids):
+    """Whether a container listed by Docker can be started by the run which created it when it is resumed."""
+    labels = container.get('Labels') or {}
+    # 'State' is only listed since API 1.23
+    state = container.get('State') or container.get('Status') or ''
+    return labels.get(RUN_LABEL) in resumable_run_ids and PORTS_LABEL not in labels and \
+           state.lower().startswith('created')
+
+def list_labelled_containers(allocate, run_id=None):
+    label = RUN_LABEL if run_id is None else '%s=%s' % (RUN_LABEL, run_id)
+    with allocate() as docker:
+        return docker.containers(all=True, filters={ 'label': label })
+
+def find_adoptable(allocate, run_id):
+    """Returns the containers created by the (unfinished) run which can be started when it is resumed."""
+    return [container for container in list_labelled_containers(allocate, run_id)
+                      if is_adoptable(container, set([str(run_id)]))]
+
+def _remove(allocate, docker_id):
+    try:
+        with allocate() as docker:
+            docker.remove_container(docker_id, force=True)
+        return True
+    except (Timeout, APIError) as e:
+        logging.error('Orphan container "%s" could not be removed: %s.' % (docker_id, e))
+        return False
+
+def _mark_removed(session, docker_ids, chunk=500):
+    # SQLite limits the number of parameters of a statement
+    for position in range(0, len(docker_ids), chunk):
+        session.query(Container).filter(Container.docker_id.in_(docker_ids[position:position + chunk])). \
+                update({ 'phase': REMOVED }, synchronize_session=False)
+    session.commit()
+
+def remove_orphans(allocate, session, workers=5):
+    """
+    Removes in bulk the containers created by previous executions of the benchmark which cannot be
+    adopted by an unfinished run. Returns the number of containers removed.
+    """
+    resumable = get_resumable_run_ids(session)
+    orphans = [container['Id'] for container in list_labelled_containers(allocate)
+                                 if not is_adoptable(container, resumable)]
+    if not orphans:
+        return 0
+    pool = ThreadPool(workers)
+    try:
+        removed = pool.map(lambda docker_id: _remove(allocate, docker_id), orphans)
+    finally:
+        pool.close()
+        pool.join()
+    removed_ids = [docker_id for docker_id, done in zip(orphans, removed) if done]
+    _mark_removed(session, removed_ids)
+    logging.info('%d orphan containers removed.' % len(removed_ids))
+    return len(removed_ids)
+
+def discard_partial_run(session, run):
+    """
+    Deletes the rows written by an interrupted attempt of a run which was not measured
+    (e.g., its containers and the measures of the hosts which finished), so it can be run again.
+    """
+    container_ids = session.query(Container.id).filter(Container.run_id == run.id).subquery()
+    deleted = 0
+    # The rows which depend on others are deleted first
+    for table in reversed(Base.metadata.sorted_tables):
+        if 'container_id' in table.c:
+            session.execute(table.delete().where(table.c.container_id.in_(container_ids)))
+        elif 'run_id' in table.c:
+            deleted += session.execute(table.delete().where(table.c.run_id == run.id)).rowcount
+    run.phase = None
+    session.commit()
+    if deleted:
+        logging.info('%d rows of the interrupted run %d discarded.' % (deleted, run.id))
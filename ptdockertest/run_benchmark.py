@@ -8,9 +8,15 @@ import logging
 from argparse import ArgumentParser
 from datetime import datetime
 from config import configuration
-from docker_utils import DockerClientFactory
+from docker_utils import DockerClientFactory, AdaptiveLimiter, ApiCallLog
+from container_pool import ContainerPool
 from models import PerformanceTestDAO, Test, Run
+from arrivals import get_arrival_offsets
 from benchmark import TestRun
+from multihost import DockerHost, MultiHostTestRun
+from generate_plots import update_aggregates, update_missing_aggregates
+from confidence import SequentialStoppingRule
+from recovery import remove_orphans, discard_partial_run, MEASURED, REMOVED
 
 
 def create_run(session, test):
@@ -20,35 +26,114 @@ def create_run(session, test):
     session.commit()
     return run
 
-def make_execution(docker_factory, dao, session, db_test, db_run):
-    r = TestRun(docker_factory, db_test.number_of_containers,
-                db_test.image_id, db_test.volumes_from,
-                configuration.get_exposed_port(), configuration.get_jar_path())
+def make_execution(docker_factory, dao, session, db_test, db_run, container_pool=None, docker_hosts=None):
+    """
+    :param docker_hosts: if provided, the containers are distributed across these hosts
+                         (docker_factory and container_pool are ignored).
+    """
+    if db_run.phase in (MEASURED, REMOVED):
+        # Interrupted while its containers were removed (the remaining ones are removed by remove_orphans)
+        logging.info('Run %d was measured before being interrupted, so it is not repeated.' % db_run.id)
+        finish_run(session, db_run)
+        return
+    # Only the containers created (but not started) by an interrupted attempt are reused
+    discard_partial_run(session, db_run)
+    if container_pool is not None and not docker_hosts:
+        container_pool.prepare(db_test.image_id, db_test.volumes_from)
+    options = dict(creation_workers=configuration.get_creation_workers(),
+                   stream_stats=configuration.get_stream_stats(),
+                   stats_series_points=configuration.get_stats_series_points(),
+                   defer_writes=configuration.get_defer_writes(),
+                   container_pool=container_pool,
+                   response_sample=configuration.get_response_sample(),
+                   response_duration=configuration.get_response_duration(),
+                   response_concurrency=configuration.get_response_concurrency(),
+                   teardown_workers=configuration.get_teardown_workers(),
+                   idle_latency=configuration.get_idle_latency(),
+                   idle_timeout=configuration.get_idle_timeout(),
+                   disk_accounting=configuration.get_disk_accounting(),
+                   compare_du=configuration.get_compare_du(),
+                   disk_sampling_interval=configuration.get_disk_sampling_interval(),
+                   arrival_offsets=get_arrival_offsets(db_test.arrival_profile, db_test.number_of_containers),
+                   ramp_sampling_interval=configuration.get_ramp_sampling_interval(),
+                   stats_collector=configuration.get_stats_collector(),
+                   cgroup_root=configuration.get_cgroup_root(),
+                   cgroup_driver=configuration.get_cgroup_driver(),
+                   engine=configuration.get_engine(),
+                   engine_workers=configuration.get_engine_workers(),
+                   host_sampling_interval=configuration.get_host_sampling_interval(),
+                   proc_root=configuration.get_proc_root(),
+                   shared_memory=configuration.get_shared_memory(),
+                   docker_events=configuration.get_docker_events(),
+                   readiness=configuration.get_readiness(),
+                   readiness_marker=configuration.get_readiness_marker(),
+                   readiness_timeout=configuration.get_readiness_timeout())
+    if docker_hosts:
+        r = MultiHostTestRun(docker_hosts, db_test.number_of_containers,
+                             db_test.image_id, db_test.volumes_from,
+                             configuration.get_exposed_port(), configuration.get_jar_path(), **options)
+    else:
+        r = TestRun(docker_factory, db_test.number_of_containers,
+                    db_test.image_id, db_test.volumes_from,
+                    configuration.get_exposed_port(), configuration.get_jar_path(), **options)
     r.run(dao, db_run.id)
+    finish_run(session, db_run)
+
+def finish_run(session, db_run):
     db_run.ended = datetime.now()
     session.commit()
+    update_aggregates(session, [db_run.id])
     logging.info('Run finished.')
 
-def run_test(docker_factory, dao, session, test):
+def create_stopping_rule():
+    """Returns the rule which decides the runs of each test or None if they are fixed (see Test.repetitions)."""
+    if not configuration.get_adaptive_repetitions():
+        return None
+    return SequentialStoppingRule(configuration.get_confidence_metrics(),
+                                  configuration.get_confidence_width(),
+                                  configuration.get_min_repetitions(),
+                                  configuration.get_max_repetitions(),
+                                  configuration.get_confidence())
+
+def run_test(docker_factory, dao, session, test, container_pool=None, docker_hosts=None, stopping_rule=None):
     logging.info('Running test %d.' % test.id)
     repetitions = 0
     for run in test.runs:
         repetitions += 1
         if not run.ended:
-            make_execution(docker_factory, dao, session, test, run)
+            make_execution(docker_factory, dao, session, test, run, container_pool, docker_hosts)
         else:
             logging.info('Skipping already run test %d.' % test.id)
 
-    for _ in range(repetitions, test.repetitions):
-        logging.info('Create repetition with %d containers.' % test.number_of_containers)
-        run = create_run(session, test)
-        make_execution(docker_factory, dao, session, test, run)
+    if stopping_rule is not None:
+        # test.repetitions is ignored: the runs are added until the measures are precise enough
+        # The runs ended by previous versions have no aggregates
+        update_missing_aggregates(session)
+        while stopping_rule.needs_more_runs(session, test.id):
+            logging.info('Create repetition with %d containers (the measures are not precise enough).' % test.number_of_containers)
+            run = create_run(session, test)
+            make_execution(docker_factory, dao, session, test, run, container_pool, docker_hosts)
+    else:
+        for _ in range(repetitions, test.repetitions):
+            logging.info('Create repetition with %d containers.' % test.number_of_containers)
+            run = create_run(session, test)
+            make_execution(docker_factory, dao, session, test, run, container_pool, docker_hosts)
     logging.info('Finished test %d.' % test.id)
 
-def run_all(docker_factory, dao):
+def run_all(docker_factory, dao, container_pool=None, docker_hosts=None, stopping_rule=None):
     session = dao.get_session()
     for test in session.query(Test):
-        run_test(docker_factory, dao, session, test)
+        run_test(docker_factory, dao, session, test, container_pool, docker_hosts, stopping_rule)
+
+def create_docker_factory(url=None):
+    limiter = None
+    if configuration.get_adaptive_requests():
+        limiter = AdaptiveLimiter(configuration.get_simultaneous_requests(),
+                                  configuration.get_min_requests(), configuration.get_max_requests(),
+                                  configuration.get_target_latency())
+    call_log = ApiCallLog() if configuration.get_record_calls() else None
+    return DockerClientFactory(configuration.get_docker_url(url),
+                               configuration.get_simultaneous_requests(), limiter=limiter, call_log=call_log)
 
 def entry_point():
     parser = ArgumentParser(description='Run benchmark.')
@@ -56,6 +141,8 @@ def entry_point():
                             help='If a valid configuration file is provided, the priority will be: values in parameters,' + 
                             'values in the configuration file and the default values for parameters.')
     parser.add_argument('-docker', dest='url', help='Docker socket URL.')
+    parser.add_argument('-hosts', dest='hosts', help='Comma separated Docker URLs (with an optional "=capacity") ' +
+                            'to distribute the containers across several hosts.')
     parser.add_argument('-db', dest='database', help='Database file.')
     parser.add_argument('-log', dest='log', help='Log file.')
     parser.add_argument('-testId', default=False, dest='testId', help='Benchmark identifier.' +
@@ -66,16 +153,35 @@ def entry_point():
 
     FORMAT = '%(asctime)-15s %(message)s'
     logging.basicConfig(filename=configuration.get_log(args.log), level=logging.DEBUG, format=FORMAT)
+    # Created before running anything, so a wrong configuration does not stop the benchmark halfway
+    stopping_rule = create_stopping_rule()
 
-    dao = PerformanceTestDAO(configuration.get_db(args.database))
-    docker = DockerClientFactory(configuration.get_docker_url(args.url))
-
-    if not args.testId:
-        run_all(docker, dao)
+    dao = PerformanceTestDAO(configuration.get_db(args.database), wal=configuration.get_wal())
+    hosts = configuration.get_docker_hosts(args.hosts)
+    docker_hosts = None
+    if hosts:
+        docker_hosts = [DockerHost(url, capacity, create_docker_factory(url)) for url, capacity in hosts]
+        docker = docker_hosts[0].docker_factory
     else:
-        session = dao.get_session()
-        test = session.query(Test).get(args.testId)
-        run_test(docker, dao, test)
+        docker = create_docker_factory(args.url)
+    # Containers left by previous executions which were interrupted
+    session = dao.get_session()
+    for docker_factory in ([host.docker_factory for host in docker_hosts] if docker_hosts else [docker]):
+        remove_orphans(docker_factory.create(), session, configuration.get_teardown_workers())
+    # Pooled containers belong to a single Docker host
+    pool = None
+    if configuration.get_container_pool() and not docker_hosts:
+        pool = ContainerPool(docker, configuration.get_creation_workers())
+
+    try:
+        if not args.testId:
+            run_all(docker, dao, pool, docker_hosts, stopping_rule)
+        else:
+            test = session.query(Test).get(args.testId)
+            run_test(docker, dao, session, test, pool, docker_hosts, stopping_rule)
+    finally:
+        if pool is not None:
+            pool.clear()
 
 
 if __name__ == "__main__":
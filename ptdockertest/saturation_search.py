@@ -0,0 +1,177 @@
+"""
+Created on 18/10/2026
+@author: Aitor Gomez Goiri <aitor.gomez-goiri@open.ac.uk>
+Script to find the number of containers where a metric crosses a threshold.
+
+Instead of running a fixed ladder of tests (see prepare_benchmark.py), the number of containers grows
+exponentially until the threshold is crossed and then the interval found is bisected.
+The tests and runs measured are created on the fly.
+"""
+
+import logging
+from argparse import ArgumentParser
+from datetime import datetime
+from sqlalchemy import func
+from config import configuration
+from container_pool import ContainerPool
+from models import PerformanceTestDAO, Test, Container, CpuRequired, ResponseTime, ExecutionError, \
+                    SaturationSearch, SaturationStep
+from run_benchmark import create_docker_factory, create_stopping_rule, run_test
+from recovery import remove_orphans
+
+
+def get_response_time(session, run):
+    """Response time in ms. Runs which could not measure it count as infinitely slow."""
+    response_time = session.query(ResponseTime.time).filter(ResponseTime.run_id == run.id).scalar()
+    return float('inf') if response_time is None or response_time < 0 else response_time
+
+def get_cpu_percentage(session, run):
+    """CPU used by all the containers of the run."""
+    return session.query(func.coalesce(func.sum(CpuRequired.percentual_cpu), 0.0)). \
+                join(Container, Container.id == CpuRequired.container_id). \
+                filter(Container.run_id == run.id).scalar()
+
+def get_error_rate(session, run):
+    """Fraction of the containers which failed."""
+    errors = session.query(func.count(ExecutionError.id)). \
+                join(Container, Container.id == ExecutionError.container_id). \
+                filter(Container.run_id == run.id).scalar()
+    return errors / float(run.test.number_of_containers)
+
+METRICS = {
+    'response_time': get_response_time,
+    'cpu_percentage': get_cpu_percentage,
+    'error_rate': get_error_rate,
+}
+
+
+class SaturationSearcher(object):
+    """
+    It searches the number of containers where the metric crosses the threshold.
+
+    The search has two stages:
+     1. The number of containers is multiplied by the growth factor until the threshold is crossed
+        (or the maximum is reached).
+     2. The interval between the last size below the threshold and the first one above it is bisected
+        until it is narrower than the resolution.
+    """
+    def __init__(self, docker_factory, dao, image_id, volumes_from, metric, threshold,
+                 start=1, growth=2, maximum=1000, resolution=10, repetitions=1, container_pool=None,
+                 stopping_rule=None):
+        self.docker_factory = docker_factory
+        self.dao = dao
+        self.session = dao.get_session()
+        self.image_id = image_id
+        self.volumes_from = volumes_from
+        self.metric = metric
+        self._get_value = METRICS[metric]
+        self.threshold = threshold
+        self.start = start
+        self.growth = growth
+        self.maximum = maximum
+        self.resolution = resolution
+        self.repetitions = repetitions
+        self.container_pool = container_pool
+        self.stopping_rule = stopping_rule  # If provided, the repetitions are ignored
+        self.search = None
+
+    def measure(self, number_of_containers):
+        """Runs a new test with the given number of containers and returns the mean of the metric in its runs."""
+        test = Test(image_id=self.image_id, volumes_from=self.volumes_from,
+                    number_of_containers=number_of_containers, repetitions=self.repetitions)
+        self.session.add(test)
+        self.session.commit()
+        run_test(self.docker_factory, self.dao, self.session, test, self.container_pool,
+                 stopping_rule=self.stopping_rule)
+        values = [self._get_value(self.session, run) for run in test.runs]
+        value = sum(values) / len(values)
+        crossed = value > self.threshold
+        self.session.add(SaturationStep(search_id=self.search.id, test_id=test.id,
+                                        number_of_containers=number_of_containers, value=value, crossed=crossed))
+        self.session.commit()
+        logging.info('Saturation search: %s with %d containers is %s.' % (self.metric, number_of_containers, value))
+        return crossed
+
+    def run(self):
+        """Returns the most containers measured below the threshold and the fewest above it (or None)."""
+        self.search = SaturationSearch(image_id=self.image_id, volumes_from=self.volumes_from,
+                                       metric=self.metric, threshold=self.threshold)
+        self.session.add(self.search)
+        self.session.commit()
+
+        below, above = 0, None
+        size = self.start
+        while above is None:
+            if self.measure(size):
+                above = size
+            else:
+                below = size
+                if size >= self.maximum:
+                    logging.info('Saturation search: the threshold was not crossed with %d containers.' % size)
+                    break
+                size = min(max(int(size * self.growth), size + 1), self.maximum)
+
+        while above is not None and above - below > self.resolution:
+            size = (below + above) // 2
+            if self.measure(size):
+                above = size
+            else:
+                below = size
+
+        self.search.capacity = below
+        self.search.crossed_at = above
+        self.search.ended = datetime.now()
+        self.session.commit()
+        logging.info('Saturation search finished: capacity %d, crossed at %s.' % (below, above))
+        return below, above
+
+
+def entry_point():
+    parser = ArgumentParser(description='Find the number of containers where a metric crosses a threshold.')
+    parser.add_argument('-config', dest='config', default='../config.ini',
+                            help='If a valid configuration file is provided, the priority will be: values in parameters,' +
+                            'values in the configuration file and the default values for parameters.')
+    parser.add_argument('-docker', dest='url', help='Docker socket URL.')
+    parser.add_argument('-db', dest='database', help='Database file.')
+    parser.add_argument('-log', dest='log', help='Log file.')
+    parser.add_argument('-image', default='packettracer_xvfb_mount', dest='image_id', help='Docker image to run.')
+    parser.add_argument('-volumes', default='ptdata', dest='volumes_from', help='Containers whose volumes will be mounted.')
+    parser.add_argument('-metric', default='response_time', choices=sorted(METRICS.keys()), dest='metric',
+                            help='Metric compared with the threshold.')
+    parser.add_argument('-threshold', required=True, type=float, dest='threshold',
+                            help='Value of the metric considered saturation (ms, percentage or fraction of errors).')
+    parser.add_argument('-start', default=1, type=int, dest='start', help='Containers of the first test.')
+    parser.add_argument('-growth', default=2, type=float, dest='growth', help='Factor applied to the size of the tests until the threshold is crossed.')
+    parser.add_argument('-max', default=1000, type=int, dest='maximum', help='Maximum number of containers.')
+    parser.add_argument('-resolution', default=10, type=int, dest='resolution', help='Width of the interval where the search stops.')
+    parser.add_argument('-repetitions', default=1, type=int, dest='repetitions', help='Runs per test.')
+    args = parser.parse_args()
+
+    configuration.set_file_path(args.config)
+
+    FORMAT = '%(asctime)-15s %(message)s'
+    logging.basicConfig(filename=configuration.get_log(args.log), level=logging.DEBUG, format=FORMAT)
+    stopping_rule = create_stopping_rule()
+
+    dao = PerformanceTestDAO(configuration.get_db(args.database), wal=configuration.get_wal())
+    docker = create_docker_factory(args.url)
+    # Containers left by previous executions which were interrupted
+    remove_orphans(docker.create(), dao.get_session(), configuration.get_teardown_workers())
+    pool = ContainerPool(docker, configuration.get_creation_workers()) if configuration.get_container_pool() else None
+
+    try:
+        searcher = SaturationSearcher(docker, dao, args.image_id, args.volumes_from, args.metric, args.threshold,
+                                      args.start, args.growth, args.maximum, args.resolution, args.repetitions, pool,
+                                      stopping_rule)
+        capacity, crossed_at = searcher.run()
+        if crossed_at is None:
+            print "The threshold was not crossed with %d containers." % capacity
+        else:
+            print "Capacity: %d containers (the threshold was crossed with %d)." % (capacity, crossed_at)
+    finally:
+        if pool is not None:
+            pool.clear()
+
+
+if __name__ == "__main__":
+    entry_point()
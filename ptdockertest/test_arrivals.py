@@ -0,0 +1,53 @@
+"""
+Created on 18/10/2026
+@author: Aitor Gomez Goiri <aitor.gomez-goiri@open.ac.uk>
+"""
+
+import unittest
+from arrivals import parse_arrival_profile, get_arrival_offsets, BURST, FIXED_RATE, WAVES, POISSON
+
+
+class ParseArrivalProfileTest(unittest.TestCase):
+
+    def test_valid(self):
+        self.assertEqual(BURST, parse_arrival_profile('burst').kind)
+        profile = parse_arrival_profile('fixed:2.5')
+        self.assertEqual((FIXED_RATE, 2.5), (profile.kind, profile.rate))
+        profile = parse_arrival_profile('waves:10,30')
+        self.assertEqual((WAVES, 10, 30), (profile.kind, profile.wave_size, profile.wave_interval))
+        profile = parse_arrival_profile('poisson:4,7')
+        self.assertEqual((POISSON, 4, 7), (profile.kind, profile.rate, profile.seed))
+
+    def test_poisson_seed_stored(self):
+        self.assertIsNotNone(parse_arrival_profile('poisson:4').seed)
+
+    def test_invalid(self):
+        for description in ('', 'unknown', 'fixed', 'fixed:0', 'waves:10', 'waves:0,5', 'poisson:-1', 'fixed:x'):
+            self.assertRaises(ValueError, parse_arrival_profile, description)
+
+
+class GetArrivalOffsetsTest(unittest.TestCase):
+
+    def test_burst(self):
+        self.assertIsNone(get_arrival_offsets(None, 10))
+        self.assertIsNone(get_arrival_offsets(parse_arrival_profile('burst'), 10))
+
+    def test_fixed_rate(self):
+        self.assertEqual([0, 0.5, 1, 1.5], get_arrival_offsets(parse_arrival_profile('fixed:2'), 4))
+
+    def test_waves(self):
+        self.assertEqual([0, 0, 0, 30, 30, 30, 60], get_arrival_offsets(parse_arrival_profile('waves:3,30'), 7))
+
+    def test_poisson(self):
+        profile = parse_arrival_profile('poisson:5,42')
+        offsets = get_arrival_offsets(profile, 2000)
+        self.assertEqual(0, offsets[0])
+        self.assertEqual(sorted(offsets), offsets)
+        # Exponential intervals with mean 1/rate
+        self.assertAlmostEqual(0.2, offsets[-1] / (len(offsets) - 1), delta=0.02)
+        # All the runs of a test share the same arrivals
+        self.assertEqual(offsets, get_arrival_offsets(profile, 2000))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,62 @@
+"""
+Created on 18/10/2026
+@author: Aitor Gomez Goiri <aitor.gomez-goiri@open.ac.uk>
+"""
+
+import math
+import unittest
+from confidence import normal_quantile, t_quantile, confidence_interval, SequentialStoppingRule
+
+
+# 97.5% quantiles of Student's t distribution (two-sided 95%) per degrees of freedom
+T_TABLE = {1: 12.7062, 2: 4.3027, 3: 3.1824, 4: 2.7764, 5: 2.5706, 9: 2.2622, 19: 2.0930, 29: 2.0452, 120: 1.9799}
+
+
+class QuantileTest(unittest.TestCase):
+
+    def test_normal_quantile(self):
+        self.assertAlmostEqual(0.0, normal_quantile(0.5))
+        self.assertAlmostEqual(1.959964, normal_quantile(0.975), places=6)
+        self.assertAlmostEqual(-2.326348, normal_quantile(0.01), places=6)  # Lower tail
+        self.assertAlmostEqual(3.090232, normal_quantile(0.999), places=6)  # Upper tail
+
+    def test_t_quantile_table(self):
+        for degrees_of_freedom, expected in T_TABLE.items():
+            # The expansion is less precise with few degrees of freedom
+            tolerance = 0.0001 if degrees_of_freedom <= 2 else 0.005
+            self.assertLess(abs(expected - t_quantile(0.975, degrees_of_freedom)), tolerance, degrees_of_freedom)
+
+    def test_t_quantile_symmetric(self):
+        for degrees_of_freedom in (1, 2, 3, 10):
+            self.assertAlmostEqual(-t_quantile(0.9, degrees_of_freedom), t_quantile(0.1, degrees_of_freedom))
+            self.assertAlmostEqual(0.0, t_quantile(0.5, degrees_of_freedom))
+
+    def test_t_quantile_tends_to_normal(self):
+        self.assertAlmostEqual(normal_quantile(0.975), t_quantile(0.975, 100000), places=4)
+
+
+class ConfidenceIntervalTest(unittest.TestCase):
+
+    def test_interval(self):
+        mean, lower, upper = confidence_interval([10, 12, 14, float('nan')])
+        self.assertAlmostEqual(12.0, mean)
+        half_width = T_TABLE[2] * 2 / math.sqrt(3)
+        self.assertAlmostEqual(12.0 - half_width, lower, places=3)
+        self.assertAlmostEqual(12.0 + half_width, upper, places=3)
+
+    def test_too_few_values(self):
+        mean, lower, upper = confidence_interval([5])
+        self.assertEqual(5.0, mean)
+        self.assertTrue(math.isnan(lower) and math.isnan(upper))
+        self.assertTrue(all(math.isnan(value) for value in confidence_interval([])))
+
+
+class SequentialStoppingRuleTest(unittest.TestCase):
+
+    def test_unknown_metric(self):
+        SequentialStoppingRule(['response', 'cpu_percentage'], 0.1)
+        self.assertRaises(ValueError, SequentialStoppingRule, ['response', 'cpu_percent'], 0.1)
+
+
+if __name__ == '__main__':
+    unittest.main()
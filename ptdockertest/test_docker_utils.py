@@ -0,0 +1,102 @@
+"""
+Created on 18/10/2026
+@author: Aitor Gomez Goiri <aitor.gomez-goiri@open.ac.uk>
+"""
+
+import time
+import unittest
+from threading import Thread
+from requests.exceptions import Timeout
+from docker_utils import AdaptiveLimiter, LatencyProbe
+
+
+class AdaptiveLimiterTest(unittest.TestCase):
+
+    def call(self, limiter, latency=0.1, timed_out=False, started=None):
+        limiter.acquire()
+        limiter.release([(time.time() if started is None else started, latency, timed_out)])
+
+    def test_additive_increase(self):
+        limiter = AdaptiveLimiter(initial=2, target_latency=1.0)
+        self.call(limiter)
+        self.assertEqual(2, limiter.limit)
+        self.call(limiter)  # As many fast requests as the limit
+        self.assertEqual(3, limiter.limit)
+        for _ in range(3):
+            self.call(limiter)
+        self.assertEqual(4, limiter.limit)
+        self.assertEqual(['fast', 'fast'], [reason for _, _, _, reason in limiter.get_decisions()])
+
+    def test_multiplicative_decrease(self):
+        limiter = AdaptiveLimiter(initial=8, backoff=0.5)
+        self.call(limiter, latency=2.0)
+        self.assertEqual(4, limiter.limit)
+        time.sleep(0.01)  # Started after the last decrease
+        self.call(limiter, timed_out=True)
+        self.assertEqual(2, limiter.limit)
+        self.assertEqual([(4, 2.0, 'slow'), (2, 0.1, 'timeout')],
+                         [decision[1:] for decision in limiter.get_decisions()])
+
+    def test_requests_in_flight_decrease_once(self):
+        limiter = AdaptiveLimiter(initial=8, backoff=0.5)
+        started = time.time() - 2
+        # Several slow requests which were already in flight when the limit was decreased
+        for _ in range(3):
+            self.call(limiter, latency=2.0, started=started)
+        self.assertEqual(4, limiter.limit)
+
+    def test_bounds(self):
+        limiter = AdaptiveLimiter(initial=2, minimum=2, maximum=3)
+        for _ in range(10):
+            self.call(limiter)
+        self.assertEqual(3, limiter.limit)
+        self.call(limiter, latency=2.0)
+        self.assertEqual(2, limiter.limit)
+
+    def test_other_calls_ignored(self):
+        limiter = AdaptiveLimiter(initial=2)
+        for _ in range(10):
+            limiter.acquire()
+            limiter.release()
+        self.assertEqual(2, limiter.limit)
+
+    def test_acquire_blocks_at_limit(self):
+        limiter = AdaptiveLimiter(initial=1, minimum=1, maximum=1)
+        limiter.acquire()
+        acquired = []
+        thread = Thread(target=lambda: acquired.append(limiter.acquire()))
+        thread.daemon = True
+        thread.start()
+        thread.join(0.2)
+        self.assertEqual([], acquired)
+        limiter.release()
+        thread.join(1)
+        self.assertEqual(1, len(acquired))
+        self.assertEqual(1, limiter.in_flight)
+
+
+class FakeClient(object):
+
+    def containers(self, **kwargs):
+        return []
+
+    def start(self, container):
+        raise Timeout()
+
+    def stats(self, container):
+        return {}
+
+
+class LatencyProbeTest(unittest.TestCase):
+
+    def test_control_operations_timed(self):
+        probe = LatencyProbe(FakeClient())
+        probe.containers(all=True)
+        probe.stats('c1')
+        probe.containers(all=True, size=True)  # Slow on purpose
+        self.assertRaises(Timeout, probe.start, 'c1')
+        self.assertEqual([False, True], [timed_out for _, _, timed_out in probe.calls])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,70 @@
+"""
+Created on 18/10/2026
+@author: Aitor Gomez Goiri <aitor.gomez-goiri@open.ac.uk>
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+from docker_utils import DockerClientFactory, ApiCallLog
+from fake_docker import FakeDocker, FakeDockerDaemon
+from models import PerformanceTestDAO, Test, Run, Container, ApiCall
+from benchmark import TestRun, ENGINES
+
+
+class FakeDockerRunTest(unittest.TestCase):
+    """Runs small tests against a simulated Docker daemon."""
+    number_of_containers = 3
+
+    def setUp(self):
+        self.working_dir = tempfile.mkdtemp(prefix='test-fake-docker-')
+        self.docker = FakeDocker()
+        self.daemon = FakeDockerDaemon(os.path.join(self.working_dir, 'docker.sock'), self.docker).start()
+        self.dao = PerformanceTestDAO(os.path.join(self.working_dir, 'test.db'))
+        self.session = self.dao.get_session()
+
+    def tearDown(self):
+        self.session.close()
+        self.daemon.stop()
+        shutil.rmtree(self.working_dir)
+
+    def run_test(self, engine):
+        test = Test(image_id='fake', number_of_containers=self.number_of_containers, repetitions=1)
+        self.session.add(test)
+        self.session.commit()
+        run = Run(test_id=test.id)
+        self.session.add(run)
+        self.session.commit()
+        docker_factory = DockerClientFactory(self.daemon.get_url(), call_log=ApiCallLog())
+        test_run = TestRun(docker_factory, self.number_of_containers, 'fake', None, 4000, None,
+                           engine=engine, min_running_time=1, measure_response=False)
+        test_run.run(self.dao, run.id)
+        self.session.expire_all()
+        return run.id
+
+    def test_engines(self):
+        for engine in ENGINES:
+            run_id = self.run_test(engine)
+            containers = self.session.query(Container).filter_by(run_id=run_id).all()
+            self.assertEqual(self.number_of_containers, len(containers), engine)
+            for container in containers:
+                self.assertIsNone(container.error, engine)
+                self.assertGreater(container.cpu.total_cpu, 0, engine)
+                self.assertGreaterEqual(container.cpu.percentual_cpu, 0, engine)
+                self.assertGreater(container.memory.usage, 0, engine)
+                self.assertGreaterEqual(container.memory.maximum, container.memory.usage, engine)
+                self.assertAlmostEqual(container.memory.usage * 100.0 / self.docker.memory_limit,
+                                       container.memory.percentual, msg=engine)
+
+            calls = self.session.query(ApiCall).filter_by(run_id=run_id).all()
+            operations = [call.operation for call in calls]
+            for operation in ('create_container', 'start', 'stop', 'remove_container'):
+                self.assertEqual(self.number_of_containers, operations.count(operation), (engine, operation))
+            self.assertTrue(all(call.outcome == 'ok' for call in calls), engine)
+        # All the containers were removed
+        self.assertEqual({}, self.docker.containers)
+
+
+if __name__ == '__main__':
+    unittest.main()
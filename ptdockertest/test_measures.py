@@ -0,0 +1,245 @@
+"""
+Created on 18/10/2026
+@author: Aitor Gomez Goiri <aitor.gomez-goiri@open.ac.uk>
+"""
+
+import os
+import math
+import random
+import shutil
+import tempfile
+import unittest
+from measures import CgroupStatsCollector, CgroupContainerMeter, LatencyHistogram, TimeSeries
+
+
+HOST_MEMORY = 16 * 1024 ** 3
+CPUS = 4
+V1_UNLIMITED = 9223372036854771712  # What memory.limit_in_bytes contains if there is no limit
+
+
+class CgroupTree(object):
+    """Fake cgroup and proc trees in a temporary directory."""
+
+    def __init__(self, unified, driver):
+        self.directory = tempfile.mkdtemp(prefix='test-cgroup-')
+        self.root = os.path.join(self.directory, 'cgroup')
+        self.proc_root = os.path.join(self.directory, 'proc')
+        self.unified = unified
+        self.driver = driver
+        self._clock_ticks = os.sysconf('SC_CLK_TCK')
+        os.makedirs(self.root)
+        os.makedirs(self.proc_root)
+        if unified:
+            self._write(self.root, 'cgroup.controllers', 'cpu io memory')
+        self._write(self.proc_root, 'meminfo', 'MemTotal: %d kB\nMemFree: 1024 kB' % (HOST_MEMORY // 1024))
+        self.set_system_cpu(0)
+
+    def remove(self):
+        shutil.rmtree(self.directory)
+
+    def _write(self, directory, name, content):
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        with open(os.path.join(directory, name), 'w') as f:
+            f.write(content + '\n')
+
+    def set_system_cpu(self, nanoseconds):
+        """Sets the CPU time of the host (all of it in the user field)."""
+        ticks = nanoseconds * self._clock_ticks // 1000000000
+        lines = ['cpu  %d 0 0 0 0 0 0 0 0 0' % ticks]
+        lines += ['cpu%d 0 0 0 0 0 0 0 0 0 0' % n for n in range(CPUS)]
+        self._write(self.proc_root, 'stat', '\n'.join(lines))
+
+    def set_container(self, container_id, cpu, usage, max_usage, limit=None):
+        """:param cpu: CPU time in nanoseconds (multiple of 1000 for cgroup v2)."""
+        group = CgroupStatsCollector.GROUPS[self.driver] % container_id
+        if self.unified:
+            directory = os.path.join(self.root, group)
+            self._write(directory, 'cpu.stat', 'usage_usec %d\nuser_usec %d\nsystem_usec 0' % (cpu // 1000, cpu // 1000))
+            self._write(directory, 'memory.current', str(usage))
+            self._write(directory, 'memory.peak', str(max_usage))
+            self._write(directory, 'memory.max', 'max' if limit is None else str(limit))
+            self._write(directory, 'io.stat', '8:0 rbytes=4096 wbytes=1024 rios=1 wios=1')
+        else:
+            cpuacct = os.path.join(self.root, 'cpuacct', group)
+            self._write(cpuacct, 'cpuacct.usage', str(cpu))
+            self._write(cpuacct, 'cpuacct.usage_percpu', ' '.join([str(cpu // CPUS)] * CPUS))
+            memory = os.path.join(self.root, 'memory', group)
+            self._write(memory, 'memory.usage_in_bytes', str(usage))
+            self._write(memory, 'memory.max_usage_in_bytes', str(max_usage))
+            self._write(memory, 'memory.limit_in_bytes', str(V1_UNLIMITED if limit is None else limit))
+            self._write(os.path.join(self.root, 'blkio', group), 'blkio.throttle.io_service_bytes',
+                        '8:0 Read 4096\n8:0 Write 1024\n8:0 Total 5120\nTotal 5120')
+
+    def create_collector(self):
+        # Without reusing passes, so each measure reads the tree again
+        return CgroupStatsCollector(self.root, self.driver, self.proc_root, max_age=-1)
+
+
+class CgroupStatsCollectorTest(unittest.TestCase):
+    TREES = [(unified, driver) for unified in (False, True) for driver in ('cgroupfs', 'systemd')]
+
+    def for_each_tree(self, check):
+        for unified, driver in CgroupStatsCollectorTest.TREES:
+            tree = CgroupTree(unified, driver)
+            try:
+                check(tree, 'v%d %s' % (2 if unified else 1, driver))
+            finally:
+                tree.remove()
+
+    def test_version_detection(self):
+        def check(tree, label):
+            self.assertEqual(tree.unified, tree.create_collector().unified, label)
+        self.for_each_tree(check)
+
+    def test_cpu_percent(self):
+        def check(tree, label):
+            collector = tree.create_collector()
+            collector.register('c1')
+            meter = CgroupContainerMeter('c1', collector)
+            tree.set_system_cpu(10 ** 10)
+            tree.set_container('c1', 10 ** 9, 100, 100)
+            meter.initial_measure()
+            # A CPU out of the 4 of the host during the interval (100%, like Docker)
+            tree.set_system_cpu(2 * 10 ** 10)
+            tree.set_container('c1', 10 ** 9 + 2500000000, 100, 100)
+            meter.final_measure()
+            self.assertEqual(10 ** 9 + 2500000000, meter.get_cpu_total(), label)
+            self.assertAlmostEqual(100.0, meter.get_cpu_percent(), msg=label)
+        self.for_each_tree(check)
+
+    def test_memory_usage(self):
+        def check(tree, label):
+            collector = tree.create_collector()
+            collector.register('c1')
+            tree.set_container('c1', 0, 256 * 1024 ** 2, 300 * 1024 ** 2, limit=1024 ** 3)
+            meter = CgroupContainerMeter('c1', collector)
+            meter.final_measure()
+            self.assertEqual(256 * 1024 ** 2, meter.get_memory_usage(), label)
+            self.assertEqual(300 * 1024 ** 2, meter.get_memory_maximum(), label)
+            self.assertAlmostEqual(25.0, meter.get_memory_percent(), msg=label)
+            io = collector.get_stats('c1')['blkio_stats']['io_service_bytes_recursive']
+            self.assertEqual([{'op': 'Read', 'value': 4096}, {'op': 'Write', 'value': 1024}], io, label)
+        self.for_each_tree(check)
+
+    def test_limit_capped_to_host_memory(self):
+        def check(tree, label):
+            collector = tree.create_collector()
+            for container_id, limit in (('unlimited', None), ('over', 2 * HOST_MEMORY), ('limited', 1024 ** 3)):
+                tree.set_container(container_id, 0, 1024, 1024, limit=limit)
+                collector.register(container_id)
+            snapshot = collector.collect()
+            self.assertEqual(HOST_MEMORY, snapshot['unlimited']['memory_stats']['limit'], label)
+            self.assertEqual(HOST_MEMORY, snapshot['over']['memory_stats']['limit'], label)
+            self.assertEqual(1024 ** 3, snapshot['limited']['memory_stats']['limit'], label)
+        self.for_each_tree(check)
+
+    def test_missing_container(self):
+        def check(tree, label):
+            collector = tree.create_collector()
+            tree.set_container('running', 0, 1024, 1024)
+            collector.register('running')
+            collector.register('stopped')
+            # The containers which are not running are ignored when all of them are read...
+            self.assertEqual(['running'], list(collector.collect()), label)
+            # ...but measuring one of them fails
+            self.assertRaises(IOError, collector.get_stats, 'stopped')
+        self.for_each_tree(check)
+
+    def test_unknown_driver(self):
+        self.assertRaises(ValueError, CgroupStatsCollector, driver='unknown')
+
+
+class LatencyHistogramTest(unittest.TestCase):
+
+    def nearest_rank(self, values, percentile):
+        values = sorted(values)
+        return values[max(1, int(math.ceil(percentile / 100.0 * len(values)))) - 1]
+
+    def test_empty(self):
+        histogram = LatencyHistogram()
+        self.assertIsNone(histogram.mean())
+        self.assertIsNone(histogram.percentile(50))
+
+    def test_small_values_are_exact(self):
+        histogram = LatencyHistogram()
+        values = range(128)
+        for value in values:
+            histogram.record(value)
+        for percentile in (1, 25, 50, 90, 99):
+            self.assertEqual(self.nearest_rank(values, percentile), histogram.percentile(percentile))
+        self.assertEqual(sum(values) / 128.0, histogram.mean())
+
+    def test_relative_error_bounded(self):
+        random.seed(1)
+        values = [int(random.lognormvariate(8, 2)) + 1 for _ in range(5000)]
+        histogram = LatencyHistogram()
+        for value in values:
+            histogram.record(value)
+        self.assertEqual(len(values), histogram.total)
+        self.assertEqual(min(values), histogram.minimum)
+        self.assertEqual(max(values), histogram.maximum)
+        self.assertAlmostEqual(sum(values) / float(len(values)), histogram.mean())
+        for percentile in (50, 90, 95, 99, 99.9):
+            expected = self.nearest_rank(values, percentile)
+            self.assertLessEqual(abs(histogram.percentile(percentile) - expected), expected / 64.0, percentile)
+        self.assertEqual(max(values), histogram.percentile(100))
+
+    def test_merge(self):
+        values = [3, 70, 250, 1000, 12345, 500000]
+        merged, whole = LatencyHistogram(), LatencyHistogram()
+        for value in values:
+            histogram = LatencyHistogram()
+            histogram.record(value)
+            merged.merge(histogram)
+            whole.record(value)
+        merged.merge(LatencyHistogram())  # Empty ones do not change anything
+        self.assertEqual((whole.total, whole.minimum, whole.maximum, whole.mean()),
+                         (merged.total, merged.minimum, merged.maximum, merged.mean()))
+        for percentile in (10, 50, 90, 100):
+            self.assertEqual(whole.percentile(percentile), merged.percentile(percentile))
+
+
+class TimeSeriesTest(unittest.TestCase):
+
+    def create_series(self, samples, capacity=4):
+        series = TimeSeries(capacity)
+        for n in range(samples):
+            series.append(n, n * 10.0)
+        return series
+
+    def test_empty(self):
+        series = TimeSeries(4)
+        self.assertEqual([], series.downsample(10))
+        self.assertEqual([None] * 3, series.percentiles())
+
+    def test_not_full(self):
+        series = self.create_series(3)
+        self.assertEqual([(0, 0), (1, 10), (2, 20)], series.downsample(10))
+
+    def test_compaction_averages_pairs(self):
+        series = self.create_series(8)
+        self.assertEqual([(0.5, 5), (2.5, 25), (4.5, 45), (6.5, 65)], series.downsample(4))
+        series = self.create_series(9)
+        # The last position only has one of the four samples that it will aggregate
+        self.assertEqual([(1.5, 15), (5.5, 55), (8, 80)], series.downsample(4))
+
+    def test_whole_run_covered(self):
+        series = self.create_series(1000, capacity=16)
+        points = series.downsample(16)
+        self.assertLessEqual(len(points), 16)
+        self.assertLess(points[0][0], 64)
+        self.assertGreater(points[-1][0], 1000 - 64)
+        self.assertEqual(1000, series.samples)
+
+    def test_extremes_kept(self):
+        series = TimeSeries(4)
+        for n, value in enumerate([5, 5, 1000, 5, 5, -3, 5, 5, 5]):
+            series.append(n, value)
+        self.assertEqual(1000, series.maximum)
+        self.assertEqual(-3, series.minimum)
+        self.assertLess(max(value for _, value in series.downsample(4)), 1000)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,22 @@
+"""
+Created on 18/10/2026
+@author: Aitor Gomez Goiri <aitor.gomez-goiri@open.ac.uk>
+"""
+
+import unittest
+from multihost import split_arrival_offsets
+
+
+class SplitArrivalOffsetsTest(unittest.TestCase):
+
+    def test_last_arrival_goes_to_first_host(self):
+        self.assertEqual([[1, 3], [0, 2]], split_arrival_offsets([0, 1, 2, 3], [2, 2]))
+        for counts in ([1, 1], [3, 1], [1, 3], [2, 2, 2], [5, 3, 1]):
+            offsets = range(sum(counts))
+            per_host = split_arrival_offsets(offsets, counts)
+            self.assertEqual(max(offsets), per_host[0][-1])
+            self.assertEqual(counts, [len(host_offsets) for host_offsets in per_host])
+
+
+if __name__ == '__main__':
+    unittest.main()
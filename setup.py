@@ -31,6 +31,10 @@ setup(name="ptdockertest",
             "prepare-benchmark = ptdockertest.prepare_benchmark:entry_point",
             "run-benchmark = ptdockertest.run_benchmark:entry_point",
             "generate-plots = ptdockertest.generate_plots:entry_point",
+            "export-columns = ptdockertest.export_columns:entry_point",
+            "fake-docker = ptdockertest.fake_docker:entry_point",
+            "benchmark-harness = ptdockertest.benchmark_harness:entry_point",
+            "saturation-search = ptdockertest.saturation_search:entry_point",
           ],
       },
 )